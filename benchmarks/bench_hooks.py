@@ -0,0 +1,115 @@
+"""Benchmarks for hook resolution and task context."""
+
+import os
+import shutil
+import sys
+import tempfile
+
+from harness import benchmark
+
+from pubtools._impl import epcache, hookstats
+from pubtools._impl.mallopt import set_mallopt_tunables_safe
+from pubtools._impl.pluggy import resolve_hooks
+from pubtools.pluggy import pm, task_context
+
+
+def make_site(path, count):
+    # Creates a directory with synthetic distributions providing `count`
+    # pubtools console_scripts entry points in total, spread over
+    # distributions of 10 entry points each.
+    os.makedirs(path)
+    for dist_idx in range(0, count, 10):
+        dist = "pubtools-bench-%s" % dist_idx
+        info = os.path.join(path, "%s-1.0.dist-info" % dist.replace("-", "_"))
+        os.makedirs(info)
+        with open(os.path.join(info, "METADATA"), "wt") as f:
+            f.write("Metadata-Version: 2.1\nName: %s\nVersion: 1.0\n" % dist)
+
+        lines = ["[console_scripts]"]
+        for idx in range(dist_idx, min(count, dist_idx + 10)):
+            module = "pubtools_bench_%s" % idx
+            lines.append("%s-task = %s:main" % (module, module))
+            with open(os.path.join(path, module + ".py"), "wt") as f:
+                f.write("def main():\n    pass\n")
+        with open(os.path.join(info, "entry_points.txt"), "wt") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+@benchmark
+def bench_resolve_hooks(recorder):
+    sizes = [10, 100] if recorder.quick else [10, 100, 1000]
+    tmpdir = tempfile.mkdtemp(prefix="pubtools-bench-")
+    old_path = list(sys.path)
+    old_cache = os.environ.get("PUBTOOLS_ENTRY_POINTS_CACHE")
+
+    try:
+        for size in sizes:
+            site = os.path.join(tmpdir, "site-%s" % size)
+            make_site(site, size)
+            sys.path[:] = [site] + old_path
+
+            # Full scan of installed distributions, as if there were no index
+            os.environ["PUBTOOLS_ENTRY_POINTS_CACHE"] = ""
+
+            def scan():
+                epcache.clear()
+                resolve_hooks()
+
+            recorder.measure("resolve_hooks.scan", scan, entry_points=size)
+
+            # Index is valid on disk, but not yet loaded (new process)
+            os.environ["PUBTOOLS_ENTRY_POINTS_CACHE"] = os.path.join(
+                tmpdir, "index-%s.json" % size
+            )
+            recorder.measure("resolve_hooks.index", scan, entry_points=size)
+
+            # Index is memoized in-process (later task in the same process)
+            resolve_hooks()
+            recorder.measure("resolve_hooks.memo", resolve_hooks, entry_points=size)
+    finally:
+        sys.path[:] = old_path
+        if old_cache is None:
+            os.environ.pop("PUBTOOLS_ENTRY_POINTS_CACHE", None)
+        else:
+            os.environ["PUBTOOLS_ENTRY_POINTS_CACHE"] = old_cache
+        epcache.clear()
+        shutil.rmtree(tmpdir)
+
+
+@benchmark
+def bench_task_context(recorder):
+    def run_task():
+        with task_context():
+            pass
+
+    run_task()
+    recorder.measure("task_context", run_task)
+
+
+@benchmark
+def bench_hook_stats(recorder):
+    def call_hook():
+        pm.hook.task_stop(failed=False)
+
+    recorder.measure("hook_call", call_hook, hook_stats=False)
+
+    hookstats.install(pm)
+    try:
+        recorder.measure("hook_call", call_hook, hook_stats=True)
+    finally:
+        hookstats.uninstall()
+
+
+@benchmark
+def bench_mallopt(recorder):
+    recorder.measure("set_mallopt_tunables_safe", set_mallopt_tunables_safe, tuned=0)
+
+    os.environ["MALLOC_ARENA_MAX"] = "8"
+    os.environ["MALLOC_TRIM_THRESHOLD_"] = str(128 * 1024)
+    try:
+        recorder.measure(
+            "set_mallopt_tunables_safe", set_mallopt_tunables_safe, tuned=2
+        )
+    finally:
+        del os.environ["MALLOC_ARENA_MAX"]
+        del os.environ["MALLOC_TRIM_THRESHOLD_"]
@@ -0,0 +1,53 @@
+"""Benchmarks for the startup cost of pubtools modules.
+
+Each measurement runs a new interpreter, since imports are only slow once.
+"""
+
+import os
+import subprocess
+import sys
+
+from harness import benchmark
+
+# Prints the peak RSS of the interpreter, in KiB, after running a snippet.
+# (ru_maxrss would include the parent's peak RSS, as it survives exec on Linux.)
+RSS = """
+for line in open("/proc/self/status"):
+    if line.startswith("VmHWM:"):
+        print(line.split()[1])
+"""
+
+SNIPPETS = [
+    ("startup.python", "pass"),
+    ("startup.import_tracing", "import pubtools.tracing"),
+    (
+        "startup.get_trace_wrapper",
+        "import pubtools.tracing; pubtools.tracing.get_trace_wrapper()",
+    ),
+]
+
+
+def run_python(code, env):
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+
+
+@benchmark
+def bench_startup(recorder):
+    for tracing in ["false", "true"]:
+        env = dict(os.environ, OTEL_TRACING=tracing)
+        # With tracing enabled, spans would go to the console exporter by default.
+        env.setdefault("OTEL_SERVICE_NAME", "pubtools-bench")
+        for name, code in SNIPPETS:
+            if name == "startup.python" and tracing == "true":
+                continue
+            recorder.measure(
+                name, lambda: run_python(code, env), number=1, tracing=tracing
+            )
+            rss = int(run_python("%s\n%s" % (code, RSS), env))
+            recorder.record(name + ".rss", rss, "KiB", tracing=tracing)
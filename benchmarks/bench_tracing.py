@@ -0,0 +1,104 @@
+"""Benchmarks for the tracing wrapper."""
+
+import os
+
+from harness import benchmark
+
+from pubtools.pluggy import hookimpl, pm
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+except ImportError:  # pragma: no cover
+    trace = None
+
+
+class CountingExporter(SpanExporter if trace else object):
+    # Like the fake exporter used in tests, but only counts spans.
+
+    def __init__(self):
+        self.count = 0
+
+    def export(self, spans):
+        self.count += len(spans)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+class ExporterPlugin(object):
+    def __init__(self):
+        self.exporter = CountingExporter()
+
+    @hookimpl
+    def otel_exporter(self):
+        return self.exporter
+
+
+def instrumented_funcs(tw):
+    @tw.instrument_func()
+    def plain(x):
+        return x
+
+    @tw.instrument_func(args_to_attr=True)
+    def with_args(items, label=None):
+        return items
+
+    return plain, with_args
+
+
+def measure_instrument_func(recorder, tw, tracing):
+    plain, with_args = instrumented_funcs(tw)
+    big_args = [{"id": i, "name": "item-%s" % i} for i in range(1000)]
+
+    recorder.measure("instrument_func.plain", lambda: plain(1), tracing=tracing)
+    recorder.measure(
+        "instrument_func.args_to_attr",
+        lambda: with_args(big_args, label="x"),
+        tracing=tracing,
+        arg_items=len(big_args),
+    )
+
+
+@benchmark
+def bench_tracing(recorder):
+    # Tracing must be measured disabled before enabled, since it can't be
+    # disabled once the tracer provider has been set up.
+    if trace is None:
+        return
+
+    from pubtools._impl.tracing import TracingWrapper, get_trace_wrapper
+
+    def bare(x):
+        return x
+
+    recorder.measure("instrument_func.bare", lambda: bare(1))
+
+    os.environ["OTEL_TRACING"] = "false"
+    measure_instrument_func(recorder, TracingWrapper(), tracing="disabled")
+
+    plugin = ExporterPlugin()
+    pm.register(plugin)
+    os.environ["OTEL_TRACING"] = "true"
+    os.environ.setdefault("OTEL_SERVICE_NAME", "pubtools-bench")
+    try:
+        tw = get_trace_wrapper()
+        tw._reset()
+        measure_instrument_func(recorder, tw, tracing="enabled")
+        tw.force_flush()
+
+        tracer = trace.get_tracer(__name__)
+        batch = 1000
+
+        def export_spans():
+            for _ in range(batch):
+                tracer.start_span("bench").end()
+            tw.force_flush()
+
+        recorder.measure(
+            "span_export", export_spans, number=1, unit_per_call=batch, spans=batch
+        )
+    finally:
+        del os.environ["OTEL_TRACING"]
+        pm.unregister(plugin)
@@ -0,0 +1,79 @@
+"""Minimal harness for pubtools benchmarks.
+
+Benchmarks are plain functions registered with the :func:`benchmark` decorator.
+Each benchmark function receives a :class:`Recorder` and uses it to measure
+one or more callables.
+"""
+
+import statistics
+import timeit
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """Register a benchmark function."""
+    BENCHMARKS.append(func)
+    return func
+
+
+class Recorder(object):
+    """Measures callables and collects results.
+
+    :param quick: If true, take fewer samples for a faster (noisier) run.
+    """
+
+    def __init__(self, quick=False):
+        self.quick = quick
+        self.results = []
+
+    def measure(self, name, func, number=None, unit_per_call=1, **params):
+        """Measure the time taken per call of ``func``.
+
+        :param name: Name of the measurement.
+        :param func: A callable taking no arguments.
+        :param number: Calls per sample; determined automatically if omitted.
+        :param unit_per_call: Number of operations done by each call of func,
+                              e.g. spans exported; used to calculate time per
+                              operation.
+        :param params: Parameters of the measurement, recorded with the result.
+        """
+        timer = timeit.Timer(func)
+        if number is None:
+            number, _ = timer.autorange()
+            if self.quick:
+                number = max(1, number // 10)
+        repeat = 3 if self.quick else 7
+
+        samples = [t / number / unit_per_call for t in timer.repeat(repeat, number)]
+        result = {
+            "name": name,
+            "params": params,
+            "unit": "s",
+            "number": number,
+            "repeat": repeat,
+            "min": min(samples),
+            "median": statistics.median(samples),
+            "max": max(samples),
+        }
+        self.results.append(result)
+        return result
+
+    def record(self, name, value, unit, **params):
+        """Record a measurement taken by the benchmark itself.
+
+        :param name: Name of the measurement.
+        :param value: The measured value.
+        :param unit: Unit of the value, e.g. ``"KiB"``.
+        :param params: Parameters of the measurement, recorded with the result.
+        """
+        result = {
+            "name": name,
+            "params": params,
+            "unit": unit,
+            "min": value,
+            "median": value,
+            "max": value,
+        }
+        self.results.append(result)
+        return result
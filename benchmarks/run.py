@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Run pubtools benchmarks.
+
+Results are written as JSON, suitable for comparing between releases:
+
+    python benchmarks/run.py --output new.json --compare old.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+
+import bench_hooks  # noqa: F401 pylint: disable=unused-import
+import bench_startup  # noqa: F401 pylint: disable=unused-import
+import bench_tracing  # noqa: F401 pylint: disable=unused-import
+from harness import BENCHMARKS, Recorder
+
+
+def result_key(result):
+    return (result["name"], json.dumps(result["params"], sort_keys=True))
+
+
+def compare(results, baseline):
+    # Print the ratio of each result against the baseline.
+    old = {result_key(r): r for r in baseline["results"]}
+    for result in results:
+        before = old.get(result_key(result))
+        if before:
+            ratio = result["min"] / before["min"]
+            print(
+                "%-40s %-40s %8.3fx"
+                % (result["name"], json.dumps(result["params"]), ratio)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="compare results to this JSON file")
+    parser.add_argument(
+        "--quick", action="store_true", help="take fewer samples (noisier)"
+    )
+    parser.add_argument(
+        "-k", dest="filter", help="only run benchmarks with names containing this"
+    )
+    args = parser.parse_args()
+
+    # The code being measured logs at DEBUG level, make sure that's not
+    # what's being measured.
+    logging.disable(logging.CRITICAL)
+
+    recorder = Recorder(quick=args.quick)
+    for bench in BENCHMARKS:
+        if args.filter and args.filter not in bench.__name__:
+            continue
+        bench(recorder)
+
+    for result in recorder.results:
+        if result["unit"] == "s":
+            value = "%12.3f us" % (result["min"] * 1e6)
+        else:
+            value = "%12d %s" % (result["min"], result["unit"])
+        print("%-40s %-40s %s" % (result["name"], json.dumps(result["params"]), value))
+
+    data = {
+        "timestamp": time.time(),
+        "python": sys.version,
+        "platform": platform.platform(),
+        "results": recorder.results,
+    }
+    if args.output:
+        with open(args.output, "wt") as f:
+            json.dump(data, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print("\nRatio against %s (lower is better):" % args.compare)
+            compare(recorder.results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -57,14 +57,18 @@ setup(
     extras_require={
         "tracing": ["opentelemetry-api", "opentelemetry-sdk"],
     },
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     project_urls={
         "Documentation": "https://release-engineering.github.io/pubtools/",
         "Changelog": "https://github.com/release-engineering/pubtools/blob/master/CHANGELOG.md",
     },
     entry_points={
+        "console_scripts": [
+            "pubtools-runner = pubtools._impl.runner:entry_point",
+            "pubtools-trace = pubtools._impl.traceview:entry_point",
+        ],
         "pubtools.hooks": [
             "mallopt = pubtools._impl.mallopt",
-        ]
+        ],
     },
 )
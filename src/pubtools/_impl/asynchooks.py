@@ -0,0 +1,152 @@
+"""Calling hooks from asyncio code.
+
+Hookimpls may be coroutine functions:
+
+.. code-block:: python
+
+    @hookimpl
+    async def task_start():
+        await register_with_status_service()
+
+Such hookimpls are called via ``pm.hook`` like any other, returning
+coroutines which the caller would have to await. Instead, asyncio code may
+call hooks via :data:`~pubtools.pluggy.ahook`:
+
+.. code-block:: python
+
+    await ahook.task_start()
+
+which awaits all ``async def`` hookimpls concurrently on the running event
+loop. Synchronous hookimpls are meanwhile called as usual, in order, in a
+thread of the loop's default executor, so they don't block the loop.
+Results of all hookimpls are returned, those of synchronous hookimpls first.
+
+Once all hookimpls have finished, or ``PUBTOOLS_HOOK_TIMEOUT`` seconds have
+passed, errors are raised as by :func:`~pubtools._impl.hookdispatch.call`.
+
+Hook wrappers only wrap synchronous hookimpls. ``firstresult`` hooks with
+``async def`` hookimpls are instead called one hookimpl at a time, in the
+usual order and without hook wrappers, until one returns a result.
+"""
+
+import contextvars
+import functools
+
+from pubtools._impl import hookdispatch
+
+# Importing asyncio is slow, so it's only done by functions which run in an
+# event loop, by which time it has already been imported.
+
+# Stands in for a plugin name, for errors of synchronous hookimpls.
+SYNCHRONOUS = "Synchronous"
+
+
+def run_in_executor(fn, *args, **kwargs):
+    """Run a function in the running loop's default executor, within a copy of
+    the current context.
+
+    :return: A future of the function's result.
+    """
+    import asyncio  # pylint: disable=import-outside-toplevel
+
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return asyncio.get_running_loop().run_in_executor(None, call)
+
+
+async def _first_result(pm, hook_name, impls, kwargs):
+    for impl in reversed(impls):
+        if hookdispatch.is_wrapper(impl):
+            continue
+        if hookdispatch.is_async(impl):
+            (coro,) = pm._inner_hookexec(hook_name, [impl], kwargs, False)
+            result = await coro
+        else:
+            result = await run_in_executor(
+                pm._inner_hookexec, hook_name, [impl], kwargs, True
+            )
+        if result is not None:
+            return result
+    return None
+
+
+async def acall(pm, hook_name, **kwargs):
+    """Call a hook from asyncio code.
+
+    :param pm: The plugin manager.
+    :type pm: pubtools._impl.taskscope.PluginManager
+    :param hook_name: Name of the hook to call.
+    :param kwargs: Arguments of the hook.
+    :return: As for calling the hook via ``pm.hook``.
+    """
+    import asyncio  # pylint: disable=import-outside-toplevel
+
+    caller = getattr(pm.hook, hook_name)
+    impls = pm.get_hookimpls(hook_name)
+    async_impls = [impl for impl in impls if hookdispatch.is_async(impl)]
+
+    if not async_impls:
+        return await run_in_executor(hookdispatch.call, pm, hook_name, **kwargs)
+
+    if caller.spec is not None and caller.spec.opts.get("firstresult"):
+        return await _first_result(pm, hook_name, impls, kwargs)
+
+    futures = {}
+    sync_impls = [impl for impl in impls if impl not in async_impls]
+    if sync_impls:
+        future = run_in_executor(
+            hookdispatch.call_impls, pm, hook_name, sync_impls, kwargs
+        )
+        futures[future] = SYNCHRONOUS
+    # Coroutines are created here, so that their tasks run within the
+    # current context.
+    for impl in async_impls:
+        for coro in pm._inner_hookexec(hook_name, [impl], kwargs, False):
+            futures[asyncio.ensure_future(coro)] = impl.plugin_name
+
+    timeout = hookdispatch.hook_timeout()
+    try:
+        _, pending = await asyncio.wait(list(futures), timeout=timeout)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+    results = []
+    errors = []
+    for future in futures:
+        if future in pending:
+            future.cancel()
+            errors.append(
+                hookdispatch.timeout_error(futures[future], hook_name, timeout)
+            )
+        elif future.exception() is not None:
+            error = future.exception()
+            if isinstance(error, hookdispatch.HookErrors):
+                errors.extend(error.errors)
+            else:
+                errors.append(error)
+        elif futures[future] is SYNCHRONOUS:
+            results.extend(future.result())
+        elif future.result() is not None:
+            results.append(future.result())
+
+    hookdispatch.raise_errors(hook_name, errors)
+    return results
+
+
+class AsyncHookRelay(object):
+    """Provides hooks as attributes, as with ``pm.hook``, returning
+    coroutines which call them via :func:`acall`.
+
+    :param pm: The plugin manager.
+    :type pm: pubtools._impl.taskscope.PluginManager
+    """
+
+    def __init__(self, pm):
+        self._pm = pm
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not hasattr(self._pm.hook, name):
+            raise AttributeError(name)
+        return functools.partial(acall, self._pm, name)
@@ -0,0 +1,361 @@
+"""A batching span processor with a bounded queue and visible backpressure.
+
+Like OTEL's ``BatchSpanProcessor``, ended spans are queued and exported in
+batches by a background thread. Additionally:
+
+- the policy for a full queue can be chosen: drop the oldest queued span,
+  drop the newest span, or block until there is room (with a timeout, after
+  which the newest span is dropped)
+- counts of exported and dropped spans, and a histogram of export latency,
+  are kept and can be read via :meth:`BoundedBatchProcessor.stats`
+
+The processor is configured by the standard ``OTEL_BSP_MAX_QUEUE_SIZE``,
+``OTEL_BSP_MAX_EXPORT_BATCH_SIZE`` and ``OTEL_BSP_SCHEDULE_DELAY`` environment
+variables, and:
+
+- ``OTEL_TRACING_QUEUE_POLICY``: ``drop_newest`` (default), ``drop_oldest`` or
+  ``block``.
+- ``OTEL_TRACING_QUEUE_BLOCK_TIMEOUT``: for the ``block`` policy, the maximum time
+  (in milliseconds) to wait for room in the queue (default 1000).
+
+The ``otel_batch_options`` hook may override any of these.
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+from opentelemetry.sdk.trace import SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExportResult
+
+from pubtools._impl import envconfig, taskscope
+from pubtools._impl.histogram import Histogram
+
+LOG = logging.getLogger("pubtools")
+
+DROP_NEWEST = "drop_newest"
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+# Seconds to wait at shutdown for queued spans to be exported.
+SHUTDOWN_TIMEOUT = 30.0
+
+
+class BoundedBatchProcessor(SpanProcessor):
+    """A span processor exporting spans in batches from a bounded queue.
+
+    :meth:`task_start` and :meth:`task_stop` are called by
+    :class:`~pubtools._impl.tracing.TracingWrapper` at the start and end of
+    each task, to log export statistics for the task. (With several tasks
+    running concurrently, the statistics of each also include spans of the
+    others, as all share the queue.)
+
+    :param span_exporter: The exporter receiving batches of spans.
+    :type span_exporter: opentelemetry.sdk.trace.export.SpanExporter
+    :param max_queue_size: Maximum number of spans queued for export.
+    :param max_export_batch_size: Maximum number of spans exported at once.
+    :param schedule_delay_millis: Maximum delay between exports.
+    :param policy: What to do when the queue is full; one of :data:`POLICIES`.
+    :param block_timeout_millis: For the ``block`` policy, how long to wait for room.
+    """
+
+    def __init__(
+        self,
+        span_exporter,
+        max_queue_size=2048,
+        max_export_batch_size=512,
+        schedule_delay_millis=5000,
+        policy=DROP_NEWEST,
+        block_timeout_millis=1000,
+    ):
+        if policy not in POLICIES:
+            raise ValueError("Unknown queue policy: %s" % policy)
+        if not schedule_delay_millis > 0:
+            # The worker would never wait between exports, and spin instead.
+            raise ValueError("Invalid schedule delay: %s" % schedule_delay_millis)
+
+        self.span_exporter = span_exporter
+        self.max_queue_size = max_queue_size
+        self.max_export_batch_size = min(max_export_batch_size, max_queue_size)
+        self.schedule_delay = schedule_delay_millis / 1000.0
+        self.policy = policy
+        self.block_timeout = block_timeout_millis / 1000.0
+
+        self.exported = 0
+        self.dropped = 0
+        self.export_failures = 0
+        self.export_latency = Histogram()
+        # Counts at the start of each running task, by task scope.
+        self._task_counts = {}
+
+        self._init_worker()
+        # Threads don't survive fork, so a forked child needs its own worker.
+        # (A weak reference, so the processor can still be garbage collected.)
+        ref = weakref.WeakMethod(self._init_worker)
+        os.register_at_fork(after_in_child=lambda: ref() and ref()())
+
+    def _init_worker(self):
+        self._queue = deque()
+        self._condition = threading.Condition(threading.Lock())
+        self._shutdown = False
+        self._generation = 0
+        self._start_worker()
+
+    def _start_worker(self):
+        # A worker stops once its generation is replaced, so a worker stuck
+        # in an export can be abandoned in favour of a new one.
+        self._generation += 1
+        self._export_lock = threading.Lock()
+        self._worker = threading.Thread(
+            name="pubtools-span-export",
+            target=self._work,
+            args=(self._generation,),
+            daemon=True,
+        )
+        self._worker.start()
+
+    @classmethod
+    def from_env(cls, span_exporter, **overrides):
+        """Create a processor configured from environment variables.
+
+        :param span_exporter: The exporter receiving batches of spans.
+        :param overrides: Arguments overriding those from the environment.
+        """
+        kwargs = {}
+        for arg, name, minimum in [
+            ("max_queue_size", "OTEL_BSP_MAX_QUEUE_SIZE", 1),
+            ("max_export_batch_size", "OTEL_BSP_MAX_EXPORT_BATCH_SIZE", 1),
+            ("schedule_delay_millis", "OTEL_BSP_SCHEDULE_DELAY", 1),
+            ("block_timeout_millis", "OTEL_TRACING_QUEUE_BLOCK_TIMEOUT", 0),
+        ]:
+            value = envconfig.number(name, None, convert=int, minimum=minimum)
+            if value is not None:
+                kwargs[arg] = value
+        policy = (os.getenv("OTEL_TRACING_QUEUE_POLICY") or "").lower()
+        if policy in POLICIES:
+            kwargs["policy"] = policy
+        elif policy:
+            LOG.warning(
+                "Ignoring invalid OTEL_TRACING_QUEUE_POLICY=%r, using %s",
+                policy,
+                DROP_NEWEST,
+            )
+        kwargs.update(overrides or {})
+        return cls(span_exporter, **kwargs)
+
+    @property
+    def queued(self):
+        """Number of spans currently queued for export."""
+        return len(self._queue)
+
+    def stats(self):
+        """Return a dict of export statistics since the processor was created.
+
+        :return: Counts of ``exported``, ``dropped`` and ``queued`` spans, count
+                 of ``export_failures`` (batches), and a summary of
+                 ``export_latency`` (seconds per batch).
+        """
+        return {
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "queued": self.queued,
+            "export_failures": self.export_failures,
+            "export_latency": self.export_latency.summary(),
+        }
+
+    def on_start(self, span, parent_context=None):
+        pass
+
+    def on_end(self, span):
+        if not span.context.trace_flags.sampled:
+            return
+
+        with self._condition:
+            if self._shutdown:
+                return
+
+            if len(self._queue) >= self.max_queue_size:
+                if self.policy == DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif self.policy == BLOCK:
+                    self._condition.notify_all()
+                    if not self._condition.wait_for(
+                        lambda: len(self._queue) < self.max_queue_size
+                        or self._shutdown,
+                        self.block_timeout,
+                    ):
+                        self.dropped += 1
+                        return
+                else:
+                    self.dropped += 1
+                    return
+
+            self._queue.append(span)
+            if len(self._queue) >= self.max_export_batch_size:
+                self._condition.notify_all()
+
+    def _take_batch(self):
+        # Must be called with the condition held.
+        batch = []
+        while self._queue and len(batch) < self.max_export_batch_size:
+            batch.append(self._queue.popleft())
+        # Wake up anyone blocked on a full queue.
+        self._condition.notify_all()
+        return batch
+
+    def _export(self, batch):
+        # Must be called with the export lock held.
+        start = time.perf_counter()
+        try:
+            result = self.span_exporter.export(batch)
+        except Exception:  # pylint: disable=broad-except
+            LOG.debug("Exporting spans failed", exc_info=True)
+            result = SpanExportResult.FAILURE
+        self.export_latency.record(time.perf_counter() - start)
+
+        # Counters are only updated with the condition held, as on_end and
+        # rearm also update them.
+        with self._condition:
+            if result is SpanExportResult.SUCCESS:
+                self.exported += len(batch)
+            else:
+                self.export_failures += 1
+                self.dropped += len(batch)
+
+    def _work(self, generation):
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._shutdown
+                    or self._generation != generation
+                    or len(self._queue) >= self.max_export_batch_size,
+                    self.schedule_delay,
+                )
+                if self._shutdown or self._generation != generation:
+                    return
+                # Take the export lock before the batch, so that batches are
+                # exported in order even if force_flush runs concurrently.
+                lock = self._export_lock
+                lock.acquire()
+                batch = self._take_batch()
+            try:
+                if batch:
+                    self._export(batch)
+            finally:
+                lock.release()
+
+    def _flush(self, lock, deadline, flushed):
+        # Runs in a helper thread of force_flush, exporting queued spans until
+        # none are left or the deadline has passed. The lock is that of the
+        # current worker, which rearm() may since have replaced.
+        if not lock.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            return
+        try:
+            while time.monotonic() < deadline:
+                with self._condition:
+                    batch = self._take_batch()
+                if not batch:
+                    break
+                self._export(batch)
+            if not self._queue:
+                flushed.set()
+        finally:
+            lock.release()
+
+    def force_flush(self, timeout_millis=30000):
+        """Export all queued spans, giving up after a timeout.
+
+        Spans are exported by a helper thread, so that the timeout holds even
+        if the exporter hangs. (A helper stuck in an export is abandoned, and
+        can be replaced by :meth:`rearm`.)
+
+        :return: True if all spans queued at the time of the call were exported
+                 (or dropped on export failure) before the timeout.
+        """
+        timeout = timeout_millis / 1000.0
+        flushed = threading.Event()
+        helper = threading.Thread(
+            name="pubtools-span-flush",
+            target=self._flush,
+            args=(self._export_lock, time.monotonic() + timeout, flushed),
+            daemon=True,
+        )
+        helper.start()
+        helper.join(timeout)
+        return flushed.is_set()
+
+    def rearm(self, discard=True):
+        """Replace the worker if it's stuck exporting, and by default discard
+        any spans still queued, so that the processor starts afresh.
+
+        :param discard: False to keep queued spans, e.g. as they belong to other
+                        tasks which are still running.
+        :return: Number of spans discarded, which are counted as dropped.
+        :rtype: int
+        """
+        with self._condition:
+            discarded = 0
+            if discard:
+                discarded = len(self._queue)
+                self._queue.clear()
+                self.dropped += discarded
+            self._condition.notify_all()
+
+            if self._export_lock.acquire(blocking=False):
+                self._export_lock.release()
+            else:
+                LOG.debug("Abandoning span export worker stuck in export")
+                self._start_worker()
+        return discarded
+
+    def shutdown(self):
+        # The worker is retired, and anything still queued is exported before
+        # the exporter shuts down, giving up after SHUTDOWN_TIMEOUT seconds.
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+        self._worker.join(SHUTDOWN_TIMEOUT)
+        if not self.force_flush(max(deadline - time.monotonic(), 0) * 1000):
+            LOG.warning(
+                "Spans were not exported within %s seconds of shutdown",
+                SHUTDOWN_TIMEOUT,
+            )
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        self.span_exporter.shutdown()
+
+    @property
+    def running_tasks(self):
+        """Number of tasks started and not yet stopped."""
+        return len(self._task_counts)
+
+    def task_start(self):
+        self._task_counts[taskscope.current()] = (self.exported, self.dropped)
+
+    def task_stop(self, failed):
+        exported, dropped = self._task_counts.pop(taskscope.current(), (0, 0))
+        exported = self.exported - exported
+        dropped = self.dropped - dropped
+        latency = self.export_latency
+        message = (
+            "Span export: %s exported, %s dropped, %s queued; "
+            "export latency p50 %.1f ms, max %.1f ms"
+        )
+        args = (
+            exported,
+            dropped,
+            self.queued,
+            (latency.percentile(50) or 0) * 1000,
+            (latency.max or 0) * 1000,
+        )
+        if dropped:
+            LOG.warning(message, *args)
+        else:
+            LOG.debug(message, *args)
@@ -0,0 +1,45 @@
+"""Numeric settings read from environment variables.
+
+A setting with an invalid value, such as ``OTEL_TRACING_SAMPLE_RATIO=10%``,
+shouldn't prevent a task from running at all, so such values are ignored
+with a warning, and the setting's default is used instead.
+"""
+
+import logging
+import os
+
+LOG = logging.getLogger("pubtools")
+
+
+def number(name, default, convert=float, minimum=None, maximum=None):
+    """Read a number from an environment variable.
+
+    :param name: Name of the environment variable.
+    :param default: Value used if the variable is unset, empty or invalid.
+    :param convert: Converts the variable's value, e.g. ``int`` or ``float``.
+    :param minimum: Smallest valid value, if any.
+    :param maximum: Largest valid value, if any.
+    :return: The variable's value, or the default.
+    """
+    value = os.getenv(name)
+    if not value:
+        return default
+
+    try:
+        result = convert(value)
+    except ValueError:
+        result = None
+    # Comparisons are written so that NaN is never valid.
+    if (
+        result is None
+        or (minimum is not None and not result >= minimum)
+        or (maximum is not None and not result <= maximum)
+    ):
+        LOG.warning(
+            "Ignoring invalid %s=%r, using %s",
+            name,
+            value,
+            "the default" if default is None else default,
+        )
+        return default
+    return result
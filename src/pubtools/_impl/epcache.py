@@ -0,0 +1,220 @@
+"""A persistent index of entry points relevant to pubtools.
+
+Resolving hooks requires finding all pubtools ``console_scripts`` entry points
+and all entry points in the ``pubtools.hooks`` and ``pubtools.lazy_hooks``
+groups. Finding them means reading the entry point
+metadata of every installed distribution, which can take a significant
+amount of time when hundreds of distributions are installed.
+
+This module maintains an index of the relevant entry points on disk, keyed
+by a fingerprint of the installed distributions. The fingerprint covers
+the entries of ``sys.path`` and, for every distribution metadata directory
+found there, its name (which embeds the version) and the mtimes of the
+directory and its entry points file. If any distribution is installed,
+removed, upgraded or has its entry points rewritten, the fingerprint
+changes and the index is rebuilt.
+
+The index is also memoized in-process, so once it has been loaded, the
+fingerprint is not recalculated for the lifetime of the process.
+
+The location of the index can be set via the ``PUBTOOLS_ENTRY_POINTS_CACHE``
+environment variable. Setting it to an empty string disables the on-disk
+index (while keeping the in-process memo).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+from collections import namedtuple
+
+if sys.version_info >= (3, 10):
+    from importlib.metadata import EntryPoint
+else:  # pragma: no cover
+    # for older python use non-standard compatible module
+    from importlib_metadata import EntryPoint
+
+LOG = logging.getLogger("pubtools")
+
+# Bump this whenever the format of the index changes, so that indexes
+# written by other versions of pubtools are ignored.
+VERSION = 2
+
+# Suffixes of distribution metadata directories found on sys.path.
+METADATA_SUFFIXES = (".dist-info", ".egg-info")
+
+# In-process memo of the index, as a list of (name, value, group, dist).
+_MEMO = None
+
+# An indexed entry point, along with the name of the distribution providing it
+# (or None if not known).
+Entry = namedtuple("Entry", ["ep", "dist"])
+
+
+def clear():
+    """Forget the in-process memo of the index.
+
+    The next call to :func:`get_entry_points` will recalculate the
+    fingerprint and reload (or rebuild) the on-disk index.
+    """
+    global _MEMO
+    _MEMO = None
+
+
+def cache_path():
+    # Returns the path of the on-disk index, or None if disabled.
+    path = os.environ.get("PUBTOOLS_ENTRY_POINTS_CACHE")
+    if path is not None:
+        return path or None
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+
+    # Different interpreters/virtualenvs see a different set of distributions;
+    # give each of them their own index so they don't keep invalidating each
+    # other.
+    prefix = hashlib.sha256(sys.prefix.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(base, "pubtools", "entry-points-%s.json" % prefix)
+
+
+def _stat_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def fingerprint(path=None):
+    """Calculate a fingerprint of the distributions installed on a path.
+
+    :param path: Import path to inspect; defaults to ``sys.path``.
+    :type path: list[str]
+    :return: A hex digest which changes whenever distributions change.
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    digest.update(str(VERSION).encode("utf-8"))
+
+    for entry in sys.path if path is None else path:
+        digest.update(b"\0path\0" + entry.encode("utf-8", "surrogateescape"))
+
+        try:
+            scanner = os.scandir(entry or ".")
+        except OSError:
+            # Missing entry, zip file, etc.
+            digest.update(str(_stat_mtime(entry or ".")).encode("utf-8"))
+            continue
+
+        with scanner:
+            dists = sorted(
+                (item.name, item.path)
+                for item in scanner
+                if item.name.endswith(METADATA_SUFFIXES)
+            )
+
+        for name, dist_path in dists:
+            digest.update(
+                (
+                    "\0dist\0%s\0%s\0%s"
+                    % (
+                        name,
+                        _stat_mtime(dist_path),
+                        _stat_mtime(os.path.join(dist_path, "entry_points.txt")),
+                    )
+                ).encode("utf-8", "surrogateescape")
+            )
+
+    return digest.hexdigest()
+
+
+def _load(path, expected_fingerprint):
+    # Returns entry points from the on-disk index at path, or None if
+    # the index is missing, unreadable or stale.
+    try:
+        with open(path, "rt") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:  # pylint: disable=broad-except
+        LOG.debug("Ignoring unreadable entry point index %s", path, exc_info=True)
+        return None
+
+    if (
+        not isinstance(data, dict)
+        or data.get("version") != VERSION
+        or data.get("fingerprint") != expected_fingerprint
+    ):
+        LOG.debug("Entry point index %s is stale", path)
+        return None
+
+    return [tuple(item) for item in data["entry_points"]]
+
+
+def _save(path, current_fingerprint, eps):
+    # Atomically write eps to the on-disk index at path.
+    # Failing to write is not fatal, the index is merely an optimization.
+    data = {
+        "version": VERSION,
+        "fingerprint": current_fingerprint,
+        "entry_points": [list(item) for item in eps],
+    }
+    try:
+        dirname = os.path.dirname(path) or "."
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".entry-points-")
+        try:
+            with os.fdopen(fd, "wt") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except Exception:  # pylint: disable=broad-except
+        LOG.debug("Failed to write entry point index %s", path, exc_info=True)
+
+
+def _dist_name(ep):
+    dist = getattr(ep, "dist", None)
+    return dist.name if dist is not None else None
+
+
+def _scan(scan):
+    return [(ep.name, ep.value, ep.group, _dist_name(ep)) for ep in scan()]
+
+
+def _index(scan):
+    path = cache_path()
+    if not path:
+        return _scan(scan)
+
+    current_fingerprint = fingerprint()
+    eps = _load(path, current_fingerprint)
+    if eps is None:
+        eps = _scan(scan)
+        _save(path, current_fingerprint, eps)
+        LOG.debug("Wrote entry point index %s", path)
+
+    return eps
+
+
+def get_entry_points(scan):
+    """Get the pubtools-relevant entry points, using the index where possible.
+
+    :param scan: A callable performing a full scan of installed distributions,
+                 returning an iterable of entry points. It is only invoked if
+                 the index is missing or stale.
+    :return: Entry points along with their distribution names, in the same order
+             as returned by ``scan``.
+    :rtype: list[Entry]
+    """
+    global _MEMO
+    if _MEMO is None:
+        _MEMO = _index(scan)
+
+    return [
+        Entry(EntryPoint(name, value, group), dist)
+        for (name, value, group, dist) in _MEMO
+    ]
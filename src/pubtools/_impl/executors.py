@@ -0,0 +1,153 @@
+"""Executors propagating trace context into their workers.
+
+OTEL context (including baggage) is held in context variables, which are not
+inherited by worker threads or processes of ``concurrent.futures`` executors.
+Spans created by workers would otherwise not be children of the span which
+submitted the work.
+
+The executors here capture the context whenever work is submitted and make it
+current while the work runs:
+
+- for threads, the whole ``contextvars`` context is copied
+- for processes, trace context is serialized into a carrier dict, which is
+  extracted again in the worker
+
+Process workers additionally re-apply mallopt tunables from the submitting
+process's environment, and flush any spans they created before they exit.
+"""
+
+import concurrent.futures
+import contextvars
+import logging
+import os
+from multiprocessing import util
+
+from pubtools._impl import mallopt
+
+LOG = logging.getLogger("pubtools")
+
+
+def _trace_wrapper():
+    from pubtools._impl.tracing import get_trace_wrapper
+
+    return get_trace_wrapper()
+
+
+class _ContextCall(object):
+    # A picklable callable running a function within trace context extracted
+    # from a carrier.
+
+    def __init__(self, fn, carrier):
+        self.fn = fn
+        self.carrier = carrier
+
+    def __call__(self, *args, **kwargs):
+        tw = _trace_wrapper()
+        if not tw._enabled_trace:
+            return self.fn(*args, **kwargs)
+
+        from opentelemetry import context
+
+        token = tw._attach_parent(self.carrier)
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            if token:
+                context.detach(token)
+
+
+def _flush_worker():
+    # Flush spans created by a process worker before it exits.
+    try:
+        _trace_wrapper().force_flush()
+    except Exception:  # pylint: disable=broad-except
+        LOG.warning("Failed to flush trace data in worker", exc_info=True)
+
+
+def _init_worker(env, initializer, initargs):
+    # Initializer of process workers.
+    os.environ.update(env)
+    mallopt.set_mallopt_tunables_safe()
+
+    if os.getenv("OTEL_TRACING", "").lower() == "true":
+        # Workers which were spawned rather than forked have yet to import
+        # hooks, such as the one providing the exporter. (This is cheap
+        # otherwise, as everything has already been imported.)
+        from pubtools._impl.pluggy import resolve_hooks
+
+        resolve_hooks()
+        if _trace_wrapper()._enabled_trace:
+            # Flushed by multiprocessing as the worker process exits.
+            util.Finalize(None, _flush_worker, exitpriority=10)
+
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """Submit a callable to an executor, propagating the current trace context.
+
+    Can be used with any executor. For process pool executors other than
+    :class:`ProcessPoolExecutor`, only trace context is propagated.
+
+    :param executor: The executor.
+    :type executor: concurrent.futures.Executor
+    :param fn: Callable to be executed.
+    :param args: Positional arguments for the callable.
+    :param kwargs: Keyword arguments for the callable.
+    :return: A future representing the execution of the callable.
+    :rtype: concurrent.futures.Future
+    """
+    if isinstance(executor, (ThreadPoolExecutor, ProcessPoolExecutor)):
+        # Already propagates context.
+        return executor.submit(fn, *args, **kwargs)
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        return executor.submit(_wrap_for_process(fn), *args, **kwargs)
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def _wrap_for_process(fn):
+    return _ContextCall(fn, _trace_wrapper().inject_env({}))
+
+
+class ThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+    """A :class:`concurrent.futures.ThreadPoolExecutor` running each submitted
+    callable within the context of the thread which submitted it.
+
+    Spans created by the callable are children of the span current at the time
+    of submission.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        # Each call needs its own copy, since a context can't be entered by
+        # several threads at once.
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class ProcessPoolExecutor(concurrent.futures.ProcessPoolExecutor):
+    """A :class:`concurrent.futures.ProcessPoolExecutor` running each submitted
+    callable within the trace context current at the time of submission.
+
+    Worker processes also apply mallopt tunables from the environment of the
+    process creating the executor, and flush trace data before exiting.
+    Arguments are the same as for :class:`concurrent.futures.ProcessPoolExecutor`.
+    """
+
+    def __init__(
+        self, max_workers=None, mp_context=None, initializer=None, initargs=(), **kwargs
+    ):
+        env = {
+            name: value
+            for (name, value) in os.environ.items()
+            if name in mallopt.TUNABLES or name == "OTEL_TRACING"
+        }
+        super().__init__(
+            max_workers,
+            mp_context,
+            initializer=_init_worker,
+            initargs=(env, initializer, initargs),
+            **kwargs,
+        )
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(_wrap_for_process(fn), *args, **kwargs)
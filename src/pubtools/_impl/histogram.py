@@ -0,0 +1,115 @@
+"""Compact histograms of non-negative values, such as latencies.
+
+Values are counted in log-linear buckets: each power of two is split into
+:data:`SUB_BUCKETS` equal-width buckets, so the relative error of reported
+percentiles is bounded (about 12.5% with the default of 8), while a histogram
+of any number of values takes a few dozen counters at most.
+"""
+
+import math
+import threading
+
+# Number of buckets per power of two.
+SUB_BUCKETS = 8
+
+
+def _bucket(value):
+    # Index of the bucket counting a value. Values <= 0 share the lowest bucket.
+    if value <= 0:
+        return None
+    mantissa, exponent = math.frexp(value)
+    # mantissa is in [0.5, 1)
+    return exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+
+
+def _upper_bound(index):
+    # Upper bound of values counted in a bucket.
+    if index is None:
+        return 0.0
+    exponent, sub = divmod(index, SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub + 1) / (2.0 * SUB_BUCKETS), exponent)
+
+
+class Histogram(object):
+    """A histogram of values, with count, sum, min and max.
+
+    Recording a value is thread-safe.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def record(self, value):
+        """Record a value."""
+        index = _bucket(value)
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+            self._buckets[index] = self._buckets.get(index, 0) + 1
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def buckets(self):
+        """Return a sorted list of (upper bound, count) for non-empty buckets."""
+        with self._lock:
+            items = list(self._buckets.items())
+        return sorted((_upper_bound(index), count) for (index, count) in items)
+
+    def percentile(self, percent):
+        """Return an estimate of a percentile (0-100) of recorded values, or None
+        if no values were recorded."""
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for bound, count in self.buckets():
+            seen += count
+            if seen >= rank:
+                # Never report a value outside of the recorded range.
+                return min(max(bound, self.min), self.max)
+        return self.max  # pragma: no cover
+
+    def summary(self):
+        """Return a dict of count, sum, min, max, mean and common percentiles."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+    def attributes(self, prefix):
+        """Return span attributes describing the histogram.
+
+        :param prefix: Prefix for names of the attributes.
+        :type prefix: str
+        :return: Summary values as ``<prefix>.<stat>`` along with bucket upper bounds
+                 and counts as ``<prefix>.bucket_bounds`` and ``<prefix>.bucket_counts``.
+        :rtype: dict
+        """
+        attributes = {}
+        if not self.count:
+            attributes[prefix + ".count"] = 0
+            return attributes
+
+        for key, value in self.summary().items():
+            attributes["%s.%s" % (prefix, key)] = value
+        buckets = self.buckets()
+        attributes[prefix + ".bucket_bounds"] = [bound for (bound, _) in buckets]
+        attributes[prefix + ".bucket_counts"] = [count for (_, count) in buckets]
+        return attributes
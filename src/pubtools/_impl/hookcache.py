@@ -0,0 +1,86 @@
+"""Memoization of firstresult hook results within a task.
+
+Some ``firstresult`` hooks are called repeatedly with the same arguments
+(e.g. per HTTP session or per worker thread), while their hookimpls may be
+slow, such as when looking up credentials. Hookspecs may opt into caching
+their results:
+
+.. code-block:: python
+
+    @hookspec(firstresult=True, cache="task", cache_ttl=300)
+    def get_cert_key_paths(server_url):
+        ...
+
+Within a :func:`~pubtools.pluggy.task_context`, results of such hooks are
+memoized by their arguments, for at most ``cache_ttl`` seconds if given.
+Each task (including a nested task) has a cache of its own, identified by
+its :mod:`task scope <pubtools._impl.taskscope>`, so tasks running
+concurrently in one process don't share results, and the cache of a task is
+cleared when the task stops. Results are also keyed by
+the hookimpls registered, so that once a plugin implementing the hook is
+registered or unregistered, results memoized with a different set of
+hookimpls are no longer used.
+
+Calls with unhashable arguments, and calls which raise, are not cached.
+"""
+
+import threading
+import time
+import weakref
+
+from pubtools._impl import taskscope
+
+CACHE_SCOPES = ("task",)
+
+
+class HookCache(object):
+    """Memoizes results of hooks opting into caching, for a plugin manager.
+
+    :param pm: The plugin manager whose hook calls should be cached.
+    :type pm: pluggy.PluginManager
+    """
+
+    def __init__(self, pm):
+        self.pm = pm
+        self._lock = threading.Lock()
+        # Memoized results per task scope.
+        self._results = weakref.WeakKeyDictionary()
+        self._inner = pm._inner_hookexec
+        pm._inner_hookexec = self._hookexec
+
+    def task_started(self):
+        """Start caching for the current task, until it stops."""
+        with self._lock:
+            self._results[taskscope.current()] = {}
+
+    def task_stopped(self):
+        """Clear the cache of the current task, and stop caching for it."""
+        with self._lock:
+            self._results.pop(taskscope.current(), None)
+
+    def _hookexec(self, hook_name, hook_impls, caller_kwargs, firstresult):
+        scope = taskscope.current()
+        results = self._results.get(scope) if scope is not None else None
+        if results is None or not firstresult:
+            return self._inner(hook_name, hook_impls, caller_kwargs, firstresult)
+
+        caller = self.pm.hook.__dict__.get(hook_name)
+        opts = caller.spec.opts if caller is not None and caller.spec else {}
+        if not opts.get("cache"):
+            return self._inner(hook_name, hook_impls, caller_kwargs, firstresult)
+
+        try:
+            key = (hook_name, tuple(hook_impls), frozenset(caller_kwargs.items()))
+        except TypeError:
+            # Can't be memoized, e.g. a list argument.
+            return self._inner(hook_name, hook_impls, caller_kwargs, firstresult)
+
+        now = time.monotonic()
+        cached = results.get(key)
+        if cached is not None and (cached[0] is None or cached[0] > now):
+            return cached[1]
+
+        result = self._inner(hook_name, hook_impls, caller_kwargs, firstresult)
+        ttl = opts.get("cache_ttl")
+        results[key] = (now + ttl if ttl is not None else None, result)
+        return result
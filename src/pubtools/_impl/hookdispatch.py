@@ -0,0 +1,200 @@
+"""Concurrent dispatch of task lifecycle hookimpls.
+
+Hookimpls of ``task_start`` and ``task_stop`` often do network I/O, such as
+registering with a status service or uploading logs, so when called one after
+another their latencies add up at both ends of every task. Hookimpls which
+are safe to run concurrently may say so:
+
+.. code-block:: python
+
+    @hookimpl(concurrent=True)
+    def task_stop(failed):
+        upload_logs()
+
+(or a hookspec may declare all of its hookimpls safe, via
+``@hookspec(concurrent=True)``). ``async def`` hookimpls are also run this
+way, each in its own event loop.
+
+When :func:`call` dispatches a hook, such hookimpls are run on a bounded
+pool of threads, while the remaining hookimpls are called in order as usual
+in the calling thread. Hook wrappers only wrap the latter.
+
+Once all hookimpls have finished, or a timeout has passed, any errors are
+raised: a single error as is, or several as a :class:`HookErrors`. The pool
+size and timeout are configured by the ``PUBTOOLS_HOOK_WORKERS`` (default 8)
+and ``PUBTOOLS_HOOK_TIMEOUT`` (seconds, default 60) environment variables;
+invalid values are ignored with a warning.
+"""
+
+import contextvars
+import inspect
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from pubtools._impl import envconfig
+
+LOG = logging.getLogger("pubtools")
+
+
+class HookErrors(Exception):
+    """Raised when several hookimpls of a hook failed.
+
+    :param hook_name: Name of the hook.
+    :param errors: The exceptions raised, or timeouts of hookimpls which did
+                   not finish in time.
+    """
+
+    def __init__(self, hook_name, errors):
+        self.hook_name = hook_name
+        self.errors = list(errors)
+        super().__init__(
+            "%s hookimpls of %s failed: %s"
+            % (len(self.errors), hook_name, "; ".join(repr(e) for e in self.errors))
+        )
+
+
+def is_wrapper(impl):
+    """Whether a hookimpl is a hook wrapper."""
+    return getattr(impl, "wrapper", False) or impl.hookwrapper
+
+
+def is_async(impl):
+    """Whether a hookimpl is a coroutine function."""
+    return inspect.iscoroutinefunction(inspect.unwrap(impl.function))
+
+
+def is_concurrent(impl, spec):
+    """Whether a hookimpl may be run concurrently with others."""
+    if is_wrapper(impl):
+        return False
+    return bool(
+        impl.opts.get("concurrent")
+        or (spec is not None and spec.opts.get("concurrent"))
+        or is_async(impl)
+    )
+
+
+def raise_errors(hook_name, errors):
+    """Raise errors of hookimpls, if any: a single error as is, or several
+    as a :class:`HookErrors`."""
+    if len(errors) == 1:
+        raise errors[0]
+    if errors:
+        raise HookErrors(hook_name, errors) from errors[0]
+
+
+def timeout_error(name, hook_name, timeout):
+    """Log and return an error for hookimpls which did not finish in time.
+
+    :param name: Description of the hookimpls, e.g. a plugin name.
+    """
+    message = "%s hookimpl of %s did not finish within %s seconds" % (
+        name,
+        hook_name,
+        timeout,
+    )
+    LOG.warning(message)
+    return TimeoutError(message)
+
+
+def hook_timeout():
+    """The timeout for concurrent hookimpls, in seconds."""
+    return envconfig.number("PUBTOOLS_HOOK_TIMEOUT", 60.0, minimum=0.0)
+
+
+def _work(pm, hook_name, pending, kwargs, done):
+    # A worker of the pool, running hookimpls until none are pending.
+    while True:
+        try:
+            impl, ctx = pending.popleft()
+        except IndexError:
+            return
+        try:
+            result = ctx.run(pm._inner_hookexec, hook_name, [impl], kwargs, False)
+            if any(inspect.iscoroutine(r) for r in result):
+                import asyncio  # pylint: disable=import-outside-toplevel
+
+                result = [ctx.run(asyncio.run, r) for r in result]
+                result = [r for r in result if r is not None]
+            done.put((impl, result, None))
+        except Exception as error:  # pylint: disable=broad-except
+            done.put((impl, [], error))
+
+
+def call(pm, hook_name, **kwargs):
+    """Call a hook, running hookimpls marked as concurrent on a thread pool.
+
+    :param pm: The plugin manager.
+    :type pm: pubtools._impl.taskscope.PluginManager
+    :param hook_name: Name of the hook to call.
+    :param kwargs: Arguments of the hook.
+    :return: Results of all hookimpls; those of concurrent hookimpls follow the
+             others, in no particular order. (``firstresult`` hooks are called
+             as usual.)
+    :rtype: list
+    """
+    caller = getattr(pm.hook, hook_name)
+    impls = pm.get_hookimpls(hook_name)
+    firstresult = caller.spec is not None and caller.spec.opts.get("firstresult")
+    if firstresult or not any(is_concurrent(impl, caller.spec) for impl in impls):
+        return caller(**kwargs)
+    return call_impls(pm, hook_name, impls, kwargs)
+
+
+def call_impls(pm, hook_name, impls, kwargs):
+    """Call some hookimpls of a hook, running those marked as concurrent on
+    a thread pool.
+
+    Arguments and return value are as for :func:`call`, except that only the
+    given hookimpls are called, with the given dict of arguments.
+    """
+    caller = getattr(pm.hook, hook_name)
+    concurrent = [impl for impl in impls if is_concurrent(impl, caller.spec)]
+    serial = [impl for impl in impls if impl not in concurrent]
+    if not concurrent:
+        return pm._inner_hookexec(hook_name, serial, kwargs, False)
+
+    timeout = hook_timeout()
+    workers = envconfig.number("PUBTOOLS_HOOK_WORKERS", 8, convert=int, minimum=1)
+    deadline = time.monotonic() + timeout
+
+    # Each hookimpl runs within a copy of the caller's context, so that e.g.
+    # spans it creates are children of the caller's span.
+    pending = deque((impl, contextvars.copy_context()) for impl in concurrent)
+    done = queue.Queue()
+    for _ in range(min(workers, len(concurrent))):
+        # Daemon threads, so that a hookimpl which never finishes can't
+        # prevent the process from exiting.
+        threading.Thread(
+            name="pubtools-hook",
+            target=_work,
+            args=(pm, hook_name, pending, kwargs, done),
+            daemon=True,
+        ).start()
+
+    results = []
+    errors = []
+    try:
+        results.extend(pm._inner_hookexec(hook_name, serial, kwargs, False))
+    except Exception as error:  # pylint: disable=broad-except
+        errors.append(error)
+
+    unfinished = list(concurrent)
+    while unfinished:
+        try:
+            impl, result, error = done.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            break
+        unfinished.remove(impl)
+        results.extend(result)
+        if error is not None:
+            errors.append(error)
+
+    for impl in unfinished:
+        errors.append(timeout_error(impl.plugin_name, hook_name, timeout))
+
+    raise_errors(hook_name, errors)
+    return results
@@ -0,0 +1,237 @@
+"""Latency statistics for hook calls.
+
+When a task starts slowly, it's not obvious which of the many hookimpls
+provided by task libraries is responsible. If the ``PUBTOOLS_HOOK_STATS``
+environment variable is set to ``true``, every call of a hook via ``pm.hook``
+is timed, as is each hookimpl called along the way, into histograms per hook
+and per (hook, plugin).
+
+This works the same way as pluggy's hook call monitoring, by wrapping the
+plugin manager's hook executor, except that hookimpls are timed individually:
+the first time a hookimpl is called, its function is replaced by one which
+records its latency. Since that's done only once per hookimpl, and recording
+a latency is cheap, statistics may be collected in production.
+
+Statistics are kept per task (including a nested task), so tasks running
+concurrently in one process each get their own. A report is logged when the
+task context exits, after which that task's statistics are forgotten.
+"""
+
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+import weakref
+
+from pubtools._impl import taskscope
+from pubtools._impl.histogram import Histogram
+
+LOG = logging.getLogger("pubtools")
+
+_STATS = None
+
+
+def enabled():
+    # Whether hook statistics were requested.
+    return os.getenv("PUBTOOLS_HOOK_STATS", "").lower() == "true"
+
+
+def _timed(function, record):
+    # Returns a wrapper of a hookimpl function recording its latency.
+    if inspect.iscoroutinefunction(function):
+        # For async hookimpls, the latency is that of awaiting the coroutine.
+        @functools.wraps(function)
+        async def timed(*args):
+            start = time.perf_counter()
+            try:
+                return await function(*args)
+            finally:
+                record(time.perf_counter() - start)
+
+    else:
+
+        @functools.wraps(function)
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                record(time.perf_counter() - start)
+
+    timed._pubtools_hook_stats = True
+    return timed
+
+
+def _is_wrapper(impl):
+    # Wrappers are generators surrounding the other hookimpls, so timing
+    # the call of the function would tell nothing.
+    return getattr(impl, "wrapper", False) or impl.hookwrapper
+
+
+class HookStats(object):
+    """Collects latencies of hook calls for a plugin manager.
+
+    :param pm: The plugin manager whose hook calls should be timed.
+    :type pm: pluggy.PluginManager
+    """
+
+    def __init__(self, pm):
+        self.pm = pm
+        self._lock = threading.Lock()
+        # Histograms of calls and of hookimpls, per task scope, and for calls
+        # made outside of any task.
+        self._tasks = weakref.WeakKeyDictionary()
+        self._untasked = ({}, {})
+        self._inner = pm._inner_hookexec
+        pm._inner_hookexec = self._hookexec
+
+    def _task_histograms(self):
+        # The (calls, impls) histograms of the current task.
+        scope = taskscope.current()
+        if scope is None:
+            return self._untasked
+        with self._lock:
+            return self._tasks.setdefault(scope, ({}, {}))
+
+    def _histogram(self, histograms, key):
+        histogram = histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = histograms.setdefault(key, Histogram())
+        return histogram
+
+    def _record_impl(self, hook_name, plugin_name, value):
+        _, impls = self._task_histograms()
+        self._histogram(impls, (hook_name, plugin_name)).record(value)
+
+    def _hookexec(self, hook_name, hook_impls, caller_kwargs, firstresult):
+        for impl in hook_impls:
+            if not getattr(impl.function, "_pubtools_hook_stats", False):
+                if not _is_wrapper(impl):
+                    record = functools.partial(
+                        self._record_impl, hook_name, impl.plugin_name
+                    )
+                    impl.function = _timed(impl.function, record)
+
+        calls, _ = self._task_histograms()
+        histogram = self._histogram(calls, hook_name)
+        start = time.perf_counter()
+        try:
+            return self._inner(hook_name, hook_impls, caller_kwargs, firstresult)
+        finally:
+            histogram.record(time.perf_counter() - start)
+
+    def uninstall(self):
+        """Stop timing hook calls, and restore all hookimpl functions."""
+        self.pm._inner_hookexec = self._inner
+        for caller in self.pm.hook.__dict__.values():
+            for impl in getattr(caller, "get_hookimpls", list)():
+                while getattr(impl.function, "_pubtools_hook_stats", False):
+                    impl.function = impl.function.__wrapped__
+
+    def stats(self):
+        """Return statistics of hook calls in the current task since the last
+        reset.
+
+        :return: For each hook called, a summary of latencies as returned by
+                 :meth:`~pubtools._impl.histogram.Histogram.summary`, plus an
+                 ``impls`` dict holding such a summary for each plugin
+                 implementing the hook.
+        :rtype: dict
+        """
+        calls, impls = self._task_histograms()
+        with self._lock:
+            calls = dict(calls)
+            impls = dict(impls)
+
+        out = {}
+        for hook_name, histogram in calls.items():
+            out[hook_name] = histogram.summary()
+            out[hook_name]["impls"] = {}
+        for (hook_name, plugin_name), histogram in impls.items():
+            if hook_name in out:
+                out[hook_name]["impls"][plugin_name] = histogram.summary()
+        return out
+
+    def reset(self):
+        """Forget statistics of the current task."""
+        scope = taskscope.current()
+        with self._lock:
+            if scope is None:
+                self._untasked = ({}, {})
+            else:
+                self._tasks.pop(scope, None)
+
+    def report(self):
+        """Log a report of statistics of the current task and forget them."""
+        stats = self.stats()
+        self.reset()
+        if not stats:
+            return
+
+        def line(indent, name, summary):
+            return "%s%s: %s calls, total %.1f ms, p50 %.3f ms, max %.3f ms" % (
+                indent,
+                name,
+                summary["count"],
+                summary["sum"] * 1000,
+                summary["p50"] * 1000,
+                summary["max"] * 1000,
+            )
+
+        lines = ["Hook call statistics (sorted by total time):"]
+        for hook_name, summary in sorted(
+            stats.items(), key=lambda item: item[1]["sum"], reverse=True
+        ):
+            lines.append(line("  ", hook_name, summary))
+            impls = summary["impls"]
+            for plugin_name, impl_summary in sorted(
+                impls.items(), key=lambda item: item[1]["sum"], reverse=True
+            ):
+                lines.append(line("    ", plugin_name, impl_summary))
+        LOG.info("\n".join(lines))
+
+
+def install(pm):
+    """Start collecting hook call statistics for a plugin manager, if not
+    already doing so."""
+    global _STATS
+    if _STATS is None:
+        _STATS = HookStats(pm)
+
+
+def uninstall():
+    """Stop collecting hook call statistics."""
+    global _STATS
+    if _STATS is not None:
+        _STATS.uninstall()
+        _STATS = None
+
+
+def stats():
+    """Return statistics of hook calls in the current task.
+
+    :return: Statistics as returned by :meth:`HookStats.stats`, or None if
+             statistics are not being collected.
+    :rtype: dict
+    """
+    if _STATS is None:
+        return None
+    return _STATS.stats()
+
+
+def report():
+    """Log (and forget) any hook call statistics collected in the current task.
+
+    Errors are logged rather than raised, as statistics must not be able to
+    break a task.
+    """
+    if _STATS is None:
+        return
+
+    try:
+        _STATS.report()
+    except Exception:  # pylint: disable=broad-except
+        LOG.warning("Failed to report hook call statistics", exc_info=True)
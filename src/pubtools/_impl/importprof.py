@@ -0,0 +1,348 @@
+"""An opt-in profiler for imports done while resolving hooks.
+
+Resolving hooks imports every pubtools task library, which can make up a
+large part of a task's startup time and memory usage. This module makes it
+possible to find out which libraries are responsible.
+
+If the ``PUBTOOLS_IMPORT_PROFILE`` environment variable is set to ``true``,
+each entry point loaded while resolving hooks is measured for:
+
+- wall time and CPU time spent importing it
+- change in resident set size (RSS)
+- change in memory allocated by Python, as seen by tracemalloc
+
+Additionally, each module imported (directly or transitively) while loading
+an entry point is timed individually, similar to ``python -X importtime``.
+An entry point loaded while importing another, such as a lazily loaded hook
+module, is reported beneath the entry point importing it.
+
+A report sorted by wall time is logged when the task context exits and, if
+tracing is enabled, the same data is recorded as attributes of an
+``import_profile`` span.
+"""
+
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+LOG = logging.getLogger("pubtools")
+
+# Number of modules listed per entry point in the report.
+TOP_MODULES = 10
+
+_PROFILER = None
+
+
+def enabled():
+    # Whether import profiling was requested.
+    return os.getenv("PUBTOOLS_IMPORT_PROFILE", "").lower() == "true"
+
+
+def _rss():
+    # Current resident set size in bytes.
+    try:
+        with open("/proc/self/statm", "rt") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):  # pragma: no cover
+        # Not Linux; best we can do is the peak RSS.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ModuleTiming(object):
+    # Timing of a single module imported while loading an entry point.
+
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.children_wall = 0.0
+        self.alloc = 0
+
+    @property
+    def self_wall(self):
+        return self.wall - self.children_wall
+
+
+class EntryPointProfile(object):
+    # Measurements for the loading of a single entry point.
+
+    def __init__(self, ep):
+        self.ep = ep
+        self.start_ns = 0
+        self.end_ns = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rss = 0
+        self.alloc = 0
+        self.modules = []
+        # Entry points loaded while this one was being imported.
+        self.children = []
+
+    def top_modules(self, count=TOP_MODULES):
+        return sorted(self.modules, key=lambda m: m.self_wall, reverse=True)[:count]
+
+    def walk(self):
+        # This profile, followed by those of all entry points it loaded.
+        yield self
+        for child in self.children:
+            for profile in child.walk():
+                yield profile
+
+
+class _ProfilingLoader(object):
+    # Wraps a loader to time module execution.
+    #
+    # The wrapper only exists while a module is being imported; it puts the
+    # original loader back onto the module before executing it, so nothing
+    # else can observe the wrapper.
+
+    def __init__(self, loader, profiler):
+        self.loader = loader
+        self.profiler = profiler
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__loader__ = self.loader
+        if getattr(module, "__spec__", None) is not None:
+            module.__spec__.loader = self.loader
+
+        self.profiler.module_started(module.__name__)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler.module_finished()
+
+
+class _ProfilingFinder(object):
+    # A meta path finder which delegates to all other finders, wrapping
+    # the resulting loader to time module execution.
+    #
+    # It's installed once per profiler, and only wraps loaders for imports
+    # done by a thread which is loading an entry point.
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def find_spec(self, fullname, path, target=None):
+        if not self.profiler.profiling():
+            return None
+
+        for finder in sys.meta_path:
+            if finder is self:
+                continue
+            find_spec = getattr(finder, "find_spec", None)
+            if find_spec is None:  # pragma: no cover
+                continue
+            spec = find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if hasattr(spec.loader, "exec_module"):
+            spec.loader = _ProfilingLoader(spec.loader, self.profiler)
+        return spec
+
+
+class ImportProfiler(object):
+    """Collects import measurements for loaded entry points.
+
+    Entry points may be loaded by several threads at once, and an entry point
+    may be loaded while importing another (e.g. by a lazily loaded hook),
+    in which case it's profiled as a child of the other.
+    """
+
+    def __init__(self):
+        self.results = []
+        self._lock = threading.Lock()
+        self._finder = None
+        # Number of entry points being loaded, by all threads.
+        self._loading = 0
+        self._started_tracemalloc = False
+        # Stacks of entry points and modules being loaded by each thread.
+        self._local = threading.local()
+
+    def _stacks(self):
+        local = self._local
+        if not hasattr(local, "profiles"):
+            local.profiles = []
+            local.modules = []
+        return local.profiles, local.modules
+
+    def profiling(self):
+        """Whether the current thread is loading an entry point."""
+        return bool(self._stacks()[0])
+
+    def module_started(self, name):
+        profiles, modules = self._stacks()
+        timing = ModuleTiming(name)
+        profiles[-1].modules.append(timing)
+        modules.append((timing, time.perf_counter(), self._traced()))
+
+    def module_finished(self):
+        _, modules = self._stacks()
+        timing, start, start_alloc = modules.pop()
+        timing.wall = time.perf_counter() - start
+        timing.alloc = self._traced() - start_alloc
+        if modules:
+            modules[-1][0].children_wall += timing.wall
+
+    @staticmethod
+    def _traced():
+        return tracemalloc.get_traced_memory()[0]
+
+    def _started(self):
+        with self._lock:
+            if self._finder is None:
+                self._finder = _ProfilingFinder(self)
+                sys.meta_path.insert(0, self._finder)
+            if not self._loading and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            self._loading += 1
+
+    def _finished(self, profile, parent):
+        with self._lock:
+            self._loading -= 1
+            if not self._loading and self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+            if parent is None:
+                self.results.append(profile)
+            else:
+                parent.children.append(profile)
+
+    def load(self, ep):
+        """Load an entry point, recording measurements of the import."""
+        if ep.module in sys.modules:
+            # Nothing to measure, it's already been imported.
+            return ep.load()
+
+        profiles, _ = self._stacks()
+        parent = profiles[-1] if profiles else None
+        profile = EntryPointProfile(ep)
+        self._started()
+        profiles.append(profile)
+
+        profile.start_ns = time.time_ns()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        start_rss = _rss()
+        start_alloc = self._traced()
+        try:
+            return ep.load()
+        finally:
+            profile.wall = time.perf_counter() - start_wall
+            profile.cpu = time.process_time() - start_cpu
+            profile.rss = _rss() - start_rss
+            profile.alloc = self._traced() - start_alloc
+            profile.end_ns = time.time_ns()
+
+            profiles.pop()
+            self._finished(profile, parent)
+
+    def report(self):
+        """Log a report of all measurements and forget them."""
+        with self._lock:
+            results = sorted(self.results, key=lambda p: p.wall, reverse=True)
+            self.results = []
+        if not results:
+            return
+
+        lines = ["Import profile for resolved hooks (sorted by wall time):"]
+        for profile in results:
+            self._report_lines(profile, "  ", lines)
+        LOG.info("\n".join(lines))
+
+        _record_span(results)
+
+    def _report_lines(self, profile, indent, lines):
+        lines.append(
+            "%s%s: wall %.1f ms, cpu %.1f ms, rss %+.1f KiB, alloc %+.1f KiB"
+            % (
+                indent,
+                profile.ep,
+                profile.wall * 1000,
+                profile.cpu * 1000,
+                profile.rss / 1024,
+                profile.alloc / 1024,
+            )
+        )
+        for timing in profile.top_modules():
+            lines.append(
+                "%s  %s: self %.1f ms, total %.1f ms, alloc %+.1f KiB"
+                % (
+                    indent,
+                    timing.name,
+                    timing.self_wall * 1000,
+                    timing.wall * 1000,
+                    timing.alloc / 1024,
+                )
+            )
+        # Entry points loaded while importing this one are listed beneath it.
+        for child in profile.children:
+            self._report_lines(child, indent + "  ", lines)
+
+
+def _record_span(results):
+    # Record measurements as span attributes, if tracing is enabled.
+    from pubtools._impl.tracing import get_trace_wrapper
+
+    provider = get_trace_wrapper().provider
+    if provider is None:
+        return
+
+    attributes = {}
+    for profile in [p for result in results for p in result.walk()]:
+        prefix = "import.%s." % profile.ep.name
+        attributes[prefix + "module"] = profile.ep.module
+        attributes[prefix + "wall_ms"] = profile.wall * 1000
+        attributes[prefix + "cpu_ms"] = profile.cpu * 1000
+        attributes[prefix + "rss_bytes"] = profile.rss
+        attributes[prefix + "alloc_bytes"] = profile.alloc
+        attributes[prefix + "top_modules"] = [
+            "%s=%.1fms" % (timing.name, timing.self_wall * 1000)
+            for timing in profile.top_modules()
+        ]
+
+    span = provider.get_tracer(__name__).start_span(
+        "import_profile",
+        start_time=min(p.start_ns for p in results),
+        attributes=attributes,
+    )
+    span.end(end_time=max(p.end_ns for p in results))
+
+
+def load(ep):
+    """Load an entry point, profiling the import if enabled.
+
+    :param ep: The entry point to be loaded.
+    :return: The loaded object.
+    """
+    global _PROFILER
+    if not enabled():
+        return ep.load()
+
+    if _PROFILER is None:
+        _PROFILER = ImportProfiler()
+    return _PROFILER.load(ep)
+
+
+def report():
+    """Log (and forget) any collected import measurements.
+
+    Errors are logged rather than raised, as profiling must not be able to
+    break a task.
+    """
+    if _PROFILER is None:
+        return
+
+    try:
+        _PROFILER.report()
+    except Exception:  # pylint: disable=broad-except
+        LOG.warning("Failed to report import profile", exc_info=True)
@@ -0,0 +1,102 @@
+"""Support for importing hook modules on demand.
+
+By default, resolving hooks imports every pubtools task library in order to
+find hookspecs and hookimpls. Libraries may instead declare which hooks they
+define through entry points in the ``pubtools.lazy_hooks`` group, where the
+name of each entry point is a hook name and the value is the module defining
+that hook:
+
+.. code-block:: python
+
+    entry_points={
+      "pubtools.lazy_hooks": [
+          "kettle_on = pubtools._foo.hooks",
+          "kettle_off = pubtools._foo.hooks",
+      ]
+    },
+
+When lazy mode is enabled, such modules are not imported during hook
+resolution. Instead, each module is imported the first time one of the
+declared hooks is looked up via ``pm.hook.<name>``.
+"""
+
+import logging
+import sys
+import threading
+
+from pubtools._impl import importprof
+
+LOG = logging.getLogger("pubtools")
+
+GROUP = "pubtools.lazy_hooks"
+
+# Hook name => list of entry points to be loaded when that hook is
+# first looked up.
+_PENDING = {}
+_LOCK = threading.RLock()
+
+
+def _load(name):
+    with _LOCK:
+        eps = _PENDING.get(name)
+        if not eps:
+            # Either loaded by another thread while we were waiting for the
+            # lock, or being loaded right now by this thread.
+            return
+
+        # Leave an empty placeholder while loading, so that other threads
+        # keep waiting on the lock until the hook is fully loaded.
+        _PENDING[name] = []
+        try:
+            for ep in eps:
+                importprof.load(ep)
+                LOG.debug("Resolved %s on demand", ep)
+        finally:
+            del _PENDING[name]
+
+
+def install(pm):
+    """Enable on-demand loading of hooks for a plugin manager.
+
+    :param pm: The plugin manager whose ``hook`` attribute should load pending
+               hook modules on lookup.
+    :type pm: pluggy.PluginManager
+    """
+    relay_class = type(pm.hook)
+    if not getattr(relay_class, "_pubtools_lazy", False):
+        # The subclass has an identical layout to pluggy's HookRelay, so that the
+        # existing instance (already referenced by all HookCallers) can simply
+        # have its class reassigned.
+        pm.hook.__class__ = type(
+            "Lazy" + relay_class.__name__,
+            (relay_class,),
+            {
+                "__slots__": (),
+                "__getattribute__": _relay_getattribute,
+                "_pubtools_lazy": True,
+            },
+        )
+
+
+def defer(ep):
+    """Arrange for an entry point to be loaded when its hook is first looked up.
+
+    :param ep: An entry point from the ``pubtools.lazy_hooks`` group.
+    """
+    if ep.module in sys.modules:
+        # Already imported by someone, nothing to defer.
+        return
+
+    with _LOCK:
+        pending = _PENDING.setdefault(ep.name, [])
+        if ep not in pending:
+            pending.append(ep)
+            LOG.debug("Deferred %s", ep)
+
+
+def _relay_getattribute(self, name):
+    # Every pm.hook.<name> lookup goes through here once installed, so this
+    # must be as cheap as possible in the common case of nothing pending.
+    if name in _PENDING:
+        _load(name)
+    return object.__getattribute__(self, name)
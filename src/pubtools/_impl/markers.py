@@ -0,0 +1,78 @@
+"""Hookspec and hookimpl decorators accepting pubtools-specific options.
+
+Options are stored alongside pluggy's own, so they're available from
+``HookCaller.spec.opts`` and ``HookImpl.opts`` once hooks are registered.
+"""
+
+import pluggy
+
+from pubtools._impl.hookcache import CACHE_SCOPES
+
+
+class HookspecMarker(pluggy.HookspecMarker):
+    """A hookspec decorator additionally accepting cache and dispatch options.
+
+    :param cache: ``"task"`` to memoize results of a ``firstresult`` hook
+                  within a task context.
+    :param cache_ttl: Maximum age of memoized results, in seconds.
+    :param concurrent: True if all hookimpls of a task lifecycle hook may be
+                       run concurrently.
+    """
+
+    __slots__ = ()
+
+    def __call__(
+        self,
+        function=None,
+        firstresult=False,
+        cache=None,
+        cache_ttl=None,
+        concurrent=False,
+        **kwargs
+    ):
+        if cache is not None and cache not in CACHE_SCOPES:
+            raise ValueError("Unknown hook cache scope: %s" % cache)
+        if cache and not firstresult:
+            raise ValueError("Only firstresult hooks can be cached")
+        if concurrent and firstresult:
+            raise ValueError("firstresult hooks can't be run concurrently")
+
+        mark = super().__call__(firstresult=firstresult, **kwargs)
+
+        def setattr_hookspec_opts(func):
+            func = mark(func)
+            opts = getattr(func, self.project_name + "_spec")
+            opts["cache"] = cache
+            opts["cache_ttl"] = cache_ttl
+            opts["concurrent"] = concurrent
+            return func
+
+        if function is not None:
+            return setattr_hookspec_opts(function)
+        return setattr_hookspec_opts
+
+
+class HookimplMarker(pluggy.HookimplMarker):
+    """A hookimpl decorator additionally accepting dispatch options.
+
+    :param concurrent: True if this hookimpl of a task lifecycle hook may be run
+                       concurrently with other hookimpls.
+    """
+
+    __slots__ = ()
+
+    def __call__(self, function=None, concurrent=False, **kwargs):
+        if concurrent and (kwargs.get("hookwrapper") or kwargs.get("wrapper")):
+            raise ValueError("Hook wrappers can't be run concurrently")
+
+        mark = super().__call__(**kwargs)
+
+        def setattr_hookimpl_opts(func):
+            func = mark(func)
+            opts = getattr(func, self.project_name + "_impl")
+            opts["concurrent"] = concurrent
+            return func
+
+        if function is not None:
+            return setattr_hookimpl_opts(function)
+        return setattr_hookimpl_opts
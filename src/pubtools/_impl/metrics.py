@@ -0,0 +1,170 @@
+"""Record OTEL metrics.
+
+Usage:
+    items_pushed = get_metrics_wrapper().counter("pubtools.push.items")
+    ...
+    items_pushed.add(len(items), {"target": target})
+
+"""
+
+import logging
+import os
+
+from pubtools._impl import envconfig, tracing
+from pubtools.pluggy import hookimpl, pm
+
+METRICS_WRAPPER = None
+log = logging.getLogger(__name__)
+
+
+def get_metrics_wrapper():
+    """return a global metrics wrapper instance"""
+    global METRICS_WRAPPER
+    if METRICS_WRAPPER is None:
+        METRICS_WRAPPER = MetricsWrapper()
+    return METRICS_WRAPPER
+
+
+class NoopInstrument:
+    """An instrument recording nothing, provided while metrics are disabled."""
+
+    def add(self, amount, attributes=None):
+        pass
+
+    def record(self, amount, attributes=None):
+        pass
+
+
+NOOP_INSTRUMENT = NoopInstrument()
+
+
+class MetricsWrapper:
+    """Wrapper class to initialize opentelemetry metrics and provide instruments
+    for recording measurements"""
+
+    def __init__(self):
+        self._provider = None
+        self._meter = None
+        self._enabled_metrics = None
+        self._instruments = {}
+        self._reset()
+
+    def _reset(self):
+        # Construct the needed resources, if and only if OTEL_METRICS is enabled
+        # and the resources were not already constructed.
+        #
+        # As with TracingWrapper._reset, this is intended only for use during tests;
+        # the global meter provider can't be set up more than once in a process.
+        requested = os.getenv("OTEL_METRICS", "").lower() == "true"
+        available = tracing.OPENTELEMETRY_AVAILABLE
+        self._enabled_metrics = requested and available
+        # Instruments may be no-ops from when metrics were disabled.
+        self._instruments = {}
+        if requested and not available:
+            log.debug(
+                "Metrics are enabled but the open telemetry package is "
+                "unavailable. Metrics functionality will be disabled."
+            )
+        if self._enabled_metrics and not self._provider:
+            # Importing the SDK is slow, so it's only done once metrics are enabled.
+            # pylint: disable=import-outside-toplevel
+            from opentelemetry import metrics
+            from opentelemetry.sdk.metrics import MeterProvider
+            from opentelemetry.sdk.metrics.export import (
+                ConsoleMetricExporter,
+                PeriodicExportingMetricReader,
+            )
+            from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+
+            log.info("Creating MetricsWrapper instance")
+            exporter = pm.hook.otel_metric_exporter() or ConsoleMetricExporter()
+            # Export interval is configured by OTEL_METRIC_EXPORT_INTERVAL.
+            reader = PeriodicExportingMetricReader(exporter)
+            self._provider = MeterProvider(
+                metric_readers=[reader],
+                resource=Resource.create(
+                    {SERVICE_NAME: os.getenv("OTEL_SERVICE_NAME")}
+                ),
+            )
+            metrics.set_meter_provider(self._provider)
+            self._meter = self._provider.get_meter("pubtools")
+            # Metrics are flushed at the end of each task.
+            pm.register(self)
+
+    def _instrument(self, kind, name, unit, description):
+        key = (kind, name)
+        instrument = self._instruments.get(key)
+        if instrument is None:
+            if self._enabled_metrics:
+                create = getattr(self._meter, "create_" + kind)
+                instrument = create(name, unit=unit, description=description)
+            else:
+                instrument = NOOP_INSTRUMENT
+            self._instruments[key] = instrument
+        return instrument
+
+    def counter(self, name, unit="", description=""):
+        """Get a counter, for amounts which only increase.
+
+        Args:
+            name: str
+                Name of the counter, e.g. ``pubtools.push.items``.
+            unit: str
+                Unit of the amounts, e.g. ``By`` for bytes.
+            description: str
+                Description of the counter.
+
+        Returns:
+            An instrument with an ``add(amount, attributes=None)`` method. The same
+            instrument is returned for the same name. If metrics are disabled,
+            the instrument does nothing.
+        """
+        return self._instrument("counter", name, unit, description)
+
+    def up_down_counter(self, name, unit="", description=""):
+        """Get a counter for amounts which may increase or decrease, e.g. the
+        number of items in progress.
+
+        Arguments and return value are as for :meth:`counter`.
+        """
+        return self._instrument("up_down_counter", name, unit, description)
+
+    def histogram(self, name, unit="", description=""):
+        """Get a histogram, for distributions of values such as durations.
+
+        Arguments are as for :meth:`counter`.
+
+        Returns:
+            An instrument with a ``record(amount, attributes=None)`` method. The
+            same instrument is returned for the same name. If metrics are disabled,
+            the instrument does nothing.
+        """
+        return self._instrument("histogram", name, unit, description)
+
+    def force_flush(self, timeout=None):
+        """Export all recorded metrics.
+
+        Args:
+            timeout: float
+                Maximum time to wait, in seconds; 30 by default.
+
+        Returns:
+            False if metrics were not exported before the timeout, True otherwise.
+        """
+        if not self._provider:
+            return True
+        timeout = 30 if timeout is None else timeout
+        return self._provider.force_flush(timeout_millis=timeout * 1000)
+
+    @hookimpl(trylast=True)
+    def task_stop(self, failed):
+        # Metrics are otherwise only exported periodically, which a short task
+        # may not last long enough for.
+        timeout = envconfig.number("OTEL_METRICS_FLUSH_TIMEOUT", 30.0, minimum=0.0)
+        if not self.force_flush(timeout):
+            log.warning("Flushing metrics timed out after %s seconds", timeout)
+
+    @property
+    def provider(self):
+        """Meter provider"""
+        return self._provider
@@ -1,43 +1,93 @@
 import logging
+import os
 import sys
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 
 if sys.version_info >= (3, 10):
     from importlib.metadata import entry_points
 else:  # pragma: no cover
     # for older python use non-standard compatible module
     from importlib_metadata import entry_points
-import pluggy
+
+from pubtools._impl import (
+    asynchooks,
+    epcache,
+    hookcache,
+    hookdispatch,
+    hookstats,
+    importprof,
+    lazyhooks,
+    markers,
+    taskscope,
+)
 
 LOG = logging.getLogger("pubtools")
 
-pm = pluggy.PluginManager("pubtools")
-hookspec = pluggy.HookspecMarker("pubtools")
-hookimpl = pluggy.HookimplMarker("pubtools")
+pm = taskscope.PluginManager("pubtools")
+hookspec = markers.HookspecMarker("pubtools")
+hookimpl = markers.HookimplMarker("pubtools")
+hook_cache = hookcache.HookCache(pm)
+ahook = asynchooks.AsyncHookRelay(pm)
 
 
-def resolve_hooks():
-    # A private helper to ensure all code defining hookspecs/hookimpls has been imported
-    # before continuing.
+def _scan_entry_points():
+    # A private helper to find all entry points which should be loaded by
+    # resolve_hooks, by a full scan of installed distributions.
 
-    # 1. Eagerly load any pubtools console_scripts entry points.
+    # 1. Any pubtools console_scripts entry points.
     #
     # This will pick up hookspecs from task libraries such as pubtools-quay.
+    # pubtools' own commands (pubtools-runner, pubtools-trace) are not tasks
+    # and define no hooks, so they're skipped.
     #
     for ep in entry_points(group="console_scripts"):
-        if ep.module.startswith("pubtools"):
-            # importlib.metadata only has load()
-            ep.load()
-            LOG.debug("Resolved %s", ep)
+        if ep.module.startswith("pubtools") and not ep.module.startswith(
+            "pubtools._impl."
+        ):
+            yield ep
 
-    # 2. Eagerly load any pubtools.hooks entry points.
+    # 2. Any pubtools.hooks entry points.
     #
     # This is a group we provide so that any hook-only modules, which might otherwise
     # not be imported by anyone, can request themselves to be imported.
     #
-    for ep in entry_points(group="pubtools.hooks"):
-        ep.load()
-        LOG.debug("Resolved %s", ep)
+    yield from entry_points(group="pubtools.hooks")
+
+    # 3. Any pubtools.lazy_hooks entry points.
+    #
+    # These declare the hooks defined by each module, so that the module may
+    # be imported only once one of those hooks is used.
+    #
+    yield from entry_points(group=lazyhooks.GROUP)
+
+
+def resolve_hooks():
+    # A private helper to ensure all code defining hookspecs/hookimpls has been imported
+    # before continuing.
+    #
+    # The full scan of installed distributions is slow, so entry points are found via
+    # an index which is persisted on disk and memoized in-process.
+    entries = epcache.get_entry_points(_scan_entry_points)
+
+    # In lazy mode, nothing is imported from distributions which have declared their
+    # hooks; their modules are instead imported when those hooks are first looked up.
+    lazy = os.getenv("PUBTOOLS_LAZY_HOOKS", "").lower() == "true"
+    lazy_dists = set()
+    if lazy:
+        lazyhooks.install(pm)
+        lazy_dists = set(
+            dist for (ep, dist) in entries if ep.group == lazyhooks.GROUP and dist
+        )
+
+    for ep, dist in entries:
+        if lazy and ep.group == lazyhooks.GROUP:
+            lazyhooks.defer(ep)
+        elif dist in lazy_dists:
+            LOG.debug("Skipped %s, hooks are declared by %s", ep, dist)
+        else:
+            # importlib.metadata only has load()
+            importprof.load(ep)
+            LOG.debug("Resolved %s", ep)
 
 
 @hookspec
@@ -45,7 +95,9 @@ def task_start():
     """Called when a task starts.
 
     This hook can be used to register additional hook implementations with
-    desired context.
+    desired context. Registering them with ``pm.register(plugin, scope="task")``
+    makes them visible only within the current task context, so that tasks may
+    run concurrently within a process; see :ref:`task-scoped plugins <task_scope>`.
     """
 
 
@@ -54,7 +106,8 @@ def task_stop(failed):
     """Called when a task ends.
 
     If :func:`task_start` was used to register additional hook implementations,
-    this hook should be used to unregister them.
+    this hook should be used to unregister them. (Those registered within the
+    task scope are unregistered automatically once the task context exits.)
 
     :param failed: True if the task is failing (i.e. exiting with non-zero exit code, or
                    raising an exception).
@@ -78,10 +131,39 @@ def task_context():
     * hookspecs/hookimpls are resolved across all installed libraries.
     * :func:`task_start` is invoked when the block is entered.
     * :func:`task_stop` is invoked when the block is exited.
+
+    If the ``PUBTOOLS_IMPORT_PROFILE`` environment variable is set to ``true``,
+    a report of the time and memory spent importing each resolved entry point
+    is logged when the block is exited.
+
+    If the ``PUBTOOLS_HOOK_STATS`` environment variable is set to ``true``,
+    a report of the latency of hook calls, per hook and per implementing plugin,
+    is logged when the block is exited.
+
+    Within the block, results of hooks declared with ``cache="task"`` are
+    memoized; see :ref:`hook caching <hook_caching>`.
+
+    Hookimpls of :func:`task_start` and :func:`task_stop` declared with
+    ``concurrent=True`` are run concurrently on a thread pool; see
+    :ref:`concurrent hookimpls <concurrent_hookimpls>`.
+
+    Plugins registered with ``scope="task"`` within the block are visible only
+    within the block's context, and are forgotten when it exits; see
+    :ref:`task-scoped plugins <task_scope>`.
     """
     resolve_hooks()
 
-    pm.hook.task_start()
+    if hookstats.enabled():
+        hookstats.install(pm)
+
+    scope = taskscope.enter()
+    hook_cache.task_started()
+    try:
+        hookdispatch.call(pm, "task_start")
+    except BaseException:
+        hook_cache.task_stopped()
+        taskscope.leave(scope)
+        raise
 
     failed = True
     try:
@@ -94,10 +176,84 @@ def task_context():
         failed = True
         raise
     finally:
-        pm.hook.task_stop(failed=failed)
+        try:
+            hookdispatch.call(pm, "task_stop", failed=failed)
+        finally:
+            hook_cache.task_stopped()
+            hookstats.report()
+            taskscope.leave(scope)
+            importprof.report()
+
+
+@asynccontextmanager
+async def async_task_context():
+    """Run a block of asyncio code within a task context, ensuring task lifecycle
+    hooks are invoked when appropriate.
+
+    This is the equivalent of :func:`task_context` for asyncio task libraries.
+    It can be used in an ``async with`` statement, as in example:
+
+    >>> async with async_task_context():
+    >>>    await self.do_task()
+
+    Lifecycle hooks are called via :data:`ahook`, so ``async def`` hookimpls
+    of :func:`task_start` and :func:`task_stop` are awaited concurrently, while
+    synchronous hookimpls are called in a thread so as not to block the event
+    loop. Hooks are also resolved in a thread.
+    """
+    await asynchooks.run_in_executor(resolve_hooks)
 
+    if hookstats.enabled():
+        hookstats.install(pm)
 
-@hookspec(firstresult=True)
+    scope = taskscope.enter()
+    hook_cache.task_started()
+    try:
+        await ahook.task_start()
+    except BaseException:
+        hook_cache.task_stopped()
+        taskscope.leave(scope)
+        raise
+
+    failed = True
+    try:
+        yield
+        failed = False
+    except SystemExit as exit:
+        failed = exit.code != 0
+        raise
+    except Exception:
+        failed = True
+        raise
+    finally:
+        try:
+            await ahook.task_stop(failed=failed)
+        finally:
+            hook_cache.task_stopped()
+            hookstats.report()
+            taskscope.leave(scope)
+            importprof.report()
+
+
+def hook_stats():
+    """Get latency statistics of hook calls in the current task.
+
+    Statistics are only collected if the ``PUBTOOLS_HOOK_STATS`` environment
+    variable is set to ``true``. Each task, including a nested task, has
+    statistics of its own, which are forgotten after being reported at the end
+    of its :func:`task_context`.
+
+    :return: A dict with an entry per hook called, holding ``count``, ``sum``,
+             ``min``, ``max``, ``mean``, ``p50``, ``p90`` and ``p99`` of the
+             latencies of calls in seconds, and an ``impls`` dict holding the
+             same for each plugin implementing the hook. None if statistics are
+             not being collected.
+    :rtype: dict
+    """
+    return hookstats.stats()
+
+
+@hookspec(firstresult=True, cache="task", cache_ttl=300)
 def get_cert_key_paths(server_url):
     """Get location of SSL certificates used to authenticate with a given service.
 
@@ -109,6 +265,10 @@ def get_cert_key_paths(server_url):
     to be the same. Callers of this hook should be prepared to receive no result, and should
     implement a reasonable fallback strategy in that case.
 
+    Within a task context, results are memoized per ``server_url`` until the task stops,
+    for at most 5 minutes, so credentials rotated during a task may be picked up by the
+    task up to 5 minutes later.
+
     :param server_url: Service URL.
     :type server_url: str
     :return: Paths to SSL certificate and key.
@@ -128,4 +288,47 @@ def otel_exporter():
     """
 
 
+@hookspec(firstresult=True)
+def otel_metric_exporter():
+    """Return an OTEL metric exporter, used by OTEL metrics.
+
+    If OTEL metrics are enabled and this hook is not implemented, a default
+    `ConsoleMetricExporter` will be used.
+
+    :return: Instance of MetricExporter.
+    :rtype: opentelemetry.sdk.metrics.export.MetricExporter
+    """
+
+
+@hookspec(firstresult=True)
+def otel_sampler():
+    """Return an OTEL sampler, used by OTEL instrumentation to decide which spans
+    are sampled.
+
+    If OTEL tracing is enabled and this hook is not implemented, a sampler
+    configured by the ``OTEL_TRACING_SAMPLE_RATIO`` environment variable is used.
+    In either case, rate limits and overrides configured by other environment
+    variables are applied on top of the returned sampler.
+
+    :return: Instance of Sampler.
+    :rtype: opentelemetry.sdk.trace.sampling.Sampler
+    """
+
+
+@hookspec(firstresult=True)
+def otel_batch_options():
+    """Return options for the processor exporting spans in batches, used by OTEL
+    instrumentation.
+
+    Any options returned override those configured by the ``OTEL_BSP_*`` and
+    ``OTEL_TRACING_QUEUE_*`` environment variables. Supported options are
+    ``max_queue_size``, ``max_export_batch_size``, ``schedule_delay_millis``,
+    ``policy`` (one of ``"drop_newest"``, ``"drop_oldest"`` or ``"block"``) and
+    ``block_timeout_millis``.
+
+    :return: Options for the batch span processor.
+    :rtype: dict
+    """
+
+
 pm.add_hookspecs(sys.modules[__name__])
@@ -0,0 +1,262 @@
+"""A pre-fork runner for hosting pubtools tasks.
+
+Every task invoked in a fresh process pays the full cost of importing task
+libraries and resolving hooks. This runner pays that cost once: it imports all
+pubtools entry points in a parent process, freezes the garbage collector so
+imported objects stay shared copy-on-write, then forks a child process per task.
+
+Tasks are requested by writing JSON objects, one per line, to the runner's
+standard input:
+
+.. code-block:: json
+
+    {"id": "task-1", "entry_point": "pubtools-foo-bar", "args": ["--baz"],
+     "env": {"MALLOC_ARENA_MAX": "2"}}
+
+``id`` is an arbitrary identifier echoed in responses; ``args`` and ``env``
+are optional. Each child applies ``env`` on top of the runner's environment,
+sets ``sys.argv`` and calls the entry point, just as its console script would.
+The task library's own :func:`task_context` then applies as usual (which,
+among other things, re-applies malloc tunables from the task's environment).
+Only entry points of task libraries are offered; pubtools' own commands are
+not.
+
+For each request, a JSON line is written to standard output once the task
+completes:
+
+.. code-block:: json
+
+    {"id": "task-1", "pid": 1234, "exit_code": 0}
+
+``exit_code`` is negative if the child was killed by a signal. Requests which
+can't be started result in a response with an ``error`` field instead.
+Standard output of tasks is redirected to standard error, so that standard
+output only carries responses.
+
+The runner exits once standard input is closed and all tasks have completed.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import selectors
+import signal
+import sys
+import traceback
+from collections import deque
+
+from pubtools._impl import epcache
+from pubtools._impl.pluggy import _scan_entry_points, resolve_hooks
+
+LOG = logging.getLogger("pubtools")
+
+
+def _exit_code(code):
+    # Convert a SystemExit code (or console_scripts return value) into an
+    # exit status, the same way the interpreter would.
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _run_child(func, name, request):  # pragma: no cover
+    # Runs a task in a forked child process; never returns.
+    #
+    # (Not visible to coverage since it only runs after fork.)
+    code = 1
+    try:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+        # stdin/stdout belong to the runner's protocol
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.close(devnull)
+        os.dup2(2, 1)
+
+        os.environ.update(request.get("env") or {})
+        sys.argv = [name] + list(request.get("args") or [])
+
+        # Task libraries enter their own task_context, so the entry point is
+        # called as it would be from its console script.
+        try:
+            code = _exit_code(func())
+        except SystemExit as exit:
+            code = _exit_code(exit.code)
+    except BaseException:  # pylint: disable=broad-except
+        traceback.print_exc()
+        code = 1
+    finally:
+        try:
+            logging.shutdown()
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+class Runner(object):
+    """Runs tasks in processes forked from a warm parent.
+
+    :param entry_points: Mapping from entry point name to loaded callable.
+    :type entry_points: dict
+    :param max_tasks: Maximum number of tasks to run concurrently; further requests
+                      are queued.
+    :type max_tasks: int
+    :param infd: File descriptor from which requests are read.
+    :param outfd: File descriptor to which responses are written.
+    """
+
+    def __init__(self, entry_points, max_tasks=None, infd=0, outfd=1):
+        self.entry_points = entry_points
+        self.max_tasks = max_tasks or os.cpu_count() or 1
+        self.infd = infd
+        self.outfd = outfd
+        self._running = {}
+        self._queue = deque()
+        self._buffer = b""
+
+    @classmethod
+    def warm(cls, **kwargs):
+        """Create a runner after importing all pubtools entry points.
+
+        All pubtools ``console_scripts`` entry points and hooks are loaded,
+        then the garbage collector is frozen so that the loaded objects are
+        shared with children rather than copied.
+        """
+        resolve_hooks()
+
+        entry_points = {}
+        for ep, _ in epcache.get_entry_points(_scan_entry_points):
+            if ep.group == "console_scripts":
+                entry_points[ep.name] = ep.load()
+        LOG.debug("Runner loaded %s entry points", len(entry_points))
+
+        gc.collect()
+        gc.freeze()
+
+        return cls(entry_points, **kwargs)
+
+    def _respond(self, response):
+        data = (json.dumps(response) + "\n").encode("utf-8")
+        while data:
+            written = os.write(self.outfd, data)
+            data = data[written:]
+
+    def _start(self, request):
+        name = request.get("entry_point")
+        func = self.entry_points.get(name)
+        if func is None:
+            self._respond(
+                {"id": request.get("id"), "error": "unknown entry point: %s" % name}
+            )
+            return
+
+        # Any objects allocated since the last freeze would otherwise be
+        # written to (and hence copied) by the child's garbage collector.
+        gc.freeze()
+
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            _run_child(func, name, request)
+
+        LOG.debug("Started %s as pid %s", name, pid)
+        self._running[pid] = request
+
+    def _submit(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be an object")
+        except ValueError as error:
+            self._respond({"id": None, "error": "bad request: %s" % error})
+            return
+
+        self._queue.append(request)
+
+    def _read_requests(self):
+        # Returns False on EOF.
+        data = os.read(self.infd, 65536)
+        if not data:
+            if self._buffer.strip():
+                self._submit(self._buffer)
+            self._buffer = b""
+            return False
+
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            if line.strip():
+                self._submit(line)
+        return True
+
+    def _reap(self):
+        # Only children forked by the runner are waited for, as tasks may
+        # have been started by something else sharing the process.
+        for pid in list(self._running):
+            pid, status = os.waitpid(pid, os.WNOHANG)
+            if pid == 0:
+                continue
+            request = self._running.pop(pid)
+            if os.WIFSIGNALED(status):
+                code = -os.WTERMSIG(status)
+            else:
+                code = os.WEXITSTATUS(status)
+            self._respond({"id": request.get("id"), "pid": pid, "exit_code": code})
+
+    def _start_queued(self):
+        while self._queue and len(self._running) < self.max_tasks:
+            self._start(self._queue.popleft())
+
+    def serve(self):
+        """Serve requests until input is closed and all tasks have completed."""
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_w, False)
+        old_wakeup = signal.set_wakeup_fd(wakeup_w)
+        # A handler must be installed for SIGCHLD to reach the wakeup fd.
+        old_handler = signal.signal(signal.SIGCHLD, lambda *_: None)
+
+        selector = selectors.DefaultSelector()
+        selector.register(wakeup_r, selectors.EVENT_READ, "wakeup")
+        selector.register(self.infd, selectors.EVENT_READ, "input")
+        reading = True
+
+        try:
+            while reading or self._queue or self._running:
+                self._reap()
+                self._start_queued()
+                if not (reading or self._queue or self._running):
+                    break
+
+                for key, _ in selector.select():
+                    if key.data == "wakeup":
+                        os.read(wakeup_r, 4096)
+                    elif not self._read_requests():
+                        selector.unregister(self.infd)
+                        reading = False
+        finally:
+            selector.close()
+            signal.signal(signal.SIGCHLD, old_handler)
+            signal.set_wakeup_fd(old_wakeup)
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+
+
+def entry_point(args=None):
+    parser = argparse.ArgumentParser(
+        description="Run pubtools tasks in processes forked from a warm parent",
+    )
+    parser.add_argument(
+        "--max-tasks",
+        type=int,
+        default=None,
+        help="maximum number of concurrent tasks (default: number of CPUs)",
+    )
+    parsed = parser.parse_args(args)
+
+    Runner.warm(max_tasks=parsed.max_tasks).serve()
@@ -0,0 +1,172 @@
+"""Head sampling of spans created by the tracing wrapper.
+
+By default, every span is sampled. The following environment variables may be
+used to reduce the number of exported spans:
+
+- ``OTEL_TRACING_SAMPLE_RATIO``: ratio of root spans to be sampled, between 0 and 1.
+  Child spans follow the decision made for their parent.
+- ``OTEL_TRACING_RATE_LIMIT``: maximum number of sampled spans per second, per span
+  name. Either a single number applied to every span name, or a comma-separated list
+  of ``name=limit`` pairs, where the name ``*`` sets the limit for any other names.
+- ``OTEL_TRACING_ALWAYS_SAMPLE``: comma-separated list of span names which should
+  always be sampled, regardless of the above.
+
+Invalid values are ignored with a warning.
+
+The ``otel_sampler`` hook may be implemented to replace the ratio-based sampler;
+rate limits and overrides still apply on top of it.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from opentelemetry.sdk.trace.sampling import (
+    ALWAYS_ON,
+    Decision,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace import get_current_span
+
+from pubtools._impl import envconfig
+
+LOG = logging.getLogger("pubtools")
+
+
+class RateLimiter(object):
+    """A token bucket per span name.
+
+    :param limits: Maximum rate (per second) for specific span names.
+    :type limits: dict[str, float]
+    :param default: Maximum rate for all other span names, or None for no limit.
+    :type default: float
+    """
+
+    def __init__(self, limits=None, default=None):
+        self.limits = dict(limits or {})
+        self.default = default
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, name):
+        """Consume a token for a span name, returning False if none is available."""
+        rate = self.limits.get(name, self.default)
+        if rate is None:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(name, (rate, now))
+            # Refill for the time elapsed, allowing bursts of up to a second's worth.
+            tokens = min(rate, tokens + (now - last) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[name] = (tokens, now)
+            return allowed
+
+    @classmethod
+    def parse(cls, value):
+        """Create a limiter from a string such as ``"10"`` or ``"foo=5,*=100"``.
+
+        :raises ValueError: if a rate isn't a number of at least 0.
+        """
+        limits = {}
+        default = None
+        for item in (value or "").split(","):
+            item = item.strip()
+            if not item:
+                continue
+            name, sep, rate = item.rpartition("=")
+            rate = float(rate)
+            # Written so that NaN is rejected too.
+            if not rate >= 0:
+                raise ValueError("Invalid rate limit: %s" % item)
+            if not sep or name.strip() == "*":
+                default = rate
+            else:
+                limits[name.strip()] = rate
+        return cls(limits, default)
+
+
+class PubtoolsSampler(Sampler):
+    """Sampler applying overrides and per-name rate limits on top of a base sampler.
+
+    :param base: Sampler deciding whether spans are sampled in the first place.
+    :param rate_limiter: Limits the rate of sampled spans per name, if given.
+    :type rate_limiter: RateLimiter
+    :param always_sample: Span names which are always sampled.
+    :type always_sample: iterable[str]
+    """
+
+    def __init__(self, base=ALWAYS_ON, rate_limiter=None, always_sample=()):
+        self.base = base
+        self.rate_limiter = rate_limiter
+        self.always_sample = frozenset(always_sample)
+
+    def should_sample(
+        self,
+        parent_context,
+        trace_id,
+        name,
+        kind=None,
+        attributes=None,
+        links=None,
+        trace_state=None,
+    ):
+        if name in self.always_sample:
+            return SamplingResult(
+                Decision.RECORD_AND_SAMPLE,
+                attributes,
+                get_current_span(parent_context).get_span_context().trace_state,
+            )
+
+        result = self.base.should_sample(
+            parent_context, trace_id, name, kind, attributes, links, trace_state
+        )
+        if (
+            result.decision == Decision.RECORD_AND_SAMPLE
+            and self.rate_limiter
+            and not self.rate_limiter.allow(name)
+        ):
+            return SamplingResult(Decision.DROP, None, result.trace_state)
+        return result
+
+    def get_description(self):
+        return "PubtoolsSampler{%s}" % self.base.get_description()
+
+    @classmethod
+    def from_env(cls, base=None):
+        """Create a sampler configured from environment variables.
+
+        :param base: Sampler to use instead of the ratio-based sampler configured
+                     by ``OTEL_TRACING_SAMPLE_RATIO``.
+        """
+        if base is None:
+            ratio = envconfig.number(
+                "OTEL_TRACING_SAMPLE_RATIO", 1.0, minimum=0.0, maximum=1.0
+            )
+            base = ParentBased(TraceIdRatioBased(ratio))
+
+        rate_limiter = None
+        rate_limit = os.getenv("OTEL_TRACING_RATE_LIMIT")
+        if rate_limit:
+            try:
+                rate_limiter = RateLimiter.parse(rate_limit)
+            except ValueError:
+                LOG.warning(
+                    "Ignoring invalid OTEL_TRACING_RATE_LIMIT=%r, using no limit",
+                    rate_limit,
+                )
+
+        always_sample = [
+            name.strip()
+            for name in os.getenv("OTEL_TRACING_ALWAYS_SAMPLE", "").split(",")
+            if name.strip()
+        ]
+
+        return cls(base, rate_limiter, always_sample)
@@ -0,0 +1,254 @@
+"""Bounded serialization of function arguments into span attributes.
+
+Arguments of instrumented functions may be arbitrarily large (e.g. lists of
+thousands of push items), so they are never converted to strings as a whole.
+Instead, values are serialized with limits on:
+
+- the length of the resulting string (``OTEL_TRACING_ATTR_MAX_LENGTH``, default 1024)
+- how deeply nested containers are descended into (``OTEL_TRACING_ATTR_MAX_DEPTH``,
+  default 3)
+- how many items of each container are included (``OTEL_TRACING_ATTR_MAX_ITEMS``,
+  default 20)
+
+Anything beyond these limits is replaced with a truncation marker.
+
+Containers are formatted like their ``repr``; other values are formatted with
+``str`` at the top level, or ``repr`` within containers, unless a serializer is
+registered for their type with :func:`register_serializer`.
+"""
+
+import inspect
+import threading
+
+from pubtools._impl import envconfig
+
+# Limits applied by default, until read from the environment by configure().
+MAX_LENGTH = 1024
+MAX_DEPTH = 3
+MAX_ITEMS = 20
+
+_SERIALIZERS = {}
+_LOCK = threading.Lock()
+
+
+def configure():
+    """Read the default limits from environment variables.
+
+    Called whenever tracing is set up, rather than at import, so that invalid
+    values can't break importing :mod:`pubtools.tracing`; they're ignored with
+    a warning instead.
+    """
+    # pylint: disable=global-statement
+    global MAX_LENGTH, MAX_DEPTH, MAX_ITEMS
+    MAX_LENGTH = envconfig.number(
+        "OTEL_TRACING_ATTR_MAX_LENGTH", 1024, convert=int, minimum=0
+    )
+    MAX_DEPTH = envconfig.number(
+        "OTEL_TRACING_ATTR_MAX_DEPTH", 3, convert=int, minimum=0
+    )
+    MAX_ITEMS = envconfig.number(
+        "OTEL_TRACING_ATTR_MAX_ITEMS", 20, convert=int, minimum=0
+    )
+
+
+def register_serializer(type_, serializer):
+    """Register a serializer for values of a type used in span attributes.
+
+    The serializer applies to instances of the type and its subclasses, unless
+    a more specific serializer is registered. Its output is still truncated
+    to the maximum length.
+
+    :param type_: Type of the values to be serialized.
+    :type type_: type
+    :param serializer: Callable accepting a value and returning a string.
+    :type serializer: callable
+    """
+    with _LOCK:
+        _SERIALIZERS[type_] = serializer
+
+
+def _find_serializer(value):
+    for klass in type(value).__mro__:
+        serializer = _SERIALIZERS.get(klass)
+        if serializer is not None:
+            return serializer
+    return None
+
+
+class _Writer(object):
+    # Accumulates output, truncating it once the length of values written
+    # reaches the limit. Punctuation and markers don't count towards it.
+
+    def __init__(self, limit):
+        self.parts = []
+        self.length = 0
+        self.limit = limit
+        self.truncated = False
+
+    @property
+    def full(self):
+        return self.length >= self.limit
+
+    def write(self, text):
+        if self.truncated:
+            return
+        remaining = self.limit - self.length
+        if len(text) > remaining:
+            self.truncated = True
+            text = text[:remaining]
+            self.parts.append(text + "...<truncated>")
+        else:
+            self.parts.append(text)
+        self.length += len(text)
+
+    def mark(self, text):
+        self.parts.append(text)
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
+def _write(out, value, depth, max_depth, max_items, nested):
+    serializer = _find_serializer(value)
+    if serializer is not None:
+        out.write(serializer(value))
+        return
+
+    if isinstance(value, (list, tuple, set, frozenset, dict)):
+        if type(value) is tuple:
+            brackets = "()"
+        elif isinstance(value, (list, tuple)):
+            brackets = "[]"
+        else:
+            brackets = "{}"
+
+        if depth >= max_depth:
+            out.mark("%s...<%s items>%s" % (brackets[0], len(value), brackets[1]))
+            return
+
+        out.mark(brackets[0])
+        items = value.items() if isinstance(value, dict) else value
+        for index, item in enumerate(items):
+            if index:
+                out.mark(", ")
+            if index >= max_items or out.full:
+                out.mark("...<%s more items>" % (len(value) - index))
+                break
+            if isinstance(value, dict):
+                _write(out, item[0], depth + 1, max_depth, max_items, True)
+                out.mark(": ")
+                item = item[1]
+            _write(out, item, depth + 1, max_depth, max_items, True)
+        if type(value) is tuple and len(value) == 1:
+            out.mark(",")
+        out.mark(brackets[1])
+        return
+
+    if isinstance(value, str):
+        # Avoid copying a huge string only to throw most of it away.
+        remaining = out.limit - out.length
+        text = value[:remaining]
+        out.write(repr(text) if nested else text)
+        if len(value) > remaining and not out.truncated:
+            out.mark("...<%s more chars>" % (len(value) - remaining))
+        return
+
+    out.write(repr(value) if nested else str(value))
+
+
+def serialize(value, max_length=None, max_depth=None, max_items=None):
+    """Serialize a value into a string of bounded length.
+
+    :param value: Any value.
+    :param max_length: Maximum total length of serialized values, not counting
+                       punctuation of containers and truncation markers.
+    :param max_depth: Maximum depth of nested containers to descend into.
+    :param max_items: Maximum number of items included per container.
+    :return: The serialized value.
+    :rtype: str
+    """
+    out = _Writer(MAX_LENGTH if max_length is None else max_length)
+    _write(
+        out,
+        value,
+        0,
+        MAX_DEPTH if max_depth is None else max_depth,
+        MAX_ITEMS if max_items is None else max_items,
+        False,
+    )
+    return out.getvalue()
+
+
+def serialize_args(args, kwargs):
+    """Serialize all arguments of a call into bounded strings.
+
+    :param args: Positional arguments of the call.
+    :param kwargs: Keyword arguments of the call.
+    :return: Tuple of serialized positional and keyword arguments, each of
+             bounded length.
+    :rtype: tuple[str, str]
+    """
+    results = []
+    for items in (
+        [(None, arg) for arg in args],
+        list(kwargs.items()),
+    ):
+        out = _Writer(MAX_LENGTH)
+        for index, (name, value) in enumerate(items):
+            if index:
+                out.mark(", ")
+            if out.full:
+                out.mark("...<%s more>" % (len(items) - index))
+                break
+            if name is not None:
+                out.mark("%s=" % name)
+            _write(out, value, 0, MAX_DEPTH, MAX_ITEMS, False)
+        results.append(out.getvalue())
+    return tuple(results)
+
+
+def arg_positions(func, names):
+    """Map names of a function's parameters to their positional index.
+
+    :param func: The function.
+    :param names: Names of the parameters.
+    :return: Mapping from each name to its positional index, or None if the
+             parameter can only be passed by keyword.
+    :rtype: dict
+    """
+    positions = {}
+    try:
+        params = list(inspect.signature(func).parameters.values())
+    except (TypeError, ValueError):  # pragma: no cover
+        params = []
+    for name in names:
+        positions[name] = None
+        for index, param in enumerate(params):
+            if param.name == name and param.kind in (
+                param.POSITIONAL_ONLY,
+                param.POSITIONAL_OR_KEYWORD,
+            ):
+                positions[name] = index
+    return positions
+
+
+def arg_attributes(positions, args, kwargs):
+    """Serialize selected arguments of a call into span attributes.
+
+    :param positions: Mapping returned by :func:`arg_positions`.
+    :param args: Positional arguments of the call.
+    :param kwargs: Keyword arguments of the call.
+    :return: Attributes named ``args.<name>`` for each argument passed in the call.
+    :rtype: dict
+    """
+    attributes = {}
+    for name, index in positions.items():
+        if name in kwargs:
+            value = kwargs[name]
+        elif index is not None and index < len(args):
+            value = args[index]
+        else:
+            # Not passed, default applies.
+            continue
+        attributes["args." + name] = serialize(value)
+    return attributes
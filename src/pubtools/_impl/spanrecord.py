@@ -0,0 +1,150 @@
+"""A compact record format for finished spans.
+
+Spans are stored as a sequence of records, each consisting of a 4-byte
+big-endian length followed by that many bytes of JSON describing one span.
+A partially written record at the end of a file (e.g. if a process was killed
+while writing) is ignored when reading.
+"""
+
+import json
+import logging
+import struct
+
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import Event, ReadableSpan
+from opentelemetry.sdk.util.instrumentation import InstrumentationScope
+from opentelemetry.trace import Link, SpanContext, SpanKind, TraceFlags
+from opentelemetry.trace.status import Status, StatusCode
+
+LOG = logging.getLogger("pubtools")
+
+_HEADER = struct.Struct(">I")
+
+
+def _attributes(attributes):
+    # Attributes as a JSON-compatible dict.
+    return {
+        key: list(value) if isinstance(value, tuple) else value
+        for (key, value) in (attributes or {}).items()
+    }
+
+
+def encode_span(span):
+    """Convert a finished span into a JSON-compatible dict.
+
+    :param span: The span.
+    :type span: opentelemetry.sdk.trace.ReadableSpan
+    :rtype: dict
+    """
+    context = span.context
+    parent = span.parent
+    scope = span.instrumentation_scope
+    return {
+        "name": span.name,
+        "trace_id": "%032x" % context.trace_id,
+        "span_id": "%016x" % context.span_id,
+        "trace_flags": int(context.trace_flags),
+        "parent_id": "%016x" % parent.span_id if parent else None,
+        "parent_remote": bool(parent and parent.is_remote),
+        "kind": span.kind.name,
+        "start": span.start_time,
+        "end": span.end_time,
+        "status": [span.status.status_code.name, span.status.description],
+        "attributes": _attributes(span.attributes),
+        "events": [
+            [event.name, event.timestamp, _attributes(event.attributes)]
+            for event in span.events
+        ],
+        "links": [
+            [
+                "%032x" % link.context.trace_id,
+                "%016x" % link.context.span_id,
+                _attributes(link.attributes),
+            ]
+            for link in span.links
+        ],
+        "resource": _attributes(span.resource.attributes if span.resource else None),
+        "scope": [scope.name, scope.version] if scope else None,
+    }
+
+
+def decode_span(data):
+    """Convert a dict returned by :func:`encode_span` back into a span.
+
+    :param data: The encoded span.
+    :type data: dict
+    :rtype: opentelemetry.sdk.trace.ReadableSpan
+    """
+    trace_id = int(data["trace_id"], 16)
+    flags = TraceFlags(data["trace_flags"])
+    parent = None
+    if data["parent_id"]:
+        parent = SpanContext(
+            trace_id, int(data["parent_id"], 16), data["parent_remote"], flags
+        )
+    scope = None
+    if data["scope"]:
+        scope = InstrumentationScope(*data["scope"])
+    return ReadableSpan(
+        name=data["name"],
+        context=SpanContext(trace_id, int(data["span_id"], 16), False, flags),
+        parent=parent,
+        resource=Resource(data["resource"]),
+        attributes=data["attributes"],
+        events=[
+            Event(name, attributes, timestamp)
+            for (name, timestamp, attributes) in data["events"]
+        ],
+        links=[
+            Link(
+                SpanContext(int(link_trace_id, 16), int(link_span_id, 16), False),
+                attributes,
+            )
+            for (link_trace_id, link_span_id, attributes) in data["links"]
+        ],
+        kind=SpanKind[data["kind"]],
+        status=Status(StatusCode[data["status"][0]], data["status"][1]),
+        start_time=data["start"],
+        end_time=data["end"],
+        instrumentation_scope=scope,
+    )
+
+
+def dump_spans(spans):
+    """Encode spans into records.
+
+    :param spans: Finished spans.
+    :return: The records, ready to be written to a file.
+    :rtype: bytes
+    """
+    chunks = []
+    for span in spans:
+        payload = json.dumps(encode_span(span), separators=(",", ":")).encode("utf-8")
+        chunks.append(_HEADER.pack(len(payload)))
+        chunks.append(payload)
+    return b"".join(chunks)
+
+
+def iter_records(f):
+    """Iterate over encoded spans (dicts) read from a binary file object."""
+    while True:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            if header:
+                LOG.debug("Ignoring truncated span record in %s", f)
+            return
+        (length,) = _HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length:
+            LOG.debug("Ignoring truncated span record in %s", f)
+            return
+        yield json.loads(payload.decode("utf-8"))
+
+
+def load_spans(f):
+    """Read all spans from a binary file object.
+
+    :return: The spans.
+    :rtype: list[opentelemetry.sdk.trace.ReadableSpan]
+    """
+    return [decode_span(data) for data in iter_records(f)]
@@ -0,0 +1,282 @@
+"""A durable on-disk spool for exported spans.
+
+Exporting spans directly to a collector makes a task wait for the collector
+whenever spans are flushed, and loses the spans if the collector is down.
+With the spool, spans are instead appended to files in a local directory,
+which takes about as long as writing the file, and a background thread ships
+them to the real exporter, retrying with exponential backoff on failure.
+
+Spans are written in batches, each batch becoming one segment file in the
+records format of :mod:`pubtools._impl.spanrecord`. Segments are deleted
+once shipped. If the spool grows beyond its size limit (e.g. because the
+collector has been down for a long time), the oldest segments are dropped.
+
+Segments not yet shipped when a process exits remain in the spool, and are
+shipped by the next process using the same spool directory.
+
+The following environment variables configure the spool:
+
+- ``OTEL_TRACING_SPOOL_DIR``: directory of the spool; setting it enables the spool.
+- ``OTEL_TRACING_SPOOL_MAX_BYTES``: maximum total size of segments in the spool
+  (default 100 MiB).
+"""
+
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from pubtools._impl import envconfig, spanrecord
+
+LOG = logging.getLogger("pubtools")
+
+SUFFIX = ".spans"
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+# Seconds to wait at shutdown for the shipper to finish shipping a segment.
+SHUTDOWN_TIMEOUT = 5.0
+
+# A segment claimed for shipping by some process.
+_CLAIMED = re.compile(r"^(.*\.spans)\.shipping-(\d+)$")
+
+
+def enabled():
+    # Whether the spool was requested.
+    return bool(os.getenv("OTEL_TRACING_SPOOL_DIR"))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # pragma: no cover
+        pass
+    return True
+
+
+def segments(directory):
+    """Return paths of all segments awaiting shipping, oldest first."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(directory, name) for name in sorted(names) if name.endswith(SUFFIX)
+    ]
+
+
+class Shipper(threading.Thread):
+    """A thread shipping segments from the spool to an exporter.
+
+    :param directory: Directory of the spool.
+    :param exporter: The exporter receiving the spans.
+    :type exporter: opentelemetry.sdk.trace.export.SpanExporter
+    :param min_backoff: Delay (in seconds) before the first retry after a failure.
+    :param max_backoff: Maximum delay between retries.
+    :param interval: Delay between checks for new segments, if not woken earlier.
+    """
+
+    def __init__(
+        self, directory, exporter, min_backoff=1.0, max_backoff=60.0, interval=5.0
+    ):
+        super().__init__(name="pubtools-span-shipper", daemon=True)
+        self.directory = directory
+        self.exporter = exporter
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self):
+        """Check for new segments as soon as possible."""
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """Stop the thread, waiting up to ``timeout`` seconds for it to finish."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        self.recover()
+        backoff = 0.0
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            if self.ship_pending():
+                backoff = 0.0
+                self._wakeup.wait(self.interval)
+            else:
+                backoff = min(max(backoff * 2, self.min_backoff), self.max_backoff)
+                LOG.debug("Failed to ship spans, retrying in %s seconds", backoff)
+                self._stopping.wait(backoff)
+
+    def recover(self):
+        """Return segments claimed by processes which no longer exist to the spool."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            match = _CLAIMED.match(name)
+            if match and not _pid_alive(int(match.group(2))):
+                try:
+                    os.rename(
+                        os.path.join(self.directory, name),
+                        os.path.join(self.directory, match.group(1)),
+                    )
+                except OSError:  # pragma: no cover
+                    # Recovered by someone else.
+                    pass
+
+    def ship_pending(self):
+        """Ship all segments currently in the spool.
+
+        :return: False if shipping failed and should be retried later.
+        """
+        for path in segments(self.directory):
+            if self._stopping.is_set():
+                break
+            claimed = "%s.shipping-%s" % (path, os.getpid())
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                # Claimed by another process.
+                continue
+
+            try:
+                with open(claimed, "rb") as f:
+                    spans = spanrecord.load_spans(f)
+            except Exception:  # pylint: disable=broad-except
+                LOG.warning("Dropping unreadable span segment %s", path, exc_info=True)
+                os.unlink(claimed)
+                continue
+
+            try:
+                result = self.exporter.export(spans)
+            except Exception:  # pylint: disable=broad-except
+                LOG.debug("Exporter failed", exc_info=True)
+                result = SpanExportResult.FAILURE
+
+            if result is SpanExportResult.SUCCESS:
+                os.unlink(claimed)
+            else:
+                # Put it back for a later attempt.
+                os.rename(claimed, path)
+                return False
+        return True
+
+
+class SpoolExporter(SpanExporter):
+    """An exporter writing spans to a spool, from which a :class:`Shipper`
+    forwards them to another exporter.
+
+    :param directory: Directory of the spool; created if necessary.
+    :param exporter: The exporter receiving the spans.
+    :type exporter: opentelemetry.sdk.trace.export.SpanExporter
+    :param max_bytes: Maximum total size of the spool.
+    :param shipper_args: Extra arguments for the :class:`Shipper`.
+    """
+
+    def __init__(
+        self, directory, exporter, max_bytes=DEFAULT_MAX_BYTES, **shipper_args
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.exporter = exporter
+        self.max_bytes = max_bytes
+        self._shipper_args = shipper_args
+        self._shipper = None
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, exporter):
+        """Create a spool exporter configured from environment variables."""
+        return cls(
+            os.getenv("OTEL_TRACING_SPOOL_DIR"),
+            exporter,
+            max_bytes=envconfig.number(
+                "OTEL_TRACING_SPOOL_MAX_BYTES",
+                DEFAULT_MAX_BYTES,
+                convert=int,
+                minimum=0,
+            ),
+        )
+
+    @property
+    def shipper(self):
+        """The shipper thread, started if not already running.
+
+        (It is restarted as needed in forked processes, which lose all threads.)
+        """
+        with self._lock:
+            if self._shipper is None or not self._shipper.is_alive():
+                self._shipper = Shipper(
+                    self.directory, self.exporter, **self._shipper_args
+                )
+                self._shipper.start()
+            return self._shipper
+
+    def export(self, spans):
+        name = "%020d-%s-%s%s" % (
+            time.time_ns(),
+            os.getpid(),
+            next(self._counter),
+            SUFFIX,
+        )
+        path = os.path.join(self.directory, name)
+        # Written under a temporary name so that a partial segment can't be shipped.
+        temp_path = os.path.join(self.directory, "." + name + ".tmp")
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(spanrecord.dump_spans(spans))
+            os.rename(temp_path, path)
+        except OSError:
+            LOG.warning("Failed to write spans to spool", exc_info=True)
+            return SpanExportResult.FAILURE
+
+        self._enforce_limit()
+        self.shipper.wake()
+        return SpanExportResult.SUCCESS
+
+    def _enforce_limit(self):
+        # Drop the oldest segments while the spool is too large.
+        sizes = []
+        for path in segments(self.directory):
+            try:
+                sizes.append((path, os.path.getsize(path)))
+            except OSError:
+                # Shipped in the meantime.
+                pass
+
+        total = sum(size for (_, size) in sizes)
+        for path, size in sizes:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                LOG.warning("Span spool is full, dropped %s", path)
+            except OSError:
+                pass
+            total -= size
+
+    def force_flush(self, timeout_millis=30000):
+        # Spans are already durable once exported.
+        return True
+
+    def shutdown(self):
+        # Anything left is shipped later, so only a segment being shipped is
+        # waited for, as the exporter shouldn't be shut down while in use.
+        if self._shipper is not None:
+            self._shipper.stop(timeout=SHUTDOWN_TIMEOUT)
+            if self._shipper.is_alive():
+                LOG.warning(
+                    "Span shipper did not stop within %s seconds", SHUTDOWN_TIMEOUT
+                )
+        self.exporter.shutdown()
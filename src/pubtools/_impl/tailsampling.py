@@ -0,0 +1,181 @@
+"""Tail-based sampling of whole tasks.
+
+Head sampling decides whether to keep a span when it starts, before anything
+is known about how the task will go. The processor in this module instead
+buffers all spans ended during a task and decides at the end of the task
+whether to keep them:
+
+- spans of failed tasks are always exported
+- spans of slow tasks are always exported
+- spans of other tasks are exported for a sample of tasks, and dropped otherwise
+
+Spans are buffered per task context (see :mod:`pubtools._impl.taskscope`), so
+several tasks may run concurrently in one process; spans of a nested task
+are buffered with those of its outermost task. Spans ended outside of any
+task context, such as in threads which don't copy the task's context, are
+passed on as they end.
+
+The following environment variables configure the processor:
+
+- ``OTEL_TRACING_TAIL_SAMPLING``: set ``true`` to enable tail-based sampling.
+- ``OTEL_TRACING_TAIL_SAMPLE_RATIO``: ratio of successful, fast tasks whose spans
+  are exported (default 0.1).
+- ``OTEL_TRACING_TAIL_SLOW_SECONDS``: tasks taking at least this long are considered
+  slow (default: no task is considered slow).
+- ``OTEL_TRACING_TAIL_BUFFER_SIZE``: maximum number of spans buffered per task; the
+  oldest spans are dropped beyond this (default 10000).
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from opentelemetry.sdk.trace import SpanProcessor
+
+from pubtools._impl import envconfig, taskscope
+from pubtools.pluggy import hookimpl
+
+LOG = logging.getLogger("pubtools")
+
+
+def enabled():
+    # Whether tail-based sampling was requested.
+    return os.getenv("OTEL_TRACING_TAIL_SAMPLING", "").lower() == "true"
+
+
+def _task_key():
+    # Identifies the outermost task of the current context. (Tasks started by
+    # calling the hookimpls directly, outside of any task context, share the
+    # key None.)
+    scope = taskscope.current()
+    return scope.root if scope is not None else None
+
+
+class _Task(object):
+    # Spans buffered for a task, and what is known about the task so far.
+
+    def __init__(self, buffer_size):
+        self.spans = deque(maxlen=buffer_size)
+        self.overflowed = 0
+        self.depth = 1
+        self.failed = False
+        self.started = time.monotonic()
+
+
+class TailSamplingProcessor(SpanProcessor):
+    """A span processor buffering spans per task, deciding whether to export them
+    at :func:`task_stop`.
+
+    This object is also a plugin providing ``task_start`` and ``task_stop``
+    hookimpls, and must be registered with the plugin manager.
+
+    :param downstream: Processor receiving spans which are kept.
+    :type downstream: SpanProcessor
+    :param sample_ratio: Ratio of successful, fast tasks whose spans are kept.
+    :type sample_ratio: float
+    :param slow_seconds: Tasks taking at least this long are always kept; if None,
+                         no task is considered slow.
+    :type slow_seconds: float
+    :param buffer_size: Maximum number of spans buffered per task.
+    :type buffer_size: int
+    """
+
+    def __init__(
+        self, downstream, sample_ratio=0.1, slow_seconds=None, buffer_size=10000
+    ):
+        self.downstream = downstream
+        self.sample_ratio = sample_ratio
+        self.slow_seconds = slow_seconds
+        self.buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._tasks = {}
+
+    @classmethod
+    def from_env(cls, downstream):
+        """Create a processor configured from environment variables."""
+        return cls(
+            downstream,
+            sample_ratio=envconfig.number(
+                "OTEL_TRACING_TAIL_SAMPLE_RATIO", 0.1, minimum=0.0, maximum=1.0
+            ),
+            slow_seconds=envconfig.number(
+                "OTEL_TRACING_TAIL_SLOW_SECONDS", None, minimum=0.0
+            ),
+            buffer_size=envconfig.number(
+                "OTEL_TRACING_TAIL_BUFFER_SIZE", 10000, convert=int, minimum=1
+            ),
+        )
+
+    def on_start(self, span, parent_context=None):
+        self.downstream.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        key = _task_key()
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is not None:
+                if len(task.spans) == self.buffer_size:
+                    task.overflowed += 1
+                task.spans.append(span)
+                return
+
+        # Not within a task, nothing to decide.
+        self.downstream.on_end(span)
+
+    def shutdown(self):
+        self.downstream.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self.downstream.force_flush(timeout_millis)
+
+    def _keep(self, failed, duration):
+        # Returns the reason for keeping a task's spans, or None to drop them.
+        if failed:
+            return "failed"
+        if self.slow_seconds is not None and duration >= self.slow_seconds:
+            return "slow"
+        if random.random() < self.sample_ratio:
+            return "sampled"
+        return None
+
+    @hookimpl
+    def task_start(self):
+        key = _task_key()
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                self._tasks[key] = _Task(self.buffer_size)
+            else:
+                task.depth += 1
+
+    @hookimpl
+    def task_stop(self, failed):
+        key = _task_key()
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None:
+                return
+            task.depth -= 1
+            task.failed = task.failed or failed
+            if task.depth:
+                # Nested task; decide once the outermost task stops.
+                return
+            # Once removed, nothing else refers to the task.
+            del self._tasks[key]
+
+        reason = self._keep(task.failed, time.monotonic() - task.started)
+        if task.overflowed:
+            LOG.warning(
+                "Tail sampling buffer overflowed, %s spans were dropped",
+                task.overflowed,
+            )
+        if reason is None:
+            LOG.debug("Dropping %s spans of task", len(task.spans))
+            return
+
+        LOG.debug("Exporting %s spans of %s task", len(task.spans), reason)
+        for span in task.spans:
+            self.downstream.on_end(span)
@@ -0,0 +1,228 @@
+"""Task-scoped registration of plugins.
+
+Hookimpls of ``task_start`` commonly register plugins providing context for
+the task, which ``task_stop`` unregisters. Registered on the global plugin
+manager, those plugins are visible to every task in the process, so tasks
+can't safely run concurrently in one process.
+
+Instead, plugins may be registered within the current task only:
+
+.. code-block:: python
+
+    @hookimpl
+    def task_start():
+        pm.register(TaskPlugin(), scope="task")
+
+Each :func:`~pubtools.pluggy.task_context` holds its own scope of plugins in
+a context variable, which hook calls made within that context merge with the
+globally registered hookimpls. The scope is inherited by threads and asyncio
+tasks which copy the context, such as workers of the executors provided by
+:mod:`pubtools.tracing`, and by nested task contexts. Plugins registered in
+the scope are forgotten once the task context exits.
+"""
+
+import contextvars
+import threading
+
+import pluggy
+
+SCOPES = ("task",)
+
+_SCOPE = contextvars.ContextVar("pubtools_task_scope", default=None)
+
+
+def _is_wrapper(impl):
+    return impl.hookwrapper or getattr(impl, "wrapper", False)
+
+
+def _insert(methods, impl):
+    # Inserts a hookimpl into a list of hookimpls in the same position as
+    # pluggy's HookCaller._add_hookimpl, i.e. nonwrappers followed by wrappers,
+    # each ordered by trylast, then registration, then tryfirst.
+    nonwrappers = [m for m in methods if not _is_wrapper(m)]
+    wrappers = [m for m in methods if _is_wrapper(m)]
+    target = wrappers if _is_wrapper(impl) else nonwrappers
+
+    if impl.trylast:
+        target.insert(0, impl)
+    elif impl.tryfirst:
+        target.append(impl)
+    else:
+        i = len(target) - 1
+        while i >= 0 and target[i].tryfirst:
+            i -= 1
+        target.insert(i + 1, impl)
+    return nonwrappers + wrappers
+
+
+class TaskScope(object):
+    """Plugins registered within a task.
+
+    :param parent: The scope of an enclosing task, whose plugins are also
+                   visible within this one.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._lock = threading.Lock()
+        self._plugins = {}
+        self._impls = {}
+
+    @property
+    def root(self):
+        """The scope of the outermost enclosing task (possibly this one)."""
+        scope = self
+        while scope.parent is not None:
+            scope = scope.parent
+        return scope
+
+    def add(self, plugin_name, plugin, impls):
+        """Add a plugin, with its hookimpls as (hook name, hookimpl) pairs."""
+        with self._lock:
+            if plugin_name in self._plugins:
+                raise ValueError(
+                    "Plugin name already registered in task: %s" % plugin_name
+                )
+            self._plugins[plugin_name] = plugin
+            for hook_name, impl in impls:
+                self._impls.setdefault(hook_name, []).append(impl)
+
+    def remove(self, plugin_name):
+        """Remove a plugin by name, and return it."""
+        with self._lock:
+            plugin = self._plugins.pop(plugin_name)
+            self._impls = {
+                hook_name: [impl for impl in impls if impl.plugin is not plugin]
+                for (hook_name, impls) in self._impls.items()
+            }
+            return plugin
+
+    def get_name(self, plugin):
+        """Return the name of a plugin registered in this scope, or None."""
+        for plugin_name, registered in self._plugins.items():
+            if registered is plugin:
+                return plugin_name
+        return None
+
+    def has_name(self, plugin_name):
+        """Whether a plugin of this name is registered in this scope."""
+        return plugin_name in self._plugins
+
+    def merge(self, hook_name, methods):
+        """Merge hookimpls registered in this scope (and enclosing scopes)
+        into a list of hookimpls, in the order pluggy would call them.
+        """
+        if self.parent is not None:
+            methods = self.parent.merge(hook_name, methods)
+        impls = self._impls.get(hook_name)
+        if impls:
+            methods = list(methods)
+            for impl in impls:
+                methods = _insert(methods, impl)
+        return methods
+
+
+def current():
+    """Return the scope of the current task, or None outside of a task context.
+
+    Scopes also identify tasks, for keeping state per task in processes which
+    run several tasks concurrently.
+    """
+    return _SCOPE.get()
+
+
+def enter():
+    """Start a new task scope in the current context.
+
+    :return: A token for :func:`leave`.
+    """
+    return _SCOPE.set(TaskScope(_SCOPE.get()))
+
+
+def leave(token):
+    """End a task scope started by :func:`enter`, forgetting its plugins."""
+    _SCOPE.reset(token)
+
+
+class PluginManager(pluggy.PluginManager):
+    """A plugin manager additionally supporting task-scoped registrations."""
+
+    def register(self, plugin, name=None, scope=None):
+        """Register a plugin and return its name.
+
+        :param scope: ``"task"`` to register the plugin only within the current
+                      task context, rather than globally.
+        :raises RuntimeError: if registering in a task scope outside of a task
+                              context.
+        """
+        if scope is None:
+            return super().register(plugin, name)
+        if scope not in SCOPES:
+            raise ValueError("Unknown plugin scope: %s" % scope)
+
+        task_scope = _SCOPE.get()
+        if task_scope is None:
+            raise RuntimeError(
+                "Can't register a plugin in a task without a task context"
+            )
+
+        plugin_name = name or self.get_canonical_name(plugin)
+        if task_scope.get_name(plugin) is not None:
+            raise ValueError("Plugin already registered in task: %s" % plugin_name)
+
+        impls = []
+        for attr in dir(plugin):
+            opts = self.parse_hookimpl_opts(plugin, attr)
+            if opts is None:
+                continue
+            impl = pluggy.HookImpl(plugin, plugin_name, getattr(plugin, attr), opts)
+            hook_name = opts.get("specname") or attr
+            hook = getattr(self.hook, hook_name, None)
+            if hook is None or not hook.has_spec():
+                if opts.get("optionalhook"):
+                    continue
+                raise pluggy.PluginValidationError(
+                    plugin, "unknown hook %r in plugin %r" % (hook_name, plugin)
+                )
+            self._verify_hook(hook, impl)
+            impls.append((hook_name, impl))
+
+        task_scope.add(plugin_name, plugin, impls)
+        return plugin_name
+
+    def unregister(self, plugin=None, name=None):
+        """Unregister a plugin, from the current task scope if it was registered
+        there, and globally otherwise."""
+        task_scope = _SCOPE.get()
+        while task_scope is not None:
+            plugin_name = name or task_scope.get_name(plugin)
+            if plugin_name is not None and task_scope.has_name(plugin_name):
+                return task_scope.remove(plugin_name)
+            task_scope = task_scope.parent
+        return super().unregister(plugin, name)
+
+    def is_registered(self, plugin):
+        """Whether a plugin is registered, globally or in the current task scope."""
+        task_scope = _SCOPE.get()
+        while task_scope is not None:
+            if task_scope.get_name(plugin) is not None:
+                return True
+            task_scope = task_scope.parent
+        return super().is_registered(plugin)
+
+    def get_hookimpls(self, hook_name):
+        """Return the hookimpls of a hook in the current context, in the order
+        they're registered (i.e. the reverse of the order they're called in).
+        """
+        methods = getattr(self.hook, hook_name).get_hookimpls()
+        task_scope = _SCOPE.get()
+        if task_scope is not None:
+            methods = task_scope.merge(hook_name, methods)
+        return methods
+
+    def _hookexec(self, hook_name, methods, kwargs, firstresult):
+        # Hook callers call this with the globally registered hookimpls.
+        task_scope = _SCOPE.get()
+        if task_scope is not None:
+            methods = task_scope.merge(hook_name, methods)
+        return self._inner_hookexec(hook_name, methods, kwargs, firstresult)
@@ -0,0 +1,122 @@
+"""Exporting spans to local trace files.
+
+If ``OTEL_TRACING_FILE_DIR`` is set, spans are written to files in that
+directory, in addition to being exported as usual. A new file is started
+for each task, named ``<timestamp>-<pid>-<n>.trace``, using the records
+format of :mod:`pubtools._impl.spanrecord`.
+
+Spans are exported in batches which can't be told apart by task, so tasks
+which overlap, whether nested or running concurrently in one process, share
+the file started by the first of them.
+
+Trace files can be analysed with the ``pubtools-trace`` command.
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from pubtools._impl import spanrecord, taskscope
+from pubtools.pluggy import hookimpl
+
+LOG = logging.getLogger("pubtools")
+
+SUFFIX = ".trace"
+
+
+def enabled():
+    # Whether trace files were requested.
+    return bool(os.getenv("OTEL_TRACING_FILE_DIR"))
+
+
+class FileSpanExporter(SpanExporter):
+    """An exporter writing spans to a trace file per task.
+
+    This object is also a plugin providing ``task_start`` and ``task_stop``
+    hookimpls, which start a new file unless another task is still running;
+    it must be registered with the plugin manager for that to happen.
+
+    :param directory: Directory of trace files; created if necessary.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = None
+        self._count = 0
+        self._lock = threading.Lock()
+        # Scopes of running tasks; a task whose task_start failed is forgotten
+        # once its scope is.
+        self._tasks = weakref.WeakSet()
+
+    def _next_path(self):
+        self._count += 1
+        return os.path.join(
+            self.directory,
+            "%s-%s-%s%s"
+            % (time.strftime("%Y%m%d-%H%M%S"), os.getpid(), self._count, SUFFIX),
+        )
+
+    @hookimpl
+    def task_start(self):
+        with self._lock:
+            if not self._tasks:
+                self.path = None
+            scope = taskscope.current()
+            if scope is not None:
+                self._tasks.add(scope)
+
+    @hookimpl
+    def task_stop(self):
+        scope = taskscope.current()
+        if scope is not None:
+            with self._lock:
+                self._tasks.discard(scope)
+
+    def export(self, spans):
+        data = spanrecord.dump_spans(spans)
+        with self._lock:
+            if self.path is None:
+                self.path = self._next_path()
+            try:
+                with open(self.path, "ab") as f:
+                    f.write(data)
+            except OSError:
+                LOG.warning("Failed to write spans to %s", self.path, exc_info=True)
+                return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis=30000):
+        # Nothing is buffered.
+        return True
+
+
+class TeeSpanExporter(SpanExporter):
+    """An exporter passing spans on to several other exporters.
+
+    :param exporters: The exporters.
+    :type exporters: list[opentelemetry.sdk.trace.export.SpanExporter]
+    """
+
+    def __init__(self, exporters):
+        self.exporters = list(exporters)
+
+    def export(self, spans):
+        result = SpanExportResult.SUCCESS
+        for exporter in self.exporters:
+            if exporter.export(spans) is not SpanExportResult.SUCCESS:
+                result = SpanExportResult.FAILURE
+        return result
+
+    def force_flush(self, timeout_millis=30000):
+        return all(
+            [exporter.force_flush(timeout_millis) for exporter in self.exporters]
+        )
+
+    def shutdown(self):
+        for exporter in self.exporters:
+            exporter.shutdown()
@@ -0,0 +1,204 @@
+"""The pubtools-trace command, for analysing trace files.
+
+Trace files are written when ``OTEL_TRACING_FILE_DIR`` is set (see
+:mod:`pubtools._impl.tracefile`). This command reads one or more of them
+(or directories containing them) and prints one of:
+
+- ``critical-path``: for each root span, the chain of spans which determined
+  its duration
+- ``self-time``: time spent in spans of each name, excluding their children
+- ``collapsed``: self time per stack of span names, in the collapsed stack
+  format understood by flamegraph tools
+- ``top``: the slowest individual spans
+"""
+
+import argparse
+import os
+import sys
+
+
+class Span(object):
+    # A span as read from a trace file, with links to its children.
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "children")
+
+    def __init__(self, data):
+        self.name = data["name"]
+        self.trace_id = data["trace_id"]
+        self.span_id = data["span_id"]
+        self.parent_id = data["parent_id"]
+        self.start = data["start"]
+        self.end = data["end"]
+        self.children = []
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+def _paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".trace"):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def load(paths):
+    """Load spans from trace files, or directories of trace files.
+
+    :return: Root spans (those whose parents aren't in the files), with all other
+             spans reachable as their children.
+    :rtype: list[Span]
+    """
+    from pubtools._impl import spanrecord
+
+    spans = []
+    for path in _paths(paths):
+        with open(path, "rb") as f:
+            spans.extend(Span(data) for data in spanrecord.iter_records(f))
+
+    by_id = {(span.trace_id, span.span_id): span for span in spans}
+    roots = []
+    for span in spans:
+        parent = by_id.get((span.trace_id, span.parent_id))
+        if parent is None:
+            roots.append(span)
+        else:
+            parent.children.append(span)
+    for span in spans:
+        span.children.sort(key=lambda child: child.start)
+    roots.sort(key=lambda span: span.start)
+    return roots
+
+
+def walk(roots, stack=()):
+    """Yield (stack of names, span) for every span, depth-first."""
+    for span in roots:
+        span_stack = stack + (span.name,)
+        yield span_stack, span
+        for item in walk(span.children, span_stack):
+            yield item
+
+
+def self_time(span):
+    """Time spent in a span outside of any of its children.
+
+    Children running concurrently (e.g. in threads) are only counted once.
+    """
+    covered = 0
+    cursor = span.start
+    for child in span.children:
+        start = max(child.start, cursor)
+        end = min(child.end, span.end)
+        if end > start:
+            covered += end - start
+            cursor = end
+    return span.duration - covered
+
+
+def critical_path(span, depth=0):
+    """Return the spans which determined the duration of a span, as a list of
+    (depth, span) in chronological order.
+
+    Starting from the end of the span, the child which finished last is on the
+    critical path, then whichever child finished last before that one started,
+    and so on, recursively.
+    """
+    on_path = []
+    cursor = span.end
+    for child in sorted(span.children, key=lambda child: child.end, reverse=True):
+        if child.end <= cursor:
+            on_path.append(child)
+            cursor = child.start
+
+    path = [(depth, span)]
+    for child in reversed(on_path):
+        path.extend(critical_path(child, depth + 1))
+    return path
+
+
+def _ms(nanos):
+    return "%.1f" % (nanos / 1e6)
+
+
+def print_critical_path(roots, out):
+    for root in sorted(roots, key=lambda span: span.duration, reverse=True):
+        print("Trace %s (%s ms)" % (root.trace_id, _ms(root.duration)), file=out)
+        for depth, span in critical_path(root):
+            print(
+                "  %10s ms  %10s ms self  %s%s"
+                % (_ms(span.duration), _ms(self_time(span)), "  " * depth, span.name),
+                file=out,
+            )
+
+
+def print_self_time(roots, out):
+    totals = {}
+    for _, span in walk(roots):
+        count, total, self = totals.get(span.name, (0, 0, 0))
+        totals[span.name] = (count + 1, total + span.duration, self + self_time(span))
+
+    print("%10s %12s %12s  %s" % ("count", "total ms", "self ms", "name"), file=out)
+    for name, (count, total, self) in sorted(
+        totals.items(), key=lambda item: item[1][2], reverse=True
+    ):
+        print("%10d %12s %12s  %s" % (count, _ms(total), _ms(self), name), file=out)
+
+
+def print_collapsed(roots, out):
+    stacks = {}
+    for stack, span in walk(roots):
+        key = ";".join(name.replace(";", "_") for name in stack)
+        stacks[key] = stacks.get(key, 0) + self_time(span)
+
+    for key in sorted(stacks):
+        # Microseconds, as integer counts are expected.
+        print("%s %d" % (key, stacks[key] // 1000), file=out)
+
+
+def print_top(roots, out, count):
+    spans = sorted(
+        (span for (_, span) in walk(roots)),
+        key=lambda span: span.duration,
+        reverse=True,
+    )
+    print("%12s  %-16s  %s" % ("ms", "trace", "name"), file=out)
+    for span in spans[:count]:
+        print(
+            "%12s  %-16s  %s" % (_ms(span.duration), span.trace_id[:16], span.name),
+            file=out,
+        )
+
+
+def entry_point(args=None, out=None):
+    out = out or sys.stdout
+    parser = argparse.ArgumentParser(description="Analyse pubtools trace files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, help_text in [
+        ("critical-path", "show the critical path of each trace"),
+        ("self-time", "show time spent in each span name, excluding children"),
+        ("collapsed", "output collapsed stacks (in microseconds) for flamegraphs"),
+        ("top", "show the slowest spans"),
+    ]:
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument(
+            "paths", nargs="+", metavar="PATH", help="trace file or directory"
+        )
+        if command == "top":
+            subparser.add_argument(
+                "-n", type=int, default=10, help="number of spans (default: 10)"
+            )
+    parsed = parser.parse_args(args)
+
+    roots = load(parsed.paths)
+    if parsed.command == "critical-path":
+        print_critical_path(roots, out)
+    elif parsed.command == "self-time":
+        print_self_time(roots, out)
+    elif parsed.command == "collapsed":
+        print_collapsed(roots, out)
+    else:
+        print_top(roots, out, parsed.n)
@@ -7,33 +7,68 @@ Usage:
 
 """
 
+import contextlib
 import functools
+import importlib.util
+import inspect
 import logging
 import os
 import threading
+import time
+
+from pubtools._impl import envconfig, spanattrs
+from pubtools._impl.histogram import Histogram
+from pubtools.pluggy import hookimpl, pm
+
+
+def _otel_available():
+    # Whether open-telemetry is installed, without importing it.
+    try:
+        return importlib.util.find_spec("opentelemetry.sdk") is not None
+    except ImportError:  # pragma: no cover
+        return False
+
+
+# Clients aren't expected to have open-telemetry. This flag will be used in
+# TracingWrapper to provide pass through functions.
+OPENTELEMETRY_AVAILABLE = _otel_available()
+
+# Importing the open-telemetry SDK is slow, and most processes don't enable
+# tracing, so these are only imported by _import_otel once tracing is enabled.
+baggage = context = trace = None
+set_global_textmap = SERVICE_NAME = Resource = TracerProvider = None
+ConsoleSpanExporter = Status = StatusCode = PubtoolsSampler = None
+batching = spool = tailsampling = tracefile = None
+propagator = baggage_propagator = None
+
+
+def _import_otel():
+    # pylint: disable=global-statement,redefined-outer-name,import-outside-toplevel
+    global baggage, context, trace, set_global_textmap, SERVICE_NAME, Resource
+    global TracerProvider, ConsoleSpanExporter, Status, StatusCode, PubtoolsSampler
+    global batching, spool, tailsampling, tracefile, propagator, baggage_propagator
+
+    if propagator is not None:
+        return
 
-try:
     from opentelemetry import baggage, context, trace
     from opentelemetry.baggage.propagation import W3CBaggagePropagator
     from opentelemetry.propagate import set_global_textmap
     from opentelemetry.sdk.resources import SERVICE_NAME, Resource
     from opentelemetry.sdk.trace import TracerProvider
-    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
     from opentelemetry.trace import Status, StatusCode
     from opentelemetry.trace.propagation.tracecontext import (
         TraceContextTextMapPropagator,
     )
 
-    OPENTELEMETRY_AVAILABLE = True
-except ImportError:  # pragma: no cover
-    # Clients aren't expected to have open-telemetry. This flag will be used in
-    # TracingWrapper to provide pass through functions.
-    OPENTELEMETRY_AVAILABLE = False
+    from pubtools._impl import batching, spool, tailsampling, tracefile
+    from pubtools._impl.sampling import PubtoolsSampler
+
+    baggage_propagator = W3CBaggagePropagator()
+    propagator = TraceContextTextMapPropagator()
 
-from pubtools.pluggy import pm
 
-propagator = TraceContextTextMapPropagator()
-baggage_propagator = W3CBaggagePropagator()
 TRACE_WRAPPER = None
 log = logging.getLogger(__name__)
 
@@ -46,6 +81,127 @@ def get_trace_wrapper():
     return TRACE_WRAPPER
 
 
+def _forget_env_context():
+    # A forked child may have its environment changed before running anything
+    # (e.g. by pubtools-runner), so it must not reuse the parent's context,
+    # nor parent new spans to spans which were running in the parent.
+    if TRACE_WRAPPER is not None:
+        TRACE_WRAPPER._env_context = None
+        TRACE_WRAPPER._main_contexts = ()
+
+
+os.register_at_fork(after_in_child=_forget_env_context)
+
+
+class GeneratorStats:
+    """Tracks where time goes while a generator is being consumed."""
+
+    def __init__(self):
+        self.items = 0
+        self.generator_time = 0.0
+        self.consumer_time = 0.0
+        self._suspended_at = None
+
+    @contextlib.contextmanager
+    def resumed(self):
+        """Count the time within this block as time spent in the generator, and time
+        since the previous block as time spent in the consumer."""
+        start = time.perf_counter()
+        if self._suspended_at is not None:
+            self.consumer_time += start - self._suspended_at
+        try:
+            yield
+        finally:
+            self._suspended_at = time.perf_counter()
+            self.generator_time += self._suspended_at - start
+
+    def attributes(self):
+        """Span attributes describing the generator's consumption."""
+        return {
+            "generator.items": self.items,
+            "generator.time_in_generator": self.generator_time,
+            "generator.time_in_consumer": self.consumer_time,
+        }
+
+
+class _Timer(object):
+    # Records the time spent within a block into a histogram.
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.histogram.record(time.perf_counter() - self.start)
+
+
+class SpanAggregator:
+    """Aggregates events within a span, recorded as span attributes when the span ends.
+
+    Rather than creating a span per item of a loop, timings and other values can
+    be recorded into histograms, and occurrences into counters, on a single span.
+    """
+
+    def __init__(self, span):
+        self.span = span
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    def timer(self, name):
+        """Return a context manager recording the time (in seconds) spent within it
+        into the histogram ``name``."""
+        return _Timer(self._histogram(name))
+
+    def record(self, name, value):
+        """Record a value into the histogram ``name``."""
+        self._histogram(name).record(value)
+
+    def incr(self, name, amount=1):
+        """Increment the counter ``name``."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def attributes(self):
+        """Span attributes describing all counters and histograms."""
+        attributes = dict(self._counters)
+        for name, histogram in self._histograms.items():
+            attributes.update(histogram.attributes(name))
+        return attributes
+
+
+class NoopAggregator:
+    """An aggregator which records nothing, used when tracing is disabled or the
+    span is not sampled."""
+
+    span = None
+    _timer = contextlib.nullcontext()
+
+    def timer(self, name):
+        return self._timer
+
+    def record(self, name, value):
+        pass
+
+    def incr(self, name, amount=1):
+        pass
+
+
+NOOP_AGGREGATOR = NoopAggregator()
+
+
 class TracingWrapper:
     """Wrapper class to initialize opentelemetry instrumentation and provide a helper function
     for instrumenting a function"""
@@ -53,7 +209,11 @@ class TracingWrapper:
     def __init__(self):
         self._processor = None
         self._provider = None
+        self._sampler = None
+        self._tail_processor = None
         self._enabled_trace = None
+        self._env_context = None
+        self._main_contexts = ()
         self._reset()
 
     def _reset(self):
@@ -72,6 +232,9 @@ class TracingWrapper:
         self._enabled_trace = (
             os.getenv("OTEL_TRACING", "").lower() == "true"
         ) and OPENTELEMETRY_AVAILABLE
+        # The environment may have changed, extract the inherited context again
+        # when next needed.
+        self._env_context = None
         if (
             os.getenv("OTEL_TRACING", "").lower() == "true"
         ) and not OPENTELEMETRY_AVAILABLE:
@@ -79,16 +242,52 @@ class TracingWrapper:
                 "Tracing is enabled but the open telemetry package is "
                 "unavailable. Tracing functionality will be disabled."
             )
+        if self._enabled_trace:
+            _import_otel()
+            spanattrs.configure()
         if self._enabled_trace and not self._processor:
             log.info("Creating TracingWrapper instance")
-            exporter = pm.hook.otel_exporter() or ConsoleSpanExporter()
-            self._processor = BatchSpanProcessor(exporter)
+            exporter = pm.hook.otel_exporter()
+            file_exporter = None
+            if tracefile.enabled():
+                file_exporter = tracefile.FileSpanExporter(
+                    os.getenv("OTEL_TRACING_FILE_DIR")
+                )
+                pm.register(file_exporter)
+            elif not exporter:
+                exporter = ConsoleSpanExporter()
+            if exporter and spool.enabled():
+                # Export to the spool, from which spans are shipped to the
+                # real exporter in the background.
+                exporter = spool.SpoolExporter.from_env(exporter)
+            if exporter and file_exporter:
+                exporter = tracefile.TeeSpanExporter([file_exporter, exporter])
+            else:
+                exporter = exporter or file_exporter
+            self._processor = batching.BoundedBatchProcessor.from_env(
+                exporter, **(pm.hook.otel_batch_options() or {})
+            )
+            self._sampler = PubtoolsSampler.from_env(pm.hook.otel_sampler())
             self._provider = TracerProvider(
-                resource=Resource.create({SERVICE_NAME: os.getenv("OTEL_SERVICE_NAME")})
+                sampler=self._sampler,
+                resource=Resource.create(
+                    {SERVICE_NAME: os.getenv("OTEL_SERVICE_NAME")}
+                ),
             )
-            self._provider.add_span_processor(self._processor)
+            if tailsampling.enabled():
+                # Spans only reach the batch processor once their task is
+                # chosen to be kept.
+                self._tail_processor = tailsampling.TailSamplingProcessor.from_env(
+                    self._processor
+                )
+                pm.register(self._tail_processor)
+                self._provider.add_span_processor(self._tail_processor)
+            else:
+                self._provider.add_span_processor(self._processor)
             trace.set_tracer_provider(self._provider)
             set_global_textmap(propagator)
+            # Spans are flushed at the end of each task.
+            pm.register(self)
 
     def instrument_func(self, span_name=None, carrier=None, args_to_attr=False):
         """Instrument tracing for a function.
@@ -99,79 +298,425 @@ class TracingWrapper:
             carrier: dict
                 A dictionary which holds trace context. Trace context will be extracted from it if
                 if it's provided.
-            args_to_attr: boolean
-                Add function parameters into span attributes or not.
+            args_to_attr: boolean or list
+                Add function parameters into span attributes or not. If a list of
+                parameter names, only those parameters are added, each as an
+                ``args.<name>`` attribute. Values are serialized with bounded
+                length, and only for spans which are recorded.
 
         Returns:
             The decorated function
+
+        If tracing is disabled when a function is decorated, the decorated function
+        only checks whether tracing has since been enabled before calling the original
+        function. If the opentelemetry package is unavailable, the original function
+        is returned as-is.
         """
 
         def _instrument_func(func):
+            if not OPENTELEMETRY_AVAILABLE:
+                # Tracing can never be enabled, so there is nothing to wrap.
+                return func
+
+            traced = self._traced_func(func, span_name, carrier, args_to_attr)
+            if self._enabled_trace:
+                return traced
+
+            # Tracing is currently disabled, but may be enabled later.
+            # Until then, calls should cost no more than a flag check.
+            if inspect.iscoroutinefunction(func):
+
+                @functools.wraps(func)
+                async def trampoline_coroutine(*args, **kwargs):
+                    if self._enabled_trace:
+                        return await traced(*args, **kwargs)
+                    return await func(*args, **kwargs)
+
+                return trampoline_coroutine
+
             @functools.wraps(func)
-            def wrap(*args, **kwargs):
-                attributes = {
-                    "function_name": func.__qualname__,
-                }
-                if args_to_attr:
-                    attributes["args"] = ", ".join(map(str, args))
-                    attributes["kwargs"] = ", ".join(
-                        "{}={}".format(k, v) for k, v in kwargs.items()
-                    )
+            def trampoline(*args, **kwargs):
+                if self._enabled_trace:
+                    return traced(*args, **kwargs)
+                return func(*args, **kwargs)
+
+            return trampoline
+
+        return _instrument_func
+
+    def _traced_func(self, func, span_name, carrier, args_to_attr):
+        # Returns a wrapper for func creating a span for each call.
+        if isinstance(args_to_attr, (list, tuple, set, frozenset)):
+            # Resolve argument names once rather than binding every call.
+            args_to_attr = spanattrs.arg_positions(func, args_to_attr)
+        span_args = (span_name or func.__qualname__, func, carrier, args_to_attr)
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrap_coroutine(*args, **kwargs):
+                if not self._enabled_trace:
+                    return await func(*args, **kwargs)
+
+                # The span is current only within this coroutine's context, which
+                # asyncio keeps separate per task, so concurrent calls don't
+                # interfere with each other.
+                with self._call_span(*span_args, args, kwargs):
+                    return await func(*args, **kwargs)
 
+            return wrap_coroutine
+
+        if inspect.isgeneratorfunction(func):
+
+            @functools.wraps(func)
+            def wrap_gen(*args, **kwargs):
                 if not self._enabled_trace:
                     return func(*args, **kwargs)
+                return self._traced_gen(span_args, args, kwargs)
 
-                tracer = trace.get_tracer(__name__)
-                trace_ctx = None
-                token = None
-                if not context.get_current():
-                    # Extract trace context from carrier.
-                    if carrier:
-                        trace_ctx = propagator.extract(carrier=carrier)
-                        trace_ctx = baggage_propagator.extract(
-                            carrier=carrier, context=trace_ctx
-                        )
-                    else:
-                        # Try to extract trace context from environment variables.
-                        trace_ctx = propagator.extract(carrier=os.environ)
-                        trace_ctx = baggage_propagator.extract(
-                            carrier=os.environ, context=trace_ctx
+            return wrap_gen
+
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            def wrap_async_gen(*args, **kwargs):
+                if not self._enabled_trace:
+                    return func(*args, **kwargs)
+                return self._traced_async_gen(span_args, args, kwargs)
+
+            return wrap_async_gen
+
+        @functools.wraps(func)
+        def wrap(*args, **kwargs):
+            if not self._enabled_trace:
+                return func(*args, **kwargs)
+
+            with self._call_span(*span_args, args, kwargs):
+                return func(*args, **kwargs)
+
+        return wrap
+
+    @staticmethod
+    def _attributes(func, args_to_attr, args, kwargs):
+        if func is None:
+            # Not a function call, see span()
+            return {}
+        attributes = {
+            "function_name": func.__qualname__,
+        }
+        if isinstance(args_to_attr, dict):
+            attributes.update(spanattrs.arg_attributes(args_to_attr, args, kwargs))
+        elif args_to_attr:
+            attributes["args"], attributes["kwargs"] = spanattrs.serialize_args(
+                args, kwargs
+            )
+        return attributes
+
+    def _inherited_context(self):
+        # Returns the context new root spans should be children of: that of the
+        # span currently running in the main thread, if any, otherwise the
+        # context inherited from the parent process via environment variables.
+        #
+        # The environment is only parsed once, since it isn't expected to carry
+        # a different context later on.
+        main_contexts = self._main_contexts
+        if main_contexts:
+            return main_contexts[-1]
+
+        env_context = self._env_context
+        if env_context is None:
+            env_context = propagator.extract(carrier=os.environ)
+            env_context = baggage_propagator.extract(
+                carrier=os.environ, context=env_context
+            )
+            self._env_context = env_context
+        return env_context
+
+    def _attach_parent(self, carrier):
+        # If there is no current context, attach one extracted from the carrier
+        # or inherited from elsewhere. Returns the token to detach it, if any.
+        trace_ctx = None
+        if not context.get_current():
+            # Extract trace context from carrier.
+            if carrier:
+                trace_ctx = propagator.extract(carrier=carrier)
+                trace_ctx = baggage_propagator.extract(
+                    carrier=carrier, context=trace_ctx
+                )
+            else:
+                trace_ctx = self._inherited_context()
+
+        if trace_ctx:
+            return context.attach(trace_ctx)
+        return None
+
+    @contextlib.contextmanager
+    def _call_span(self, name, func, carrier, args_to_attr, args, kwargs):
+        # Covers a single call of a function with a span, current for the
+        # duration of the call.
+        tracer = trace.get_tracer(__name__)
+        token = self._attach_parent(carrier)
+
+        try:
+            with tracer.start_as_current_span(name=name) as span:
+                # Spans which are not sampled take the cheap path and skip
+                # building attributes.
+                if span.is_recording():
+                    span.set_attributes(
+                        self._attributes(func, args_to_attr, args, kwargs)
+                    )
+                # Spans started in other threads without a context of their own
+                # become children of the span running in the main thread.
+                in_main_thread = threading.current_thread() is threading.main_thread()
+                if in_main_thread:
+                    # Calls may interleave (e.g. coroutines), so each removes only
+                    # its own context rather than restoring a previous one.
+                    main_context = context.get_current()
+                    self._main_contexts += (main_context,)
+                try:
+                    yield span
+                except Exception as exc:
+                    span.set_status(Status(StatusCode.ERROR))
+                    span.record_exception(exc)
+                    raise
+                finally:
+                    if in_main_thread:
+                        self._main_contexts = tuple(
+                            c for c in self._main_contexts if c is not main_context
                         )
+                    # Add baggage data into span attributes
+                    span.set_attributes(baggage.get_all())
+        finally:
+            # Only detach the parent once the span is no longer current, otherwise
+            # the parent would remain attached after the call.
+            if token:
+                context.detach(token)
+
+    def _start_span(self, name, func, carrier, args_to_attr, args, kwargs):
+        # Starts a span without making it current, for spans which are only
+        # current while a generator is running.
+        token = self._attach_parent(carrier)
+        try:
+            span = trace.get_tracer(__name__).start_span(name=name)
+            if span.is_recording():
+                span.set_attributes(self._attributes(func, args_to_attr, args, kwargs))
+                # Add baggage data into span attributes
+                span.set_attributes(baggage.get_all())
+        finally:
+            if token:
+                context.detach(token)
+        return span
 
-                if trace_ctx:
-                    token = context.attach(trace_ctx)
+    @staticmethod
+    def _use_span(span):
+        # Makes span current without ending it or handling exceptions, for
+        # resuming a generator within its span.
+        return trace.use_span(
+            span,
+            end_on_exit=False,
+            record_exception=False,
+            set_status_on_exception=False,
+        )
 
-                with tracer.start_as_current_span(
-                    name=span_name or func.__qualname__,
-                    attributes=attributes,
-                ) as span:
+    def _traced_gen(self, span_args, args, kwargs):
+        # Drives a generator, keeping a span open until the generator is
+        # exhausted or closed. The span is only current while the generator is
+        # running, not while the consumer is processing yielded items.
+        span = self._start_span(*span_args, args, kwargs)
+        stats = GeneratorStats()
+        gen = span_args[1](*args, **kwargs)
+        to_send = None
+        to_throw = None
+        try:
+            while True:
+                with self._use_span(span), stats.resumed():
                     try:
-                        # Put trace context in environment variables in the main thread.
-                        if threading.current_thread() is threading.main_thread():
-                            propagator.inject(os.environ)
-                            baggage_propagator.inject(os.environ)
-
-                        result = func(*args, **kwargs)
-                    except Exception as exc:
-                        span.set_status(Status(StatusCode.ERROR))
-                        span.record_exception(exc)
-                        raise
+                        if to_throw is not None:
+                            item = gen.throw(to_throw)
+                        else:
+                            item = gen.send(to_send)
+                    except StopIteration as stop:
+                        return stop.value
                     finally:
-                        # Add baggage data into span attributes
-                        span.set_attributes(baggage.get_all())
-                        if token:
-                            context.detach(token)
-                    return result
+                        to_throw = None
+                    stats.items += 1
 
-            return wrap
+                try:
+                    to_send = yield item
+                except GeneratorExit:
+                    gen.close()
+                    raise
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Thrown in by the consumer, pass it on to the generator.
+                    to_throw = exc
+        except Exception as exc:
+            span.set_status(Status(StatusCode.ERROR))
+            span.record_exception(exc)
+            raise
+        finally:
+            span.set_attributes(stats.attributes())
+            span.end()
 
-        return _instrument_func
+    async def _traced_async_gen(self, span_args, args, kwargs):
+        # Like _traced_gen, for async generators.
+        span = self._start_span(*span_args, args, kwargs)
+        stats = GeneratorStats()
+        agen = span_args[1](*args, **kwargs)
+        to_send = None
+        to_throw = None
+        try:
+            while True:
+                with self._use_span(span), stats.resumed():
+                    try:
+                        if to_throw is not None:
+                            item = await agen.athrow(to_throw)
+                        else:
+                            item = await agen.asend(to_send)
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        to_throw = None
+                    stats.items += 1
+
+                try:
+                    to_send = yield item
+                except GeneratorExit:
+                    await agen.aclose()
+                    raise
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Thrown in by the consumer, pass it on to the generator.
+                    to_throw = exc
+        except Exception as exc:
+            span.set_status(Status(StatusCode.ERROR))
+            span.record_exception(exc)
+            raise
+        finally:
+            span.set_attributes(stats.attributes())
+            span.end()
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """Cover a block of code with a span.
 
-    def force_flush(self):
-        """Flush trace data into OTEL collectors"""
+        The span is current within the block, so that spans created within it
+        (e.g. by instrumented functions) are its children.
+
+        Args:
+            name: str
+                Span name.
+            attributes:
+                Span attributes.
+
+        Returns:
+            A context manager providing a :class:`SpanAggregator`, for recording
+            timings, values and counters which are added to the span's attributes
+            when it ends. If tracing is disabled or the span is not sampled, a
+            no-op aggregator is provided instead.
+
+        Example:
+            with tw.span("push_items", count=len(items)) as agg:
+                for item in items:
+                    with agg.timer("push_item"):
+                        push_item(item)
+                    agg.incr("bytes", item.size)
+        """
+        if not self._enabled_trace:
+            yield NOOP_AGGREGATOR
+            return
+
+        with self._call_span(name, None, None, False, (), {}) as span:
+            if not span.is_recording():
+                yield NOOP_AGGREGATOR
+                return
+
+            span.set_attributes(attributes)
+            aggregator = SpanAggregator(span)
+            try:
+                yield aggregator
+            finally:
+                span.set_attributes(aggregator.attributes())
+
+    def inject_env(self, env=None):
+        """Get environment variables carrying the current trace context.
+
+        Spans created by a child process started with these environment variables
+        will be children of the current span.
+
+        Args:
+            env: dict
+                Environment variables to start from; ``os.environ`` by default.
+
+        Returns:
+            A new dict of environment variables.
+
+        Example:
+            subprocess.run(cmd, env=tw.inject_env())
+        """
+        env = dict(os.environ if env is None else env)
+        if self._enabled_trace:
+            trace_ctx = context.get_current() or self._inherited_context()
+            propagator.inject(env, context=trace_ctx)
+            baggage_propagator.inject(env, context=trace_ctx)
+        return env
+
+    def export_stats(self):
+        """Get statistics on the export of spans.
+
+        Returns:
+            A dict with counts of ``exported``, ``dropped`` and ``queued`` spans,
+            the number of ``export_failures``, and a summary of ``export_latency``
+            in seconds, or None if tracing is disabled.
+        """
         if self._processor:
-            self._processor.force_flush()
+            return self._processor.stats()
+        return None
+
+    def force_flush(self, timeout=None):
+        """Flush trace data into OTEL collectors
+
+        Args:
+            timeout: float
+                Maximum time to wait, in seconds; 30 by default.
+
+        Returns:
+            False if some spans were not exported before the timeout, True otherwise.
+        """
+        flushed = True
+        if self._processor:
+            timeout = 30 if timeout is None else timeout
+            flushed = self._processor.force_flush(timeout_millis=timeout * 1000)
         log.info("Flush trace data into OTEL collectors")
+        return flushed
+
+    @hookimpl
+    def task_start(self):
+        if self._processor:
+            self._processor.task_start()
+
+    @hookimpl(trylast=True)
+    def task_stop(self, failed):
+        # After other task_stop hooks (e.g. tail sampling, which may only now
+        # pass on the spans of the task), flush all spans of the task, but don't
+        # let an unresponsive collector hold up the process indefinitely.
+        if not self._processor:
+            return
+        timeout = envconfig.number("OTEL_TRACING_FLUSH_TIMEOUT", 30.0, minimum=0.0)
+        if not self.force_flush(timeout):
+            # Whatever wasn't exported in time is dropped, so that the next task
+            # in this process starts with an empty queue, unless other tasks are
+            # running concurrently, whose spans are still queued.
+            if self._processor.running_tasks > 1:
+                self._processor.rearm(discard=False)
+                log.warning("Flushing trace data timed out after %s seconds", timeout)
+            else:
+                unflushed = self._processor.rearm()
+                log.warning(
+                    "Flushing trace data timed out after %s seconds, "
+                    "%s queued spans were dropped",
+                    timeout,
+                    unflushed,
+                )
+        self._processor.task_stop(failed)
 
     @property
     def provider(self):
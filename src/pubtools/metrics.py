@@ -0,0 +1,3 @@
+from pubtools._impl.metrics import get_metrics_wrapper
+
+__all__ = ["get_metrics_wrapper"]
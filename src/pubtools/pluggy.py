@@ -1,3 +1,21 @@
-from pubtools._impl.pluggy import hookimpl, hookspec, pm, task_context
+from pubtools._impl.hookdispatch import HookErrors
+from pubtools._impl.pluggy import (
+    ahook,
+    async_task_context,
+    hook_stats,
+    hookimpl,
+    hookspec,
+    pm,
+    task_context,
+)
 
-__all__ = ["pm", "hookimpl", "hookspec", "task_context"]
+__all__ = [
+    "pm",
+    "hookimpl",
+    "hookspec",
+    "task_context",
+    "hook_stats",
+    "HookErrors",
+    "ahook",
+    "async_task_context",
+]
@@ -1,3 +1,24 @@
+from pubtools._impl.spanattrs import register_serializer
 from pubtools._impl.tracing import get_trace_wrapper
 
-__all__ = ["get_trace_wrapper"]
+__all__ = [
+    "get_trace_wrapper",
+    "register_serializer",
+    "ProcessPoolExecutor",
+    "ThreadPoolExecutor",
+    "submit",
+]
+
+# Importing the executors imports concurrent.futures and multiprocessing, which
+# most commands don't use, so they're only imported on first access.
+_EXECUTORS = ("ProcessPoolExecutor", "ThreadPoolExecutor", "submit")
+
+
+def __getattr__(name):
+    if name in _EXECUTORS:
+        from pubtools._impl import (  # pylint: disable=import-outside-toplevel
+            executors,
+        )
+
+        return getattr(executors, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,14 @@
+import pytest
+
+from pubtools._impl import epcache
+
+
+@pytest.fixture(autouse=True)
+def isolated_entry_points_cache(monkeypatch, tmp_path):
+    """Ensures each test uses a fresh entry point index, and never the user's own."""
+    monkeypatch.setenv(
+        "PUBTOOLS_ENTRY_POINTS_CACHE", str(tmp_path / "entry-points-cache.json")
+    )
+    epcache.clear()
+    yield
+    epcache.clear()
@@ -0,0 +1,380 @@
+import asyncio
+import sys
+import threading
+
+import pytest
+
+from pubtools._impl import hookstats
+from pubtools.pluggy import (
+    HookErrors,
+    ahook,
+    async_task_context,
+    hook_stats,
+    hookimpl,
+    hookspec,
+    pm,
+    task_context,
+)
+
+
+@hookspec(firstresult=True)
+def pubtools_test_async_first(value):
+    """A firstresult hook used in tests."""
+
+
+pm.add_hookspecs(sys.modules[__name__])
+
+
+class SyncPlugin:
+    """A plugin with synchronous hookimpls, recording the threads they run in."""
+
+    def __init__(self, events, name, fail=False):
+        self.events = events
+        self.name = name
+        self.fail = fail
+        self.threads = []
+
+    def _event(self, hook_name):
+        self.threads.append(threading.get_ident())
+        self.events.append((self.name, hook_name))
+        if self.fail:
+            raise RuntimeError("%s failed" % self.name)
+        return self.name
+
+    @hookimpl
+    def task_start(self):
+        return self._event("task_start")
+
+    @hookimpl
+    def task_stop(self, failed):
+        return self._event(("task_stop", failed))
+
+
+class ConcurrentSyncPlugin(SyncPlugin):
+    """A plugin with synchronous hookimpls which may run concurrently."""
+
+    @hookimpl(concurrent=True)
+    def task_start(self):
+        return self._event("task_start")
+
+
+class AsyncPlugin:
+    """A plugin with async hookimpls, which may await other coroutines."""
+
+    def __init__(self, events, name, fail=False, before=None):
+        self.events = events
+        self.name = name
+        self.fail = fail
+        self.before = before
+
+    async def _event(self, hook_name):
+        if self.before:
+            await self.before()
+        self.events.append((self.name, hook_name))
+        if self.fail:
+            raise RuntimeError("%s failed" % self.name)
+        return self.name
+
+    @hookimpl
+    async def task_start(self):
+        return await self._event("task_start")
+
+    @hookimpl
+    async def task_stop(self, failed):
+        return await self._event(("task_stop", failed))
+
+
+@pytest.fixture
+def register():
+    plugins = []
+
+    def register(plugin, name=None):
+        pm.register(plugin, name=name)
+        plugins.append(plugin)
+        return plugin
+
+    yield register
+
+    for plugin in plugins:
+        pm.unregister(plugin)
+
+
+def test_async_gathered(register):
+    """Async hookimpls are awaited concurrently."""
+    events = []
+
+    async def main():
+        a_started = asyncio.Event()
+        b_started = asyncio.Event()
+
+        async def a():
+            a_started.set()
+            await asyncio.wait_for(b_started.wait(), 10)
+
+        async def b():
+            b_started.set()
+            await asyncio.wait_for(a_started.wait(), 10)
+
+        register(AsyncPlugin(events, "a", before=a))
+        register(AsyncPlugin(events, "b", before=b))
+        return await ahook.task_start()
+
+    assert sorted(asyncio.run(main())) == ["a", "b"]
+    assert sorted(events) == [("a", "task_start"), ("b", "task_start")]
+
+
+def test_sync_in_thread(register):
+    """Sync hookimpls are called in order, outside of the event loop's thread."""
+    events = []
+    first = register(SyncPlugin(events, "first"))
+    register(AsyncPlugin(events, "async"))
+    second = register(SyncPlugin(events, "second"))
+
+    results = asyncio.run(ahook.task_start())
+
+    assert results == ["second", "first", "async"]
+    assert [e for e in events if e[0] != "async"] == [
+        ("second", "task_start"),
+        ("first", "task_start"),
+    ]
+    assert threading.get_ident() not in first.threads + second.threads
+
+
+def test_only_sync(register):
+    """Hooks without async hookimpls are also called in a thread."""
+    events = []
+    plugin = register(SyncPlugin(events, "sync"))
+
+    assert asyncio.run(ahook.task_stop(failed=True)) == ["sync"]
+    assert events == [("sync", ("task_stop", True))]
+    assert plugin.threads != [threading.get_ident()]
+
+
+def test_errors_aggregated(register):
+    """Errors of async and sync hookimpls are raised together."""
+    events = []
+    register(SyncPlugin(events, "sync", fail=True))
+    register(AsyncPlugin(events, "async", fail=True))
+    register(AsyncPlugin(events, "ok"))
+
+    with pytest.raises(HookErrors) as excinfo:
+        asyncio.run(ahook.task_start())
+
+    assert [str(e) for e in excinfo.value.errors] == ["sync failed", "async failed"]
+    assert ("ok", "task_start") in events
+
+
+def test_sync_errors_flattened(register):
+    """Several errors of sync hookimpls are raised alongside those of async
+    hookimpls, rather than nested."""
+    events = []
+    register(SyncPlugin(events, "sync", fail=True))
+    register(ConcurrentSyncPlugin(events, "concurrent", fail=True))
+    register(AsyncPlugin(events, "async", fail=True))
+
+    with pytest.raises(HookErrors) as excinfo:
+        asyncio.run(ahook.task_start())
+
+    assert sorted(str(e) for e in excinfo.value.errors) == [
+        "async failed",
+        "concurrent failed",
+        "sync failed",
+    ]
+
+
+def test_single_error(register):
+    """A single error is raised as is."""
+    register(AsyncPlugin([], "async", fail=True))
+    register(AsyncPlugin([], "ok"))
+
+    with pytest.raises(RuntimeError, match="async failed"):
+        asyncio.run(ahook.task_start())
+
+
+def test_timeout(register, monkeypatch):
+    """Async hookimpls not finished within the timeout are cancelled."""
+    monkeypatch.setenv("PUBTOOLS_HOOK_TIMEOUT", "0.1")
+    cancelled = []
+
+    async def hang():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    register(AsyncPlugin([], "slow", before=hang), name="slow")
+
+    with pytest.raises(TimeoutError) as excinfo:
+        asyncio.run(ahook.task_start())
+
+    assert "slow hookimpl of task_start did not finish" in str(excinfo.value)
+    assert cancelled == [True]
+
+
+def test_first_result(register):
+    """firstresult hooks with async hookimpls stop at the first result."""
+    calls = []
+
+    class First:
+        @hookimpl
+        async def pubtools_test_async_first(self, value):
+            calls.append("async")
+
+    class Second:
+        @hookimpl
+        def pubtools_test_async_first(self, value):
+            calls.append("sync")
+            return value * 2
+
+    class Third:
+        @hookimpl
+        async def pubtools_test_async_first(self, value):
+            calls.append("unused")
+            return value
+
+    class Wrapper:
+        @hookimpl(wrapper=True)
+        def pubtools_test_async_first(self, value):
+            return (yield)
+
+    register(Third())
+    register(Second())
+    register(First())
+    register(Wrapper())
+
+    assert asyncio.run(ahook.pubtools_test_async_first(value=2)) == 4
+    assert calls == ["async", "sync"]
+
+
+def test_first_result_none(register):
+    """firstresult hooks return None if no hookimpl returned a result."""
+
+    class Impl:
+        @hookimpl
+        async def pubtools_test_async_first(self, value):
+            pass
+
+    register(Impl())
+
+    assert asyncio.run(ahook.pubtools_test_async_first(value=1)) is None
+
+
+def test_unknown_hook():
+    """Only known hooks are provided."""
+    with pytest.raises(AttributeError):
+        ahook.pubtools_no_such_hook
+    with pytest.raises(AttributeError):
+        ahook._private
+
+
+def test_async_task_context(register):
+    """async_task_context awaits lifecycle hooks."""
+    events = []
+    register(AsyncPlugin(events, "async"))
+    register(SyncPlugin(events, "sync"))
+
+    async def main():
+        async with async_task_context():
+            assert sorted(events) == [("async", "task_start"), ("sync", "task_start")]
+            events.clear()
+
+    asyncio.run(main())
+
+    assert sorted(events) == [
+        ("async", ("task_stop", False)),
+        ("sync", ("task_stop", False)),
+    ]
+
+
+@pytest.mark.parametrize(
+    "exception, failed",
+    [(RuntimeError("oops"), True), (SystemExit(0), False), (SystemExit(1), True)],
+)
+def test_async_task_context_failed(register, exception, failed):
+    """async_task_context tells task_stop whether the task failed."""
+    events = []
+    register(AsyncPlugin(events, "async"))
+
+    async def main():
+        async with async_task_context():
+            raise exception
+
+    with pytest.raises(type(exception)):
+        asyncio.run(main())
+
+    assert events[-1] == ("async", ("task_stop", failed))
+
+
+def test_async_task_context_start_failed(register):
+    """If task_start fails, the task doesn't start."""
+    register(AsyncPlugin([], "async", fail=True))
+    ran = []
+
+    async def main():
+        async with async_task_context():
+            ran.append(True)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main())
+
+    assert not ran
+
+
+def test_sync_task_context(register):
+    """task_context runs async hookimpls in their own event loop."""
+    events = []
+    register(AsyncPlugin(events, "async"))
+    register(SyncPlugin(events, "sync"))
+
+    with task_context():
+        assert sorted(events) == [("async", "task_start"), ("sync", "task_start")]
+
+    assert len(events) == 4
+
+
+def test_hook_stats(register, monkeypatch):
+    """The latency of async hookimpls includes awaiting them."""
+    monkeypatch.setenv("PUBTOOLS_HOOK_STATS", "true")
+    register(AsyncPlugin([], "async", before=lambda: asyncio.sleep(0.02)), "async")
+
+    async def main():
+        async with async_task_context():
+            return hook_stats()
+
+    try:
+        stats = asyncio.run(main())
+    finally:
+        hookstats.uninstall()
+
+    assert stats["task_start"]["impls"]["async"]["min"] >= 0.02
+
+
+def test_cancelled(register):
+    """Cancelling a hook call cancels its async hookimpls."""
+    cancelled = []
+    started = []
+
+    async def hang():
+        started.append(True)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    register(AsyncPlugin([], "slow", before=hang))
+
+    async def main():
+        call = asyncio.ensure_future(ahook.task_start())
+        while not started:
+            await asyncio.sleep(0.001)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        # Let the hookimpl's task handle its cancellation.
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+
+    assert cancelled == [True]
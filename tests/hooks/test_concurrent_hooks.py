@@ -0,0 +1,292 @@
+import contextvars
+import sys
+import threading
+
+import pytest
+
+from pubtools._impl import hookdispatch
+from pubtools.pluggy import HookErrors, hookimpl, hookspec, pm, task_context
+
+VAR = contextvars.ContextVar("pubtools_test_var", default=None)
+
+
+@hookspec(concurrent=True)
+def pubtools_test_concurrent(value):
+    """A hook whose hookimpls may all run concurrently, used in tests."""
+
+
+pm.add_hookspecs(sys.modules[__name__])
+
+
+class Plugin:
+    """A plugin implementing task lifecycle hooks."""
+
+    def __init__(self, events, name, fn=None):
+        self.events = events
+        self.name = name
+        self.fn = fn or (lambda: None)
+
+    def _event(self, hook_name):
+        self.fn()
+        self.events.append((self.name, hook_name))
+        return self.name
+
+    @hookimpl
+    def task_start(self):
+        return self._event("task_start")
+
+    @hookimpl
+    def task_stop(self, failed):
+        return self._event("task_stop")
+
+
+class ConcurrentPlugin(Plugin):
+    """A plugin implementing task lifecycle hooks safe to run concurrently."""
+
+    @hookimpl(concurrent=True)
+    def task_start(self):
+        return self._event("task_start")
+
+    @hookimpl(concurrent=True)
+    def task_stop(self, failed):
+        return self._event("task_stop")
+
+
+@pytest.fixture
+def register():
+    plugins = []
+
+    def register(events, name, concurrent=False, fn=None):
+        plugin = (ConcurrentPlugin if concurrent else Plugin)(events, name, fn)
+        pm.register(plugin)
+        plugins.append(plugin)
+        return plugin
+
+    yield register
+
+    for plugin in plugins:
+        pm.unregister(plugin)
+
+
+def test_runs_concurrently(register):
+    """Concurrent hookimpls run at the same time as each other."""
+    barrier = threading.Barrier(2, timeout=10)
+    events = []
+    register(events, "a", concurrent=True, fn=barrier.wait)
+    register(events, "b", concurrent=True, fn=barrier.wait)
+
+    results = hookdispatch.call(pm, "task_start")
+
+    assert sorted(results) == ["a", "b"]
+    assert sorted(events) == [("a", "task_start"), ("b", "task_start")]
+
+
+def test_serial_order_kept(register):
+    """Hookimpls not marked concurrent are still called in LIFO order."""
+    events = []
+    register(events, "first")
+    register(events, "concurrent", concurrent=True)
+    register(events, "second")
+    register(events, "third")
+
+    results = hookdispatch.call(pm, "task_stop", failed=False)
+
+    assert results == ["third", "second", "first", "concurrent"]
+    serial = [name for (name, _) in events if name != "concurrent"]
+    assert serial == ["third", "second", "first"]
+
+
+def test_unmarked_not_dispatched(register, monkeypatch):
+    """Without concurrent hookimpls, the hook is called as usual."""
+    events = []
+    register(events, "a")
+    monkeypatch.setattr(threading, "Thread", None)
+
+    assert hookdispatch.call(pm, "task_start") == ["a"]
+
+
+def test_bounded_workers(register, monkeypatch):
+    """Concurrent hookimpls run on at most PUBTOOLS_HOOK_WORKERS threads."""
+    monkeypatch.setenv("PUBTOOLS_HOOK_WORKERS", "1")
+    threads = set()
+    events = []
+    for name in "abc":
+        register(
+            events,
+            name,
+            concurrent=True,
+            fn=lambda: threads.add(threading.current_thread().ident),
+        )
+
+    hookdispatch.call(pm, "task_start")
+
+    assert len(events) == 3
+    assert len(threads) == 1
+    assert threading.get_ident() not in threads
+
+
+@pytest.mark.parametrize(
+    "name, value, default",
+    [
+        ("PUBTOOLS_HOOK_WORKERS", "0", "8"),
+        ("PUBTOOLS_HOOK_WORKERS", "many", "8"),
+        ("PUBTOOLS_HOOK_TIMEOUT", "10s", "60.0"),
+        ("PUBTOOLS_HOOK_TIMEOUT", "-1", "60.0"),
+    ],
+)
+def test_invalid_settings(register, monkeypatch, caplog, name, value, default):
+    """Invalid settings are ignored with a warning."""
+    monkeypatch.setenv(name, value)
+    events = []
+    register(events, "a", concurrent=True)
+
+    with task_context():
+        pass
+
+    assert len(events) == 2
+    assert "Ignoring invalid %s=%r, using %s" % (name, value, default) in caplog.text
+
+
+def test_context_propagated(register):
+    """Concurrent hookimpls run within the caller's context."""
+    seen = []
+    register([], "a", concurrent=True, fn=lambda: seen.append(VAR.get()))
+
+    token = VAR.set("value")
+    try:
+        hookdispatch.call(pm, "task_start")
+    finally:
+        VAR.reset(token)
+
+    assert seen == ["value"]
+
+
+def test_single_error_raised(register):
+    """A single error is raised as is, once all hookimpls have finished."""
+    events = []
+
+    def fail():
+        raise RuntimeError("simulated error")
+
+    register(events, "a", concurrent=True, fn=fail)
+    register(events, "b", concurrent=True)
+    register(events, "c")
+
+    with pytest.raises(RuntimeError, match="simulated error"):
+        hookdispatch.call(pm, "task_start")
+
+    assert sorted(events) == [("b", "task_start"), ("c", "task_start")]
+
+
+def test_errors_aggregated(register):
+    """Errors of several hookimpls are raised together."""
+
+    def fail(message):
+        def fn():
+            raise RuntimeError(message)
+
+        return fn
+
+    register([], "a", concurrent=True, fn=fail("error a"))
+    register([], "b", concurrent=True, fn=fail("error b"))
+    register([], "c", fn=fail("error c"))
+
+    with pytest.raises(HookErrors) as excinfo:
+        hookdispatch.call(pm, "task_start")
+
+    error = excinfo.value
+    assert error.hook_name == "task_start"
+    messages = [str(e) for e in error.errors]
+    # The serial error comes first.
+    assert messages[0] == "error c"
+    assert sorted(messages) == ["error a", "error b", "error c"]
+    assert error.__cause__ is error.errors[0]
+    assert "3 hookimpls of task_start failed" in str(error)
+
+
+def test_timeout(register, monkeypatch, caplog):
+    """Hookimpls which don't finish within the timeout are reported."""
+    monkeypatch.setenv("PUBTOOLS_HOOK_TIMEOUT", "0.5")
+    unblock = threading.Event()
+    events = []
+    register(events, "slow", concurrent=True, fn=lambda: unblock.wait(10))
+    register(events, "fast", concurrent=True)
+
+    try:
+        with pytest.raises(TimeoutError) as excinfo:
+            hookdispatch.call(pm, "task_stop", failed=False)
+    finally:
+        unblock.set()
+
+    assert "did not finish within 0.5 seconds" in str(excinfo.value)
+    assert "did not finish" in caplog.text
+    assert ("fast", "task_stop") in events
+
+
+def test_wrappers_wrap_serial(register):
+    """Hook wrappers only wrap the hookimpls called serially."""
+    events = []
+    register(events, "serial")
+    register(events, "concurrent", concurrent=True)
+    seen = []
+
+    class Wrapper:
+        @hookimpl(wrapper=True)
+        def task_start(self):
+            result = yield
+            seen.append(result)
+            return result
+
+    wrapper = Wrapper()
+    pm.register(wrapper)
+    try:
+        results = hookdispatch.call(pm, "task_start")
+    finally:
+        pm.unregister(wrapper)
+
+    assert results == ["serial", "concurrent"]
+    assert seen == [["serial"]]
+
+
+def test_concurrent_hookspec():
+    """All hookimpls of a hookspec declared concurrent run concurrently."""
+    barrier = threading.Barrier(2, timeout=10)
+
+    class Impl:
+        @hookimpl
+        def pubtools_test_concurrent(self, value):
+            barrier.wait()
+            return value
+
+    impls = [Impl(), Impl()]
+    for impl in impls:
+        pm.register(impl)
+    try:
+        assert hookdispatch.call(pm, "pubtools_test_concurrent", value=1) == [1, 1]
+    finally:
+        for impl in impls:
+            pm.unregister(impl)
+
+
+def test_task_context(register):
+    """task_context dispatches lifecycle hooks concurrently."""
+    barrier = threading.Barrier(2, timeout=10)
+    events = []
+    register(events, "a", concurrent=True, fn=barrier.wait)
+    register(events, "b", concurrent=True, fn=barrier.wait)
+
+    with task_context():
+        assert len(events) == 2
+
+    assert len(events) == 4
+
+
+def test_invalid_options():
+    """Options which can't be honoured are rejected."""
+    with pytest.raises(ValueError) as excinfo:
+        hookimpl(concurrent=True, hookwrapper=True)
+    assert "Hook wrappers can't be run concurrently" in str(excinfo.value)
+
+    with pytest.raises(ValueError) as excinfo:
+        hookspec(concurrent=True, firstresult=True)
+    assert "firstresult hooks can't be run concurrently" in str(excinfo.value)
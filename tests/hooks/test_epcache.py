@@ -0,0 +1,172 @@
+import json
+import os
+import sys
+
+if sys.version_info >= (3, 10):
+    from importlib.metadata import EntryPoint
+else:
+    from importlib_metadata import EntryPoint
+
+import pytest
+
+from pubtools._impl import epcache, pluggy
+
+
+class ScanSpy(object):
+    def __init__(self, eps):
+        self.eps = eps
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return iter(self.eps)
+
+
+@pytest.fixture
+def scan():
+    return ScanSpy(
+        [
+            EntryPoint("some-script", "pubtools.pluggy:pm", "console_scripts"),
+            EntryPoint("anything", "pubtools._impl.mallopt", "pubtools.hooks"),
+        ]
+    )
+
+
+@pytest.fixture
+def site_dir(tmp_path, monkeypatch):
+    """A directory on sys.path holding some fake distribution metadata."""
+    site = tmp_path / "site"
+    (site / "foo-1.0.dist-info").mkdir(parents=True)
+    (site / "foo-1.0.dist-info" / "entry_points.txt").write_text("")
+    monkeypatch.syspath_prepend(str(site))
+    return site
+
+
+def test_index_roundtrip(scan, site_dir):
+    """Entry points are scanned once, then served from the on-disk index."""
+    eps = epcache.get_entry_points(scan)
+    assert scan.calls == 1
+    assert [(ep.name, ep.value, ep.group, dist) for (ep, dist) in eps] == [
+        ("some-script", "pubtools.pluggy:pm", "console_scripts", None),
+        ("anything", "pubtools._impl.mallopt", "pubtools.hooks", None),
+    ]
+
+    # A second lookup in the same process uses the memo, no scan
+    assert epcache.get_entry_points(scan) == eps
+    assert scan.calls == 1
+
+    # After forgetting the memo (as in a new process), the on-disk index is
+    # still valid and is used instead of scanning
+    epcache.clear()
+    assert epcache.get_entry_points(scan) == eps
+    assert scan.calls == 1
+
+
+@pytest.mark.parametrize("change", ["install", "upgrade", "rewrite"])
+def test_index_invalidated(scan, site_dir, change):
+    """On-disk index is rebuilt when installed distributions change."""
+    epcache.get_entry_points(scan)
+    assert scan.calls == 1
+
+    if change == "install":
+        (site_dir / "bar-2.0.dist-info").mkdir()
+    elif change == "upgrade":
+        os.rename(site_dir / "foo-1.0.dist-info", site_dir / "foo-1.1.dist-info")
+    else:
+        ep_file = site_dir / "foo-1.0.dist-info" / "entry_points.txt"
+        stat = ep_file.stat()
+        os.utime(ep_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    epcache.clear()
+    epcache.get_entry_points(scan)
+    assert scan.calls == 2
+
+
+def test_index_ignores_bad_data(scan, site_dir, tmp_path, monkeypatch):
+    """Unreadable or foreign index files are ignored and overwritten."""
+    path = tmp_path / "index.json"
+    monkeypatch.setenv("PUBTOOLS_ENTRY_POINTS_CACHE", str(path))
+
+    path.write_text("not json")
+    epcache.get_entry_points(scan)
+    assert scan.calls == 1
+
+    data = json.loads(path.read_text())
+    data["version"] = -1
+    path.write_text(json.dumps(data))
+
+    epcache.clear()
+    epcache.get_entry_points(scan)
+    assert scan.calls == 2
+    assert json.loads(path.read_text())["version"] == epcache.VERSION
+
+
+def test_index_disabled(scan, tmp_path, monkeypatch):
+    """Setting the cache path to an empty string disables on-disk index."""
+    monkeypatch.setenv("PUBTOOLS_ENTRY_POINTS_CACHE", "")
+
+    epcache.get_entry_points(scan)
+    epcache.clear()
+    epcache.get_entry_points(scan)
+
+    assert scan.calls == 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_index_write_failure(scan, tmp_path, monkeypatch, caplog):
+    """Failing to write the index is tolerated."""
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    monkeypatch.setenv("PUBTOOLS_ENTRY_POINTS_CACHE", str(blocker / "index.json"))
+
+    caplog.set_level("DEBUG")
+    assert len(epcache.get_entry_points(scan)) == 2
+    assert "Failed to write entry point index" in caplog.text
+
+
+def test_index_replace_failure(scan, tmp_path, monkeypatch, caplog):
+    """If the index can't be moved into place, the temporary file is removed."""
+    path = tmp_path / "index.json"
+    monkeypatch.setenv("PUBTOOLS_ENTRY_POINTS_CACHE", str(path))
+
+    def fail_replace(src, dst):
+        raise OSError("simulated error")
+
+    monkeypatch.setattr(os, "replace", fail_replace)
+
+    caplog.set_level("DEBUG")
+    assert len(epcache.get_entry_points(scan)) == 2
+    assert "Failed to write entry point index" in caplog.text
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_default_cache_path(monkeypatch, tmp_path):
+    """Default index location is under XDG_CACHE_HOME."""
+    monkeypatch.delenv("PUBTOOLS_ENTRY_POINTS_CACHE")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+    path = epcache.cache_path()
+    assert path.startswith(str(tmp_path / "pubtools" / "entry-points-"))
+
+
+def test_fingerprint_missing_path(tmp_path):
+    """Fingerprint tolerates sys.path entries which don't exist."""
+    missing = str(tmp_path / "missing")
+    assert epcache.fingerprint([missing]) == epcache.fingerprint([missing])
+    assert epcache.fingerprint([missing]) != epcache.fingerprint([str(tmp_path)])
+
+
+def test_resolve_hooks_uses_index(monkeypatch):
+    """resolve_hooks does not rescan installed distributions on repeated calls."""
+    calls = []
+
+    def fake_entry_points(group=None):
+        calls.append(group)
+        return []
+
+    monkeypatch.setattr(pluggy, "entry_points", fake_entry_points)
+
+    pluggy.resolve_hooks()
+    pluggy.resolve_hooks()
+
+    assert calls == ["console_scripts", "pubtools.hooks", "pubtools.lazy_hooks"]
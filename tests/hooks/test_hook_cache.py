@@ -0,0 +1,246 @@
+import sys
+import threading
+
+import pytest
+
+from pubtools._impl import hookcache
+from pubtools._impl.pluggy import hook_cache
+from pubtools.pluggy import hookimpl, hookspec, pm, task_context
+
+
+@hookspec(firstresult=True, cache="task")
+def pubtools_test_cached(key):
+    """A cached hook used in tests."""
+
+
+@hookspec(firstresult=True, cache="task", cache_ttl=60)
+def pubtools_test_cached_ttl(key):
+    """A cached hook with a TTL used in tests."""
+
+
+@hookspec(firstresult=True)
+def pubtools_test_uncached(key):
+    """An uncached hook used in tests."""
+
+
+pm.add_hookspecs(sys.modules[__name__])
+
+
+class Counter:
+    def __init__(self, result="result"):
+        self.result = result
+        self.calls = []
+
+    def _call(self, key):
+        self.calls.append(key)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    @hookimpl
+    def pubtools_test_cached(self, key):
+        return self._call(key)
+
+    @hookimpl
+    def pubtools_test_cached_ttl(self, key):
+        return self._call(key)
+
+    @hookimpl
+    def pubtools_test_uncached(self, key):
+        return self._call(key)
+
+    @hookimpl
+    def get_cert_key_paths(self, server_url):
+        return self._call(server_url)
+
+
+@pytest.fixture
+def counter():
+    counter = Counter()
+    pm.register(counter)
+    yield counter
+    pm.unregister(counter)
+
+
+def test_cached_within_task(counter):
+    """Results are memoized by arguments within a task."""
+    with task_context():
+        assert pm.hook.pubtools_test_cached(key="a") == "result"
+        assert pm.hook.pubtools_test_cached(key="a") == "result"
+        pm.hook.pubtools_test_cached(key="b")
+        assert counter.calls == ["a", "b"]
+
+    # Cache is cleared at the end of the task
+    with task_context():
+        pm.hook.pubtools_test_cached(key="a")
+    assert counter.calls == ["a", "b", "a"]
+
+
+def test_not_cached_outside_task(counter):
+    """Results are not memoized outside of a task."""
+    pm.hook.pubtools_test_cached(key="a")
+    pm.hook.pubtools_test_cached(key="a")
+
+    assert counter.calls == ["a", "a"]
+
+
+def test_uncached_hooks(counter):
+    """Hooks not opting into caching are always called."""
+    with task_context():
+        pm.hook.pubtools_test_uncached(key="a")
+        pm.hook.pubtools_test_uncached(key="a")
+        pm.hook.task_start()
+
+    assert counter.calls == ["a", "a"]
+
+
+def test_cert_key_paths_cached(counter):
+    """get_cert_key_paths results are memoized within a task."""
+    with task_context():
+        pm.hook.get_cert_key_paths(server_url="https://example.com/")
+        pm.hook.get_cert_key_paths(server_url="https://example.com/")
+
+    assert counter.calls == ["https://example.com/"]
+
+
+def test_cert_key_paths_ttl(counter, monkeypatch):
+    """get_cert_key_paths results are memoized for at most 5 minutes."""
+    now = [1000.0]
+    monkeypatch.setattr(hookcache.time, "monotonic", lambda: now[0])
+
+    with task_context():
+        pm.hook.get_cert_key_paths(server_url="https://example.com/")
+        now[0] += 299
+        pm.hook.get_cert_key_paths(server_url="https://example.com/")
+        now[0] += 2
+        pm.hook.get_cert_key_paths(server_url="https://example.com/")
+
+    assert counter.calls == ["https://example.com/"] * 2
+
+
+def test_cache_ttl(counter, monkeypatch):
+    """Results older than the TTL are not used."""
+    now = [1000.0]
+    monkeypatch.setattr(hookcache.time, "monotonic", lambda: now[0])
+
+    with task_context():
+        pm.hook.pubtools_test_cached_ttl(key="a")
+        now[0] += 59
+        pm.hook.pubtools_test_cached_ttl(key="a")
+        now[0] += 2
+        pm.hook.pubtools_test_cached_ttl(key="a")
+
+    assert counter.calls == ["a", "a"]
+
+
+def test_invalidated_on_register(counter):
+    """Results are memoized per set of registered hookimpls."""
+    other = Counter("other")
+
+    with task_context():
+        assert pm.hook.pubtools_test_cached(key="a") == "result"
+        pm.register(other)
+        try:
+            assert pm.hook.pubtools_test_cached(key="a") == "other"
+        finally:
+            pm.unregister(other)
+        assert pm.hook.pubtools_test_cached(key="a") == "result"
+
+    assert counter.calls == ["a"]
+    assert other.calls == ["a"]
+
+
+def test_unhashable_not_cached(counter):
+    """Calls with unhashable arguments are not memoized."""
+    with task_context():
+        pm.hook.pubtools_test_cached(key=["a"])
+        pm.hook.pubtools_test_cached(key=["a"])
+
+    assert counter.calls == [["a"], ["a"]]
+
+
+def test_errors_not_cached(counter):
+    """Calls which raise are not memoized."""
+    counter.result = RuntimeError("simulated error")
+
+    with task_context():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                pm.hook.pubtools_test_cached(key="a")
+
+    assert counter.calls == ["a", "a"]
+
+
+def test_task_start_failure(counter):
+    """Caching stops if the task fails to start."""
+
+    class FailingStart:
+        @hookimpl
+        def task_start(self):
+            raise RuntimeError("simulated error")
+
+    failing = FailingStart()
+    pm.register(failing)
+    try:
+        with pytest.raises(RuntimeError):
+            with task_context():
+                pass
+    finally:
+        pm.unregister(failing)
+
+    pm.hook.pubtools_test_cached(key="a")
+    pm.hook.pubtools_test_cached(key="a")
+    assert counter.calls == ["a", "a"]
+
+
+def test_invalid_cache_options():
+    """Only firstresult hooks may be cached, in a known scope."""
+    with pytest.raises(ValueError) as excinfo:
+        hookspec(firstresult=True, cache="forever")
+    assert "Unknown hook cache scope: forever" in str(excinfo.value)
+
+    with pytest.raises(ValueError) as excinfo:
+        hookspec(cache="task")
+    assert "Only firstresult hooks can be cached" in str(excinfo.value)
+
+
+def test_nested_tasks(counter):
+    """Nested tasks have caches of their own, which don't outlive them."""
+    with task_context():
+        pm.hook.pubtools_test_cached(key="a")
+        with task_context():
+            pm.hook.pubtools_test_cached(key="a")
+            pm.hook.pubtools_test_cached(key="a")
+        pm.hook.pubtools_test_cached(key="a")
+    pm.hook.pubtools_test_cached(key="a")
+
+    assert counter.calls == ["a", "a", "a"]
+    assert len(hook_cache._results) == 0
+
+
+def test_concurrent_tasks(counter):
+    """A task stopping doesn't clear the cache of another task running
+    concurrently."""
+    barrier = threading.Barrier(2, timeout=10)
+
+    def short():
+        with task_context():
+            pm.hook.pubtools_test_cached(key="short")
+            barrier.wait()
+        barrier.wait()
+
+    def long():
+        with task_context():
+            pm.hook.pubtools_test_cached(key="long")
+            barrier.wait()
+            # The short task stops meanwhile.
+            barrier.wait()
+            pm.hook.pubtools_test_cached(key="long")
+
+    threads = [threading.Thread(target=fn) for fn in (short, long)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(counter.calls) == ["long", "short"]
@@ -0,0 +1,182 @@
+import logging
+import threading
+import time
+
+import pytest
+
+from pubtools._impl import hookstats
+from pubtools.pluggy import hook_stats, hookimpl, pm, task_context
+
+
+class SlowPlugin:
+    @hookimpl
+    def task_start(self):
+        time.sleep(0.02)
+
+
+class FastPlugin:
+    @hookimpl
+    def task_start(self):
+        pass
+
+    @hookimpl
+    def task_stop(self, failed):
+        pass
+
+
+class WrapperPlugin:
+    @hookimpl(wrapper=True)
+    def task_start(self):
+        return (yield)
+
+
+@pytest.fixture
+def plugins(monkeypatch):
+    """Enables hook statistics and registers some plugins."""
+    monkeypatch.setenv("PUBTOOLS_HOOK_STATS", "true")
+    plugins = {"slow": SlowPlugin(), "fast": FastPlugin(), "wrapper": WrapperPlugin()}
+    for name, plugin in plugins.items():
+        pm.register(plugin, name=name)
+    yield plugins
+    hookstats.uninstall()
+    for plugin in plugins.values():
+        pm.unregister(plugin)
+
+
+def test_hook_stats(plugins):
+    """Calls are timed per hook and per implementing plugin."""
+    with task_context():
+        pm.hook.task_start()
+        stats = hook_stats()
+
+    start = stats["task_start"]
+    assert start["count"] == 2
+    assert start["sum"] >= 0.04
+    assert start["impls"]["slow"]["count"] == 2
+    assert start["impls"]["slow"]["min"] >= 0.02
+    assert start["impls"]["fast"]["count"] == 2
+    assert start["impls"]["fast"]["max"] < start["impls"]["slow"]["min"]
+    # Wrappers aren't timed individually
+    assert "wrapper" not in start["impls"]
+    # task_stop is yet to be called
+    assert "task_stop" not in stats
+
+
+def test_hook_stats_report(plugins, caplog):
+    """A report is logged at the end of the task, after which stats are reset."""
+    caplog.set_level(logging.INFO, "pubtools")
+
+    with task_context():
+        pass
+
+    lines = [
+        line
+        for record in caplog.records
+        for line in record.getMessage().splitlines()
+        if "Hook call statistics" in record.getMessage()
+    ]
+    assert lines[0] == "Hook call statistics (sorted by total time):"
+    # Sorted by total time, with plugins beneath each hook
+    assert lines[1].startswith("  task_start: 1 calls, total ")
+    assert lines[2].startswith("    slow: 1 calls, total ")
+    fast = [i for (i, line) in enumerate(lines) if line.startswith("    fast: ")]
+    stop = [i for (i, line) in enumerate(lines) if line.startswith("  task_stop: ")]
+    assert fast[0] < stop[0]
+    assert lines[stop[0]].startswith("  task_stop: 1 calls, total ")
+    assert hook_stats() == {}
+
+
+def test_hook_stats_concurrent_tasks(plugins):
+    """Tasks running concurrently each get statistics of their own."""
+    barrier = threading.Barrier(2, timeout=10)
+    results = {}
+
+    def run(name, calls):
+        with task_context():
+            for _ in range(calls):
+                pm.hook.task_start()
+            barrier.wait()
+            results[name] = hook_stats()["task_start"]["count"]
+            barrier.wait()
+
+    threads = [
+        threading.Thread(target=run, args=(name, calls))
+        for (name, calls) in [("a", 1), ("b", 3)]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Each including the call made by task_context itself
+    assert results == {"a": 2, "b": 4}
+
+
+def test_hook_stats_report_empty(plugins, caplog):
+    """Nothing is logged if no hooks were called."""
+    caplog.set_level(logging.INFO, "pubtools")
+    hookstats.install(pm)
+
+    hookstats.report()
+
+    assert "Hook call statistics" not in caplog.text
+
+
+def test_hook_stats_uninstall(plugins):
+    """Uninstalling restores the original hookimpl functions."""
+    impls = pm.hook.task_start.get_hookimpls()
+    functions = [impl.function for impl in impls]
+
+    with task_context():
+        pass
+    assert [impl.function for impl in impls] != functions
+
+    hookstats.uninstall()
+
+    assert [impl.function for impl in impls] == functions
+    assert hook_stats() is None
+
+
+def test_hook_stats_errors(plugins):
+    """Calls raising exceptions are timed too."""
+
+    class FailingPlugin:
+        @hookimpl
+        def task_stop(self, failed):
+            raise RuntimeError("simulated error")
+
+    failing = FailingPlugin()
+    pm.register(failing, name="failing")
+    hookstats.install(pm)
+    try:
+        with pytest.raises(RuntimeError):
+            pm.hook.task_stop(failed=False)
+    finally:
+        pm.unregister(failing)
+
+    stats = hook_stats()["task_stop"]
+    assert stats["count"] == 1
+    assert stats["impls"]["failing"]["count"] == 1
+
+
+def test_hook_stats_report_error(plugins, monkeypatch, caplog):
+    """Errors while reporting are logged rather than raised."""
+    hookstats.install(pm)
+
+    def broken():
+        raise RuntimeError("simulated error")
+
+    monkeypatch.setattr(hookstats._STATS, "stats", broken)
+    hookstats.report()
+
+    assert "Failed to report hook call statistics" in caplog.text
+
+
+def test_hook_stats_disabled(monkeypatch):
+    """Nothing is collected unless enabled."""
+    monkeypatch.delenv("PUBTOOLS_HOOK_STATS", raising=False)
+
+    with task_context():
+        pass
+
+    assert hook_stats() is None
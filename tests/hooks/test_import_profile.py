@@ -0,0 +1,153 @@
+import logging
+import sys
+
+if sys.version_info >= (3, 10):
+    from importlib.metadata import EntryPoint
+else:
+    from importlib_metadata import EntryPoint
+
+import pytest
+
+from pubtools._impl import importprof, pluggy
+from pubtools.pluggy import task_context
+
+
+@pytest.fixture
+def fake_libs(tmp_path, monkeypatch):
+    """Installs some fake task libraries found via pubtools.hooks entry points."""
+    site = tmp_path / "site"
+    site.mkdir()
+    (site / "pubtools_test_prof_big.py").write_text(
+        "import pubtools_test_prof_dep\n"
+        "try:\n"
+        "    import pubtools_test_prof_missing\n"
+        "except ImportError:\n"
+        "    pass\n"
+        "DATA = list(range(10000))\n"
+    )
+    (site / "pubtools_test_prof_dep.py").write_text("DEP = [0] * 1000\n")
+    (site / "pubtools_test_prof_small.py").write_text("")
+    monkeypatch.syspath_prepend(str(site))
+
+    hooks = [
+        EntryPoint("big", "pubtools_test_prof_big", "pubtools.hooks"),
+        EntryPoint("small", "pubtools_test_prof_small", "pubtools.hooks"),
+    ]
+    monkeypatch.setattr(
+        pluggy,
+        "entry_points",
+        lambda group=None: hooks if group == "pubtools.hooks" else [],
+    )
+
+    yield
+
+    for name in (
+        "pubtools_test_prof_big",
+        "pubtools_test_prof_dep",
+        "pubtools_test_prof_small",
+    ):
+        sys.modules.pop(name, None)
+
+
+def test_import_profile_report(fake_libs, monkeypatch, caplog):
+    """Import profile is logged at the end of task_context if enabled."""
+    monkeypatch.setenv("PUBTOOLS_IMPORT_PROFILE", "true")
+    caplog.set_level(logging.INFO, "pubtools")
+
+    with task_context():
+        assert "Import profile" not in caplog.text
+
+    lines = [line for r in caplog.records for line in r.getMessage().splitlines()]
+    assert lines[0] == "Import profile for resolved hooks (sorted by wall time):"
+
+    # Each entry point is reported, with the transitive imports
+    # reported beneath the entry point importing them
+    ep_lines = [line for line in lines if line.startswith("  EntryPoint")]
+    assert len(ep_lines) == 2
+    assert "wall" in ep_lines[0] and "rss" in ep_lines[0] and "alloc" in ep_lines[0]
+    big_idx = [i for (i, line) in enumerate(lines) if "name='big'" in line][0]
+    module_lines = [line.strip() for line in lines[big_idx + 1 : big_idx + 3]]
+    assert sorted(line.split(":")[0] for line in module_lines) == [
+        "pubtools_test_prof_big",
+        "pubtools_test_prof_dep",
+    ]
+
+    # Loaded modules look exactly like they would have without profiling
+    big = sys.modules["pubtools_test_prof_big"]
+    assert type(big.__loader__).__name__ == "SourceFileLoader"
+    assert big.__spec__.loader is big.__loader__
+
+    # Nothing is reported again for a later task, as nothing new is imported
+    caplog.clear()
+    with task_context():
+        pass
+    assert "Import profile" not in caplog.text
+
+
+def test_import_profile_disabled(fake_libs, caplog):
+    """Nothing is measured or logged by default."""
+    caplog.set_level(logging.INFO, "pubtools")
+
+    with task_context():
+        pass
+
+    assert "pubtools_test_prof_big" in sys.modules
+    assert "Import profile" not in caplog.text
+
+
+def test_import_profile_report_errors(monkeypatch, caplog):
+    """Failing to report is logged rather than breaking the task."""
+    profiler = importprof.ImportProfiler()
+    profiler.results.append(None)
+    monkeypatch.setattr(importprof, "_PROFILER", profiler)
+
+    importprof.report()
+
+    assert "Failed to report import profile" in caplog.text
+
+
+def test_import_profile_nested(tmp_path, monkeypatch, caplog):
+    """An entry point loaded while importing another is profiled beneath it."""
+    monkeypatch.setenv("PUBTOOLS_IMPORT_PROFILE", "true")
+    monkeypatch.setattr(importprof, "_PROFILER", None)
+    caplog.set_level(logging.INFO, "pubtools")
+
+    (tmp_path / "pubtools_test_prof_outer.py").write_text(
+        "import sys\n"
+        "if sys.version_info >= (3, 10):\n"
+        "    from importlib.metadata import EntryPoint\n"
+        "else:\n"
+        "    from importlib_metadata import EntryPoint\n"
+        "from pubtools._impl import importprof\n"
+        "importprof.load(\n"
+        "    EntryPoint('inner', 'pubtools_test_prof_inner', 'pubtools.hooks')\n"
+        ")\n"
+    )
+    (tmp_path / "pubtools_test_prof_inner.py").write_text(
+        "import pubtools_test_prof_dep\n"
+    )
+    (tmp_path / "pubtools_test_prof_dep.py").write_text("")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in ("outer", "inner", "dep"):
+        monkeypatch.delitem(sys.modules, "pubtools_test_prof_" + name, raising=False)
+
+    importprof.load(EntryPoint("outer", "pubtools_test_prof_outer", "pubtools.hooks"))
+    (profile,) = importprof._PROFILER.results
+    assert [p.ep.name for p in profile.walk()] == ["outer", "inner"]
+    importprof.report()
+
+    lines = caplog.records[0].getMessage().splitlines()[1:]
+    assert [line.split(":")[0] for line in lines[:3]] == [
+        "  EntryPoint(name='outer', value='pubtools_test_prof_outer', "
+        "group='pubtools.hooks')",
+        "    pubtools_test_prof_outer",
+        "    EntryPoint(name='inner', value='pubtools_test_prof_inner', "
+        "group='pubtools.hooks')",
+    ]
+    assert sorted(line.split(":")[0] for line in lines[3:]) == [
+        "      pubtools_test_prof_dep",
+        "      pubtools_test_prof_inner",
+    ]
+    # A single finder was installed for both loads
+    finders = [f for f in sys.meta_path if isinstance(f, importprof._ProfilingFinder)]
+    assert [f.profiler for f in finders].count(importprof._PROFILER) == 1
@@ -0,0 +1,98 @@
+import sys
+import textwrap
+
+import pytest
+
+from pubtools._impl import lazyhooks
+from pubtools.pluggy import pm, task_context
+
+
+@pytest.fixture
+def kettle_dist(tmp_path, monkeypatch, request):
+    """Installs a fake distribution with a task and lazily declared hooks."""
+    suffix = request.node.name.replace("[", "_").replace("]", "").replace("-", "_")
+    hook_name = "kettle_boiled_" + suffix
+    task_module = "pubtools_test_task_" + suffix
+    hooks_module = "pubtools_test_hooks_" + suffix
+
+    site = tmp_path / "site"
+    dist_info = site / "kettle-1.0.dist-info"
+    dist_info.mkdir(parents=True)
+    (dist_info / "METADATA").write_text(
+        "Metadata-Version: 2.1\nName: kettle\nVersion: 1.0\n"
+    )
+    (dist_info / "entry_points.txt").write_text(textwrap.dedent(f"""
+            [console_scripts]
+            pubtools-kettle-boil = {task_module}:main
+
+            [pubtools.lazy_hooks]
+            {hook_name} = {hooks_module}
+            """))
+    (site / f"{task_module}.py").write_text("def main():\n    pass\n")
+    (site / f"{hooks_module}.py").write_text(textwrap.dedent(f"""
+            import sys
+            from pubtools.pluggy import hookimpl, hookspec, pm
+
+            @hookspec(firstresult=True)
+            def {hook_name}():
+                pass
+
+            pm.add_hookspecs(sys.modules[__name__])
+
+            class Impl:
+                @hookimpl
+                def {hook_name}(self):
+                    return "boiled"
+
+            pm.register(Impl(), name=__name__)
+            """))
+
+    monkeypatch.syspath_prepend(str(site))
+
+    yield hook_name, task_module, hooks_module
+
+    if pm.has_plugin(hooks_module):
+        pm.unregister(name=hooks_module)
+    for module in (task_module, hooks_module):
+        sys.modules.pop(module, None)
+
+
+def test_lazy_hooks_loaded_on_demand(kettle_dist, monkeypatch):
+    """In lazy mode, declared hook modules are only imported once the hook is used."""
+    hook_name, task_module, hooks_module = kettle_dist
+    monkeypatch.setenv("PUBTOOLS_LAZY_HOOKS", "true")
+
+    with task_context():
+        # Nothing from the distribution was imported yet
+        assert task_module not in sys.modules
+        assert hooks_module not in sys.modules
+
+        # Looking up the hook imports the module declaring it
+        assert getattr(pm.hook, hook_name)() == "boiled"
+        assert hooks_module in sys.modules
+
+        # The task module was never needed
+        assert task_module not in sys.modules
+
+    # Hook is no longer pending, and a later task doesn't defer it again
+    with task_context():
+        assert hook_name not in lazyhooks._PENDING
+
+
+def test_lazy_hooks_eager_by_default(kettle_dist):
+    """Without lazy mode, everything is imported during hook resolution."""
+    hook_name, task_module, hooks_module = kettle_dist
+
+    with task_context():
+        assert task_module in sys.modules
+        assert hooks_module in sys.modules
+        assert getattr(pm.hook, hook_name)() == "boiled"
+
+
+def test_lazy_hooks_unknown_hook(monkeypatch):
+    """Lookup of undefined hooks still fails as usual in lazy mode."""
+    monkeypatch.setenv("PUBTOOLS_LAZY_HOOKS", "true")
+
+    with task_context():
+        with pytest.raises(AttributeError):
+            pm.hook.no_such_hook_exists()
@@ -0,0 +1,282 @@
+import asyncio
+import threading
+
+import pluggy
+import pytest
+
+from pubtools.pluggy import async_task_context, hookimpl, pm, task_context
+
+
+class CertPlugin:
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    @hookimpl
+    def get_cert_key_paths(self, server_url):
+        self.calls += 1
+        return self.result
+
+
+class EventPlugin:
+    """Records task_stop calls into a shared list, under a name."""
+
+    def __init__(self, events, name):
+        self.events = events
+        self.name = name
+
+    @hookimpl
+    def task_stop(self, failed):
+        self.events.append(self.name)
+
+
+class TryFirstPlugin(EventPlugin):
+    @hookimpl(tryfirst=True)
+    def task_stop(self, failed):
+        self.events.append(self.name)
+
+
+class TryLastPlugin(EventPlugin):
+    @hookimpl(trylast=True)
+    def task_stop(self, failed):
+        self.events.append(self.name)
+
+
+class ConcurrentPlugin(EventPlugin):
+    @hookimpl(concurrent=True)
+    def task_stop(self, failed):
+        self.events.append(self.name)
+
+
+def test_scoped_to_task():
+    """Plugins registered in a task are only visible within the task."""
+    plugin = CertPlugin(("cert", "key"))
+
+    with task_context():
+        pm.register(plugin, scope="task")
+        assert pm.is_registered(plugin)
+        assert pm.hook.get_cert_key_paths(server_url="https://example.com/") == (
+            "cert",
+            "key",
+        )
+
+    assert not pm.is_registered(plugin)
+    assert pm.hook.get_cert_key_paths(server_url="https://example.com/") is None
+
+
+def test_unregister():
+    """Plugins may be unregistered from a task, by plugin or by name."""
+    plugin = CertPlugin(("cert", "key"))
+
+    with task_context():
+        pm.register(plugin, scope="task")
+        assert pm.unregister(plugin) is plugin
+        assert not pm.is_registered(plugin)
+
+        name = pm.register(plugin, scope="task")
+        assert pm.unregister(name=name) is plugin
+        assert pm.hook.get_cert_key_paths(server_url="https://example.com/") is None
+
+
+def test_global_unaffected():
+    """Global registration works as before within a task."""
+    plugin = CertPlugin(("cert", "key"))
+
+    with task_context():
+        pm.register(plugin)
+        assert pm.is_registered(plugin)
+        pm.unregister(plugin)
+
+    assert not pm.is_registered(plugin)
+
+
+def test_isolated_between_threads():
+    """Tasks running concurrently in threads each see their own plugins."""
+    barrier = threading.Barrier(2, timeout=10)
+    results = {}
+
+    def run(name):
+        with task_context():
+            pm.register(CertPlugin((name, name)), scope="task")
+            barrier.wait()
+            results[name] = pm.hook.get_cert_key_paths(server_url="https://x/")
+            barrier.wait()
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": ("a", "a"), "b": ("b", "b")}
+
+
+def test_isolated_between_async_tasks():
+    """Tasks running concurrently as asyncio tasks each see their own plugins."""
+
+    async def run(name, registered, other_registered):
+        async with async_task_context():
+            pm.register(CertPlugin((name, name)), scope="task")
+            registered.set()
+            await asyncio.wait_for(other_registered.wait(), 10)
+            return pm.hook.get_cert_key_paths(server_url="https://x/")
+
+    async def main():
+        a, b = asyncio.Event(), asyncio.Event()
+        return await asyncio.gather(run("a", a, b), run("b", b, a))
+
+    assert asyncio.run(main()) == [("a", "a"), ("b", "b")]
+
+
+def test_cache_isolated():
+    """Memoized results of a task's plugins aren't used by other tasks."""
+    first = CertPlugin(("first", "first"))
+    second = CertPlugin(("second", "second"))
+
+    with task_context():
+        pm.register(first, scope="task")
+        with task_context():
+            pm.register(second, scope="task")
+            assert pm.hook.get_cert_key_paths(server_url="https://x/")[0] == "second"
+        # The nested task stopping clears memoized results anyway, so check
+        # across two calls in the outer task.
+        assert pm.hook.get_cert_key_paths(server_url="https://x/")[0] == "first"
+        assert pm.hook.get_cert_key_paths(server_url="https://x/")[0] == "first"
+
+    assert first.calls == 1
+
+
+def test_nested_tasks():
+    """Nested tasks see plugins of their enclosing tasks."""
+    events = []
+    outer = EventPlugin(events, "outer")
+
+    with task_context():
+        pm.register(outer, scope="task")
+        with task_context():
+            pm.register(EventPlugin(events, "inner"), scope="task")
+            assert pm.is_registered(outer)
+        # The inner plugin is called at the end of the inner task only.
+        assert events == ["inner", "outer"]
+        events.clear()
+
+        with task_context():
+            # Plugins of enclosing tasks can be unregistered too.
+            assert pm.unregister(outer) is outer
+
+    assert events == []
+
+
+def test_call_order():
+    """Task plugins are called in the same order as if registered globally."""
+    events = []
+    plugins = [
+        EventPlugin(events, "global"),
+        TryFirstPlugin(events, "global tryfirst"),
+        TryLastPlugin(events, "global trylast"),
+    ]
+    for plugin in plugins:
+        pm.register(plugin)
+
+    class Wrapper:
+        @hookimpl(wrapper=True)
+        def task_stop(self, failed):
+            events.append("wrapper")
+            return (yield)
+
+    try:
+        with task_context():
+            pm.register(TryLastPlugin(events, "task trylast"), scope="task")
+            pm.register(EventPlugin(events, "task"), scope="task")
+            pm.register(TryFirstPlugin(events, "task tryfirst"), scope="task")
+            pm.register(Wrapper(), scope="task")
+    finally:
+        for plugin in plugins:
+            pm.unregister(plugin)
+
+    assert events == [
+        "wrapper",
+        "task tryfirst",
+        "global tryfirst",
+        "task",
+        "global",
+        "global trylast",
+        "task trylast",
+    ]
+
+
+def test_registered_by_task_start():
+    """Plugins registered by task_start in a task scope are called by
+    task_stop, including when dispatched concurrently."""
+    events = []
+
+    class Registrar:
+        @hookimpl
+        def task_start(self):
+            pm.register(EventPlugin(events, "task"), scope="task")
+            pm.register(ConcurrentPlugin(events, "concurrent"), scope="task")
+
+    registrar = Registrar()
+    pm.register(registrar)
+    try:
+        with task_context():
+            pass
+    finally:
+        pm.unregister(registrar)
+
+    assert sorted(events) == ["concurrent", "task"]
+
+
+def test_task_start_failure():
+    """The task scope ends if task_start fails."""
+
+    class Failing:
+        @hookimpl
+        def task_start(self):
+            pm.register(CertPlugin(("cert", "key")), scope="task")
+            raise RuntimeError("simulated error")
+
+    failing = Failing()
+    pm.register(failing)
+    try:
+        with pytest.raises(RuntimeError):
+            with task_context():
+                pass
+    finally:
+        pm.unregister(failing)
+
+    assert pm.hook.get_cert_key_paths(server_url="https://x/") is None
+
+
+def test_invalid_registrations():
+    """Registrations which can't be honoured are rejected."""
+    plugin = CertPlugin(("cert", "key"))
+
+    with pytest.raises(RuntimeError) as excinfo:
+        pm.register(plugin, scope="task")
+    assert "without a task context" in str(excinfo.value)
+
+    with pytest.raises(ValueError) as excinfo:
+        pm.register(plugin, scope="process")
+    assert "Unknown plugin scope: process" in str(excinfo.value)
+
+    class Unknown:
+        @hookimpl
+        def pubtools_no_such_hook(self):
+            pass
+
+    class Optional:
+        @hookimpl(optionalhook=True)
+        def pubtools_no_such_hook(self):
+            pass
+
+    with task_context():
+        pm.register(plugin, name="cert", scope="task")
+        with pytest.raises(ValueError):
+            pm.register(plugin, scope="task")
+        with pytest.raises(ValueError):
+            pm.register(CertPlugin(None), name="cert", scope="task")
+
+        with pytest.raises(pluggy.PluginValidationError):
+            pm.register(Unknown(), scope="task")
+        pm.register(Optional(), scope="task")
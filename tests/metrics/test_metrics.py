@@ -0,0 +1,166 @@
+import logging
+
+import pytest
+from opentelemetry.sdk.metrics.export import MetricExporter, MetricExportResult
+
+from pubtools._impl import tracing
+from pubtools._impl.metrics import NOOP_INSTRUMENT, MetricsWrapper
+from pubtools.metrics import get_metrics_wrapper
+from pubtools.pluggy import hookimpl, pm, task_context
+
+
+class FakeMetricExporter(MetricExporter):
+    def __init__(self):
+        super().__init__()
+        self.exported = []
+
+    def export(self, metrics_data, timeout_millis=10000, **kwargs):
+        for resource_metrics in metrics_data.resource_metrics:
+            for scope_metrics in resource_metrics.scope_metrics:
+                self.exported.extend(scope_metrics.metrics)
+        return MetricExportResult.SUCCESS
+
+    def force_flush(self, timeout_millis=10000):
+        return True
+
+    def shutdown(self, timeout_millis=30000, **kwargs):
+        pass
+
+    def points(self, name):
+        return [
+            point
+            for metric in self.exported
+            if metric.name == name
+            for point in metric.data.data_points
+        ]
+
+
+class FakeMetricExporterPlugin:
+    def __init__(self):
+        self.exporter = FakeMetricExporter()
+
+    @hookimpl
+    def otel_metric_exporter(self):
+        return self.exporter
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    """Enables metrics and installs a hookimpl for the metric exporter."""
+    monkeypatch.setenv("OTEL_METRICS", "true")
+    plugin = FakeMetricExporterPlugin()
+    pm.register(plugin)
+    yield plugin.exporter
+    pm.unregister(plugin)
+
+
+@pytest.fixture
+def mw(exporter):
+    mw = MetricsWrapper()
+    yield mw
+    pm.unregister(mw)
+    mw.provider.shutdown()
+
+
+def test_disabled(monkeypatch):
+    """Instruments do nothing while metrics are disabled."""
+    monkeypatch.delenv("OTEL_METRICS", raising=False)
+    mw = MetricsWrapper()
+
+    counter = mw.counter("items")
+    counter.add(1, {"a": "b"})
+    mw.histogram("duration").record(1.5)
+    mw.up_down_counter("in_progress").add(-1)
+
+    assert counter is NOOP_INSTRUMENT
+    assert mw.provider is None
+    assert mw.force_flush()
+    assert not pm.is_registered(mw)
+
+
+def test_otel_not_available(monkeypatch, caplog):
+    """Metrics are disabled if open-telemetry is unavailable."""
+    monkeypatch.setenv("OTEL_METRICS", "true")
+    monkeypatch.setattr(tracing, "OPENTELEMETRY_AVAILABLE", False)
+    caplog.set_level(logging.DEBUG)
+
+    mw = MetricsWrapper()
+
+    assert mw.counter("items") is NOOP_INSTRUMENT
+    assert "open telemetry package is unavailable" in caplog.text
+
+
+def test_record_metrics(mw, exporter):
+    """Measurements are aggregated and exported."""
+    counter = mw.counter("items", unit="{item}", description="Items pushed")
+    counter.add(3, {"target": "a"})
+    mw.counter("items").add(2, {"target": "a"})
+    mw.up_down_counter("in_progress").add(1)
+    for value in [1.0, 2.0, 3.0]:
+        mw.histogram("duration", unit="s").record(value)
+
+    assert mw.counter("items") is counter
+    assert mw.force_flush()
+
+    [items] = exporter.points("items")
+    assert items.value == 5
+    assert dict(items.attributes) == {"target": "a"}
+    assert exporter.points("in_progress")[0].value == 1
+    duration = exporter.points("duration")[0]
+    assert (duration.count, duration.sum) == (3, 6.0)
+
+
+def test_flush_at_task_stop(mw, exporter):
+    """Metrics are exported at the end of a task."""
+    with task_context():
+        mw.counter("items").add(1)
+
+    assert exporter.points("items")[0].value == 1
+
+
+def test_flush_timeout(mw, monkeypatch, caplog):
+    """A warning is logged if metrics can't be flushed in time."""
+    monkeypatch.setenv("OTEL_METRICS_FLUSH_TIMEOUT", "0.5")
+    monkeypatch.setattr(mw.provider, "force_flush", lambda timeout_millis: False)
+
+    mw.task_stop(failed=False)
+
+    assert "Flushing metrics timed out after 0.5 seconds" in caplog.text
+
+
+def test_flush_timeout_invalid(mw, monkeypatch, caplog):
+    """An invalid flush timeout is ignored with a warning."""
+    monkeypatch.setenv("OTEL_METRICS_FLUSH_TIMEOUT", "30s")
+    timeouts = []
+    monkeypatch.setattr(
+        mw.provider,
+        "force_flush",
+        lambda timeout_millis: timeouts.append(timeout_millis),
+    )
+
+    mw.task_stop(failed=False)
+
+    assert timeouts == [30000.0]
+    assert "Ignoring invalid OTEL_METRICS_FLUSH_TIMEOUT='30s', using 30.0" in (
+        caplog.text
+    )
+
+
+def test_reset_enables_instruments(monkeypatch, exporter):
+    """Instruments obtained after enabling metrics are real."""
+    monkeypatch.setenv("OTEL_METRICS", "false")
+    mw = MetricsWrapper()
+    assert mw.counter("items") is NOOP_INSTRUMENT
+
+    monkeypatch.setenv("OTEL_METRICS", "true")
+    mw._reset()
+    try:
+        assert mw.counter("items") is not NOOP_INSTRUMENT
+    finally:
+        pm.unregister(mw)
+        mw.provider.shutdown()
+
+
+def test_global_wrapper():
+    """get_metrics_wrapper returns the same wrapper each time."""
+    assert get_metrics_wrapper() is get_metrics_wrapper()
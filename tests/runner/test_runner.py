@@ -0,0 +1,220 @@
+import gc
+import json
+import os
+import signal
+import sys
+
+if sys.version_info >= (3, 10):
+    from importlib.metadata import EntryPoint
+else:
+    from importlib_metadata import EntryPoint
+
+import pytest
+
+import pubtools.pluggy
+from pubtools._impl import pluggy, runner
+from pubtools._impl.runner import Runner
+
+
+def task_ok():
+    pass
+
+
+def task_exit():
+    sys.exit(3)
+
+
+def task_raise():
+    raise RuntimeError("simulated error")
+
+
+def task_return():
+    return "some error message"
+
+
+def task_env():
+    with open(os.environ["TASK_OUTPUT"], "wt") as f:
+        json.dump({"argv": sys.argv, "value": os.environ.get("TASK_VALUE")}, f)
+
+
+def task_killed():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+ENTRY_POINTS = {
+    "ok": task_ok,
+    "exit": task_exit,
+    "raise": task_raise,
+    "return": task_return,
+    "env": task_env,
+    "killed": task_killed,
+}
+
+
+def run(requests, **kwargs):
+    # Run a runner with the given requests on input, returning responses
+    # keyed by id.
+    in_r, in_w = os.pipe()
+    out_r, out_w = os.pipe()
+
+    data = "".join(
+        (r if isinstance(r, str) else json.dumps(r)) + "\n" for r in requests
+    )
+    os.write(in_w, data.encode("utf-8"))
+    os.close(in_w)
+
+    try:
+        Runner(ENTRY_POINTS, infd=in_r, outfd=out_w, **kwargs).serve()
+    finally:
+        os.close(in_r)
+        os.close(out_w)
+
+    with os.fdopen(out_r, "rt") as f:
+        responses = [json.loads(line) for line in f]
+
+    return {r["id"]: r for r in responses}
+
+
+@pytest.mark.parametrize("max_tasks", [None, 1])
+def test_runner_exit_codes(max_tasks):
+    """Runner reports exit status of each task."""
+    responses = run(
+        [
+            {"id": "ok", "entry_point": "ok"},
+            {"id": "exit", "entry_point": "exit"},
+            {"id": "raise", "entry_point": "raise"},
+            {"id": "return", "entry_point": "return"},
+            {"id": "killed", "entry_point": "killed"},
+        ],
+        max_tasks=max_tasks,
+    )
+
+    assert {id: r["exit_code"] for (id, r) in responses.items()} == {
+        "ok": 0,
+        "exit": 3,
+        "raise": 1,
+        "return": 1,
+        "killed": -signal.SIGKILL,
+    }
+
+    # Each task ran in its own process
+    pids = set(r["pid"] for r in responses.values())
+    assert len(pids) == 5
+    assert os.getpid() not in pids
+
+
+def test_runner_ignores_other_children():
+    """Children not forked by the runner are left for their owner to reap."""
+    other = os.fork()
+    if other == 0:  # pragma: no cover
+        os._exit(7)
+
+    try:
+        responses = run([{"id": "ok", "entry_point": "ok"}])
+        assert responses["ok"]["exit_code"] == 0
+    finally:
+        _, status = os.waitpid(other, 0)
+
+    assert os.WEXITSTATUS(status) == 7
+
+
+@pytest.mark.parametrize(
+    "code, expected", [(None, 0), (0, 0), (3, 3), ("some error message", 1)]
+)
+def test_exit_code(code, expected, capsys):
+    """Exit codes are derived from SystemExit codes as by the interpreter."""
+    assert runner._exit_code(code) == expected
+    if isinstance(code, str):
+        assert capsys.readouterr().err == "some error message\n"
+
+
+def test_runner_env_and_args(tmp_path):
+    """Tasks receive requested args and env, without affecting the runner."""
+    output = str(tmp_path / "out.json")
+
+    responses = run(
+        [
+            {
+                "id": "env",
+                "entry_point": "env",
+                "args": ["--foo", "bar"],
+                "env": {"TASK_OUTPUT": output, "TASK_VALUE": "xyz"},
+            },
+        ]
+    )
+
+    assert responses["env"]["exit_code"] == 0
+    with open(output) as f:
+        assert json.load(f) == {"argv": ["env", "--foo", "bar"], "value": "xyz"}
+
+    assert "TASK_OUTPUT" not in os.environ
+
+
+def test_runner_bad_requests():
+    """Invalid requests are answered with errors."""
+    in_r, in_w = os.pipe()
+    out_r, out_w = os.pipe()
+    os.write(in_w, b'not json\n[1, 2]\n\n{"id": "x", "entry_point": "nope"}')
+    os.close(in_w)
+
+    Runner(ENTRY_POINTS, infd=in_r, outfd=out_w).serve()
+    os.close(in_r)
+    os.close(out_w)
+
+    with os.fdopen(out_r, "rt") as f:
+        responses = [json.loads(line) for line in f]
+
+    assert [r["id"] for r in responses] == [None, None, "x"]
+    assert responses[0]["error"].startswith("bad request:")
+    assert responses[1]["error"] == "bad request: request must be an object"
+    assert responses[2]["error"] == "unknown entry point: nope"
+
+
+def test_runner_warm(monkeypatch):
+    """Warm runner preloads pubtools console_scripts of task libraries and
+    freezes gc."""
+    monkeypatch.setattr(
+        pluggy,
+        "entry_points",
+        lambda group=None: (
+            [
+                EntryPoint("pubtools-test-stats", "pubtools.pluggy:hook_stats", group),
+                # pubtools' own commands aren't tasks.
+                EntryPoint(
+                    "pubtools-runner", "pubtools._impl.runner:entry_point", group
+                ),
+            ]
+            if group == "console_scripts"
+            else []
+        ),
+    )
+
+    try:
+        instance = Runner.warm(max_tasks=3)
+        assert instance.entry_points == {
+            "pubtools-test-stats": pubtools.pluggy.hook_stats
+        }
+        assert instance.max_tasks == 3
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+
+
+def test_runner_entry_point(monkeypatch):
+    """Command-line entry point creates a warm runner and serves."""
+    calls = []
+
+    class FakeRunner(object):
+        @classmethod
+        def warm(cls, **kwargs):
+            calls.append(kwargs)
+            return cls()
+
+        def serve(self):
+            calls.append("serve")
+
+    monkeypatch.setattr(runner, "Runner", FakeRunner)
+
+    runner.entry_point(["--max-tasks", "4"])
+
+    assert calls == [{"max_tasks": 4}, "serve"]
@@ -2,6 +2,7 @@ import pytest
 from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
 
 from pubtools.pluggy import hookimpl, pm
+from pubtools.tracing import get_trace_wrapper
 
 
 class FakeSpanExporterImp(SpanExporter):
@@ -29,3 +30,13 @@ def fake_span_exporter():
     pm.register(span_exporter)
     yield
     pm.unregister(span_exporter)
+
+
+@pytest.fixture
+def tw(monkeypatch, fake_span_exporter):
+    """The global trace wrapper, with tracing enabled and no spans pending."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    tw = get_trace_wrapper()
+    tw._reset()
+    tw.force_flush()
+    return tw
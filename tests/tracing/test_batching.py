@@ -0,0 +1,429 @@
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.trace import TraceFlags
+
+from pubtools._impl import batching
+from pubtools._impl.batching import BoundedBatchProcessor
+from pubtools._impl.tracing import TracingWrapper, get_trace_wrapper
+from pubtools.pluggy import hookimpl, pm
+
+
+class RecordingExporter(SpanExporter):
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+        self.exported = threading.Event()
+        self.shut_down = False
+
+    def export(self, spans):
+        if self.fail:
+            raise RuntimeError("simulated error")
+        self.batches.append([span.name for span in spans])
+        self.exported.set()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self.shut_down = True
+
+
+@pytest.fixture
+def exporter():
+    return RecordingExporter()
+
+
+@pytest.fixture
+def make_processor(exporter):
+    """Returns a function creating a processor and a tracer using it.
+
+    Unless idle=False, the processor's background worker is stopped, so that
+    spans are only exported by force_flush.
+    """
+
+    def make(idle=True, **kwargs):
+        processor = BoundedBatchProcessor(exporter, **kwargs)
+        if idle:
+            with processor._condition:
+                processor._shutdown = True
+                processor._condition.notify_all()
+            processor._worker.join()
+            processor._shutdown = False
+        provider = TracerProvider()
+        provider.add_span_processor(processor)
+        return processor, provider.get_tracer(__name__)
+
+    return make
+
+
+def end_spans(tracer, *names):
+    for name in names:
+        tracer.start_span(name).end()
+
+
+def test_exports_in_batches(make_processor, exporter):
+    """Queued spans are exported in batches of limited size."""
+    processor, tracer = make_processor(max_export_batch_size=2)
+
+    end_spans(tracer, "a", "b", "c", "d", "e")
+    assert processor.queued == 5
+    assert processor.force_flush()
+
+    assert exporter.batches == [["a", "b"], ["c", "d"], ["e"]]
+    stats = processor.stats()
+    assert stats["exported"] == 5
+    assert stats["dropped"] == 0
+    assert stats["queued"] == 0
+    assert stats["export_latency"]["count"] == 3
+
+
+def test_exports_in_background(make_processor, exporter):
+    """The worker exports spans after the schedule delay."""
+    processor, tracer = make_processor(idle=False, schedule_delay_millis=10)
+
+    end_spans(tracer, "a")
+
+    assert exporter.exported.wait(10)
+    assert exporter.batches == [["a"]]
+    processor.shutdown()
+
+
+def test_exports_full_batch(make_processor, exporter):
+    """The worker exports spans as soon as a batch is full."""
+    processor, tracer = make_processor(
+        idle=False, max_export_batch_size=2, schedule_delay_millis=60000
+    )
+
+    end_spans(tracer, "a", "b")
+
+    assert exporter.exported.wait(10)
+    assert exporter.batches == [["a", "b"]]
+    processor.shutdown()
+
+
+def test_drop_newest(make_processor, exporter):
+    """With the drop_newest policy, spans are dropped while the queue is full."""
+    processor, tracer = make_processor(max_queue_size=2)
+
+    end_spans(tracer, "a", "b", "c", "d")
+    processor.force_flush()
+
+    assert exporter.batches == [["a", "b"]]
+    assert processor.dropped == 2
+
+
+def test_drop_oldest(make_processor, exporter):
+    """With the drop_oldest policy, the oldest queued spans make room."""
+    processor, tracer = make_processor(max_queue_size=2, policy="drop_oldest")
+
+    end_spans(tracer, "a", "b", "c", "d")
+    processor.force_flush()
+
+    assert exporter.batches == [["c", "d"]]
+    assert processor.dropped == 2
+
+
+def test_block_timeout(make_processor, exporter):
+    """With the block policy, a span is dropped if no room is made in time."""
+    processor, tracer = make_processor(
+        max_queue_size=1, policy="block", block_timeout_millis=10
+    )
+
+    end_spans(tracer, "a", "b")
+    processor.force_flush()
+
+    assert exporter.batches == [["a"]]
+    assert processor.dropped == 1
+
+
+def test_block_waits(make_processor, exporter):
+    """With the block policy, ending a span waits for room in the queue."""
+    processor, tracer = make_processor(
+        max_queue_size=1, policy="block", block_timeout_millis=10000
+    )
+
+    def flush_later():
+        time.sleep(0.05)
+        processor.force_flush()
+
+    end_spans(tracer, "a")
+    thread = threading.Thread(target=flush_later)
+    thread.start()
+    end_spans(tracer, "b")
+    thread.join()
+    processor.force_flush()
+
+    assert exporter.batches == [["a"], ["b"]]
+    assert processor.dropped == 0
+
+
+def test_export_failure(make_processor, exporter):
+    """Spans which failed to export are counted as dropped."""
+    processor, tracer = make_processor()
+    exporter.fail = True
+
+    end_spans(tracer, "a", "b")
+    assert processor.force_flush()
+
+    assert processor.stats()["export_failures"] == 1
+    assert processor.stats()["dropped"] == 2
+
+
+def test_not_sampled(make_processor):
+    """Spans which weren't sampled aren't queued."""
+    processor, _ = make_processor()
+
+    processor.on_end(
+        SimpleNamespace(context=SimpleNamespace(trace_flags=TraceFlags(0)))
+    )
+
+    assert processor.queued == 0
+
+
+def test_flush_timeout(make_processor):
+    """force_flush gives up once the timeout is exceeded."""
+    processor, tracer = make_processor()
+    end_spans(tracer, "a")
+
+    assert not processor.force_flush(timeout_millis=0)
+    with processor._export_lock:
+        assert not processor.force_flush(timeout_millis=10)
+    assert processor.queued == 1
+
+
+def test_flush_timeout_hanging_export(make_processor, exporter):
+    """force_flush gives up once the timeout is exceeded, even if the exporter
+    hangs, and the processor can be rearmed afterwards."""
+    processor, tracer = make_processor()
+    unblock = threading.Event()
+    export = exporter.export
+
+    def hanging_export(spans):
+        unblock.wait(10)
+        return export(spans)
+
+    exporter.export = hanging_export
+    end_spans(tracer, "a", "b")
+    stuck_lock = processor._export_lock
+
+    try:
+        start = time.monotonic()
+        assert not processor.force_flush(timeout_millis=50)
+        assert time.monotonic() - start < 5
+        assert stuck_lock.locked()
+
+        # The stuck export's lock is replaced, and its helper releases the
+        # lock it acquired rather than the new one.
+        exporter.export = export
+        processor.rearm()
+        assert processor._export_lock is not stuck_lock
+        with processor._export_lock:
+            unblock.set()
+            for _ in range(1000):
+                if not stuck_lock.locked():
+                    break
+                time.sleep(0.01)
+            assert not stuck_lock.locked()
+    finally:
+        unblock.set()
+
+    assert exporter.batches == [["a", "b"]]
+    end_spans(tracer, "c")
+    assert processor.force_flush()
+    assert exporter.batches == [["a", "b"], ["c"]]
+
+
+def test_shutdown(make_processor, exporter):
+    """Shutdown exports queued spans, after which spans are ignored."""
+    processor, tracer = make_processor(idle=False, schedule_delay_millis=60000)
+    end_spans(tracer, "a")
+
+    processor.shutdown()
+    end_spans(tracer, "b")
+
+    assert exporter.batches == [["a"]]
+    assert exporter.shut_down
+    assert processor.queued == 0
+
+
+def test_shutdown_timeout(make_processor, exporter, monkeypatch, caplog):
+    """Shutdown gives up waiting for a hanging export after a timeout."""
+    monkeypatch.setattr(batching, "SHUTDOWN_TIMEOUT", 0.05)
+    processor, tracer = make_processor(idle=False, max_export_batch_size=1)
+    unblock = threading.Event()
+    export = exporter.export
+
+    def hanging_export(spans):
+        exporter.exported.set()
+        unblock.wait(10)
+        return export(spans)
+
+    exporter.export = hanging_export
+    end_spans(tracer, "a")
+    assert exporter.exported.wait(10)
+
+    try:
+        processor.shutdown()
+    finally:
+        unblock.set()
+
+    assert exporter.shut_down
+    assert "Spans were not exported within 0.05 seconds of shutdown" in caplog.text
+
+
+def test_unknown_policy(exporter):
+    """An unknown policy is rejected."""
+    with pytest.raises(ValueError) as excinfo:
+        BoundedBatchProcessor(exporter, policy="drop_all")
+    assert "Unknown queue policy: drop_all" in str(excinfo.value)
+
+
+def test_invalid_schedule_delay(exporter):
+    """A schedule delay which isn't positive is rejected."""
+    with pytest.raises(ValueError) as excinfo:
+        BoundedBatchProcessor(exporter, schedule_delay_millis=0)
+    assert "Invalid schedule delay: 0" in str(excinfo.value)
+
+
+def test_from_env(monkeypatch, exporter):
+    """Options are read from the environment, and may be overridden."""
+    monkeypatch.setenv("OTEL_BSP_MAX_QUEUE_SIZE", "100")
+    monkeypatch.setenv("OTEL_BSP_MAX_EXPORT_BATCH_SIZE", "10")
+    monkeypatch.setenv("OTEL_BSP_SCHEDULE_DELAY", "200")
+    monkeypatch.setenv("OTEL_TRACING_QUEUE_POLICY", "BLOCK")
+    monkeypatch.setenv("OTEL_TRACING_QUEUE_BLOCK_TIMEOUT", "300")
+
+    processor = BoundedBatchProcessor.from_env(exporter, max_queue_size=50)
+
+    assert processor.max_queue_size == 50
+    assert processor.max_export_batch_size == 10
+    assert processor.schedule_delay == 0.2
+    assert processor.policy == "block"
+    assert processor.block_timeout == 0.3
+    processor.shutdown()
+
+
+@pytest.mark.parametrize("delay", ["5s", "0"])
+def test_from_env_invalid(monkeypatch, exporter, caplog, delay):
+    """Invalid options are ignored with a warning."""
+    monkeypatch.setenv("OTEL_BSP_MAX_QUEUE_SIZE", "0")
+    monkeypatch.setenv("OTEL_BSP_SCHEDULE_DELAY", delay)
+    monkeypatch.setenv("OTEL_TRACING_QUEUE_POLICY", "drop_all")
+
+    processor = BoundedBatchProcessor.from_env(exporter)
+
+    assert processor.max_queue_size == 2048
+    assert processor.schedule_delay == 5.0
+    assert processor.policy == "drop_newest"
+    assert (
+        "Ignoring invalid OTEL_BSP_SCHEDULE_DELAY=%r, using the default" % delay
+        in caplog.text
+    )
+    assert "Ignoring invalid OTEL_TRACING_QUEUE_POLICY='drop_all'" in caplog.text
+    processor.shutdown()
+
+
+def test_task_stats_logged(make_processor, caplog):
+    """Statistics are logged at the end of a task, as a warning if spans were
+    dropped during the task."""
+    processor, tracer = make_processor(max_queue_size=1)
+    caplog.set_level(logging.DEBUG, "pubtools")
+
+    processor.task_start()
+    end_spans(tracer, "a")
+    processor.force_flush()
+    processor.task_stop(failed=False)
+
+    assert caplog.records[-1].levelno == logging.DEBUG
+    assert "1 exported, 0 dropped, 0 queued" in caplog.records[-1].getMessage()
+
+    processor.task_start()
+    end_spans(tracer, "a", "b")
+    processor.task_stop(failed=False)
+
+    assert caplog.records[-1].levelno == logging.WARNING
+    assert "0 exported, 1 dropped, 1 queued" in caplog.records[-1].getMessage()
+
+
+class BatchOptions:
+    @hookimpl
+    def otel_batch_options(self):
+        return {"max_queue_size": 10, "policy": "drop_oldest"}
+
+
+def test_tracing_wrapper(monkeypatch, fake_span_exporter):
+    """TracingWrapper uses options from hooks and provides export statistics."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    # The global tracer provider can only be set once; make sure it belongs to
+    # the global wrapper, which other tests use.
+    get_trace_wrapper()._reset()
+    options = BatchOptions()
+    pm.register(options)
+
+    tw = TracingWrapper()
+    try:
+        assert pm.is_registered(tw)
+        assert tw._processor.max_queue_size == 10
+        assert tw._processor.policy == "drop_oldest"
+        assert tw.export_stats()["dropped"] == 0
+    finally:
+        pm.unregister(options)
+        pm.unregister(tw)
+        tw._provider.shutdown()
+
+
+def test_tracing_wrapper_disabled(monkeypatch):
+    """Without tracing, there are no export statistics."""
+    monkeypatch.delenv("OTEL_TRACING", raising=False)
+
+    assert TracingWrapper().export_stats() is None
+
+
+def test_rearm_discards_queued(make_processor, exporter):
+    """Rearming discards queued spans."""
+    processor, tracer = make_processor()
+    end_spans(tracer, "a", "b")
+
+    assert processor.rearm() == 2
+
+    assert processor.queued == 0
+    assert processor.dropped == 2
+    processor.force_flush()
+    assert exporter.batches == []
+
+
+def test_rearm_replaces_stuck_worker(make_processor, exporter):
+    """Rearming replaces a worker stuck in an export."""
+    processor, tracer = make_processor(idle=False, max_export_batch_size=1)
+    unblock = threading.Event()
+    export = exporter.export
+
+    def blocking_export(spans):
+        unblock.wait(10)
+        return export(spans)
+
+    exporter.export = blocking_export
+    end_spans(tracer, "a")
+    stuck_worker = processor._worker
+    while processor.queued:
+        time.sleep(0.001)
+    end_spans(tracer, "b")
+
+    assert not processor.force_flush(timeout_millis=10)
+    assert processor.rearm() == 1
+    assert processor._worker is not stuck_worker
+
+    exporter.export = export
+    end_spans(tracer, "c")
+    assert exporter.exported.wait(10)
+    assert exporter.batches == [["c"]]
+
+    unblock.set()
+    stuck_worker.join(10)
+    assert not stuck_worker.is_alive()
+    assert exporter.batches == [["c"], ["a"]]
+    processor.shutdown()
@@ -0,0 +1,178 @@
+import concurrent.futures
+import multiprocessing
+import os
+
+import pytest
+from opentelemetry import baggage, context, trace
+
+from pubtools._impl import executors
+from pubtools.tracing import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    get_trace_wrapper,
+    submit,
+)
+
+
+def current_span_context():
+    # Runs in workers; returns what they see as their trace context.
+    span_context = trace.get_current_span().get_span_context()
+    return (
+        span_context.trace_id,
+        span_context.span_id,
+        baggage.get_baggage("task"),
+        os.environ.get("MALLOC_ARENA_MAX"),
+    )
+
+
+def parent_context():
+    # Starts a span outside of instrument_func, so that only the executor
+    # can get it into workers.
+    ctx = baggage.set_baggage("task", "push")
+    token = context.attach(ctx)
+    span = trace.get_tracer(__name__).start_span("parent")
+    return span, token
+
+
+def check_propagated(span, result):
+    span_context = span.get_span_context()
+    assert result == (span_context.trace_id, span_context.span_id, "push", "2")
+
+
+def fork_context():
+    return multiprocessing.get_context("fork")
+
+
+def test_thread_pool(tw, monkeypatch):
+    """Callables submitted to ThreadPoolExecutor run within the submitter's context."""
+    monkeypatch.setenv("MALLOC_ARENA_MAX", "2")
+    span, token = parent_context()
+    try:
+        with trace.use_span(span, end_on_exit=True):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                results = list(executor.map(lambda _: current_span_context(), [1, 2]))
+    finally:
+        context.detach(token)
+
+    for result in results:
+        check_propagated(span, result)
+
+
+def test_thread_pool_instrumented(tw):
+    """Spans created in worker threads are children of the submitting span."""
+
+    @tw.instrument_func(span_name="child")
+    def child():
+        pass
+
+    span, token = parent_context()
+    try:
+        with trace.use_span(span, end_on_exit=True):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(child).result()
+    finally:
+        context.detach(token)
+
+    tw.force_flush()
+    spans = {s.name: s for s in tw._processor.span_exporter.get_spans()}
+    assert spans["child"].parent.span_id == spans["parent"].context.span_id
+    assert spans["child"].attributes["task"] == "push"
+
+
+def test_process_pool(tw, monkeypatch):
+    """Callables submitted to ProcessPoolExecutor run within the submitter's trace
+    context, with mallopt tunables applied."""
+    monkeypatch.setenv("MALLOC_ARENA_MAX", "2")
+    span, token = parent_context()
+    try:
+        with trace.use_span(span, end_on_exit=True):
+            with ProcessPoolExecutor(1, fork_context()) as executor:
+                result = executor.submit(current_span_context).result()
+    finally:
+        context.detach(token)
+
+    check_propagated(span, result)
+
+
+@pytest.mark.parametrize(
+    "executor_class",
+    [concurrent.futures.ThreadPoolExecutor, concurrent.futures.ProcessPoolExecutor],
+)
+def test_submit(tw, monkeypatch, executor_class):
+    """submit propagates context into any executor."""
+    monkeypatch.setenv("MALLOC_ARENA_MAX", "2")
+    kwargs = {}
+    if executor_class is concurrent.futures.ProcessPoolExecutor:
+        kwargs["mp_context"] = fork_context()
+
+    span, token = parent_context()
+    try:
+        with trace.use_span(span, end_on_exit=True):
+            with executor_class(max_workers=1, **kwargs) as executor:
+                result = submit(executor, current_span_context).result()
+                assert submit(executor, os.getpid).result()
+    finally:
+        context.detach(token)
+
+    check_propagated(span, result)
+
+
+def test_submit_pubtools_executor(tw):
+    """submit can be used with the executors from pubtools.tracing."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert submit(executor, lambda x: x + 1, 1).result() == 2
+
+
+def test_process_worker_initializer(tw, monkeypatch):
+    """Process workers apply tunables, register flush on exit and run the
+    user's initializer."""
+    calls = []
+    monkeypatch.setattr(
+        executors.mallopt, "set_mallopt_tunables_safe", lambda: calls.append("mallopt")
+    )
+    monkeypatch.setattr(
+        executors.util,
+        "Finalize",
+        lambda obj, callback, exitpriority: calls.append(callback),
+    )
+    monkeypatch.setattr(os, "environ", dict(os.environ))
+
+    executors._init_worker({"MALLOC_ARENA_MAX": "4"}, calls.append, ("init",))
+
+    assert os.environ["MALLOC_ARENA_MAX"] == "4"
+    assert calls == ["mallopt", executors._flush_worker, "init"]
+
+
+def test_context_call_disabled(monkeypatch):
+    """Callables run as-is in workers if tracing is disabled."""
+    monkeypatch.setattr(get_trace_wrapper(), "_enabled_trace", False)
+
+    call = executors._ContextCall(lambda x: x * 2, {"traceparent": "invalid"})
+
+    assert call(2) == 4
+
+
+def test_context_call(tw):
+    """Callables run within the context of the carrier in workers."""
+    trace_id = 0xCEFB2B8DB35D5F3C0DFDF79D5AAB1451
+    span_id = 0x1F2BB7927F140744
+    carrier = {"traceparent": "00-%032x-%016x-01" % (trace_id, span_id)}
+
+    call = executors._ContextCall(current_span_context, carrier)
+
+    assert call()[:2] == (trace_id, span_id)
+    # The context is detached again afterwards.
+    assert not trace.get_current_span().get_span_context().is_valid
+
+
+def test_flush_worker_error(monkeypatch, caplog):
+    """Errors flushing trace data in workers are logged."""
+
+    def broken_flush():
+        raise RuntimeError("simulated error")
+
+    monkeypatch.setattr(get_trace_wrapper(), "force_flush", broken_flush)
+
+    executors._flush_worker()
+
+    assert "Failed to flush trace data in worker" in caplog.text
@@ -0,0 +1,71 @@
+import threading
+
+from pubtools._impl.histogram import Histogram
+
+
+def test_empty():
+    """An empty histogram has no statistics."""
+    histogram = Histogram()
+
+    assert histogram.summary() == {
+        "count": 0,
+        "sum": 0.0,
+        "min": None,
+        "max": None,
+        "mean": None,
+        "p50": None,
+        "p90": None,
+        "p99": None,
+    }
+    assert histogram.attributes("x") == {"x.count": 0}
+
+
+def test_percentiles_bounded_error():
+    """Percentiles are within the relative error of the buckets."""
+    histogram = Histogram()
+    for value in range(1, 10001):
+        histogram.record(value / 1000.0)
+
+    summary = histogram.summary()
+    assert summary["count"] == 10000
+    assert summary["min"] == 0.001
+    assert summary["max"] == 10.0
+    assert abs(summary["mean"] - 5.0005) < 1e-9
+    for percent, expected in [(50, 5.0), (90, 9.0), (99, 9.9)]:
+        assert expected <= summary["p%s" % percent] <= expected * 1.125
+
+    # Compact regardless of the number of values
+    assert len(histogram.buckets()) < 120
+
+
+def test_zero_and_attributes():
+    """Zero values are counted, and attributes describe the buckets."""
+    histogram = Histogram()
+    for value in [0, 0, 1, 3]:
+        histogram.record(value)
+
+    attributes = histogram.attributes("item")
+    assert attributes["item.count"] == 4
+    assert attributes["item.min"] == 0
+    assert attributes["item.max"] == 3
+    assert attributes["item.p50"] == 0
+    assert attributes["item.bucket_bounds"] == [0.0, 1.125, 3.25]
+    assert attributes["item.bucket_counts"] == [2, 1, 1]
+
+
+def test_thread_safe():
+    """Values recorded from many threads are all counted."""
+    histogram = Histogram()
+
+    def work():
+        for _ in range(1000):
+            histogram.record(1.0)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert histogram.count == 4000
+    assert histogram.buckets() == [(1.125, 4000)]
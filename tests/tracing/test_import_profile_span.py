@@ -0,0 +1,46 @@
+import sys
+
+if sys.version_info >= (3, 10):
+    from importlib.metadata import EntryPoint
+else:
+    from importlib_metadata import EntryPoint
+
+from pubtools._impl import pluggy
+from pubtools.pluggy import task_context
+from pubtools.tracing import get_trace_wrapper
+
+
+def test_import_profile_span(monkeypatch, tmp_path, fake_span_exporter):
+    """Import profile is recorded as span attributes when tracing is enabled."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    monkeypatch.setenv("PUBTOOLS_IMPORT_PROFILE", "true")
+
+    (tmp_path / "pubtools_test_prof_span.py").write_text("X = 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(
+        pluggy,
+        "entry_points",
+        lambda group=None: (
+            [EntryPoint("lib", "pubtools_test_prof_span", "pubtools.hooks")]
+            if group == "pubtools.hooks"
+            else []
+        ),
+    )
+    monkeypatch.delitem(sys.modules, "pubtools_test_prof_span", raising=False)
+
+    tw = get_trace_wrapper()
+    tw._reset()
+
+    with task_context():
+        pass
+
+    tw.force_flush()
+    spans = tw._processor.span_exporter.get_spans()
+    assert [span.name for span in spans] == ["import_profile"]
+
+    attrs = spans[0].attributes
+    assert attrs["import.lib.module"] == "pubtools_test_prof_span"
+    assert attrs["import.lib.wall_ms"] > 0
+    assert list(attrs["import.lib.top_modules"])[0].startswith(
+        "pubtools_test_prof_span="
+    )
@@ -0,0 +1,248 @@
+import asyncio
+import inspect
+
+import pytest
+from opentelemetry import trace
+from opentelemetry.trace.status import StatusCode
+
+from pubtools._impl.tracing import TracingWrapper
+from pubtools.tracing import get_trace_wrapper
+
+
+def exported_spans(tw):
+    tw.force_flush()
+    return {span.name: span for span in tw._processor.span_exporter.get_spans()}
+
+
+def test_coroutine_span_covers_awaited_work(tw):
+    """Span of a coroutine function covers the whole awaited call."""
+
+    @tw.instrument_func(span_name="inner")
+    async def inner():
+        return 42
+
+    @tw.instrument_func(span_name="outer")
+    async def outer():
+        await asyncio.sleep(0.05)
+        return await inner()
+
+    assert inspect.iscoroutinefunction(outer)
+    assert asyncio.run(outer()) == 42
+
+    spans = exported_spans(tw)
+    outer_span = spans["outer"]
+    inner_span = spans["inner"]
+
+    assert outer_span.end_time - outer_span.start_time >= 0.05 * 10**9
+    assert inner_span.parent.span_id == outer_span.context.span_id
+
+
+def test_coroutine_concurrent_spans(tw):
+    """Concurrent calls of coroutine functions each get their own span tree."""
+
+    @tw.instrument_func(span_name="child")
+    async def child(idx):
+        return trace.get_current_span().get_span_context().span_id
+
+    @tw.instrument_func(span_name="parent")
+    async def parent(idx):
+        my_span_id = trace.get_current_span().get_span_context().span_id
+        # Let the other tasks run, so that spans of all tasks are open at once
+        await asyncio.sleep(0.01)
+        child_span_id = await child(idx)
+        assert trace.get_current_span().get_span_context().span_id == my_span_id
+        return my_span_id, child_span_id
+
+    async def main():
+        return await asyncio.gather(*[parent(i) for i in range(10)])
+
+    results = asyncio.run(main())
+
+    tw.force_flush()
+    spans = tw._processor.span_exporter.get_spans()
+    parents = {s.context.span_id: s for s in spans if s.name == "parent"}
+    children = {s.context.span_id: s for s in spans if s.name == "child"}
+    assert len(parents) == len(children) == 10
+
+    for parent_id, child_id in results:
+        assert children[child_id].parent.span_id == parent_id
+
+
+def test_coroutine_exception(tw):
+    """Exceptions raised after awaiting are recorded on the span."""
+
+    @tw.instrument_func(span_name="failing")
+    async def failing():
+        await asyncio.sleep(0)
+        raise ValueError("async failure")
+
+    with pytest.raises(ValueError):
+        asyncio.run(failing())
+
+    span = exported_spans(tw)["failing"]
+    assert span.status.status_code == StatusCode.ERROR
+    assert span.events[0].attributes["exception.message"] == "async failure"
+
+
+def test_async_generator_span(tw):
+    """Span of an async generator stays open until it's exhausted."""
+
+    @tw.instrument_func(span_name="step")
+    async def step(i):
+        await asyncio.sleep(0)
+        return i
+
+    @tw.instrument_func(span_name="consume")
+    async def consume(item):
+        return item
+
+    @tw.instrument_func(span_name="agen")
+    async def agen(count):
+        for i in range(count):
+            yield await step(i)
+
+    async def main():
+        out = []
+        async for item in agen(3):
+            out.append(await consume(item))
+        return out
+
+    assert asyncio.run(main()) == [0, 1, 2]
+
+    tw.force_flush()
+    spans = tw._processor.span_exporter.get_spans()
+    agen_span = [s for s in spans if s.name == "agen"][0]
+
+    # Work done by the generator is within its span...
+    steps = [s for s in spans if s.name == "step"]
+    assert len(steps) == 3
+    assert all(s.parent.span_id == agen_span.context.span_id for s in steps)
+    assert agen_span.end_time >= max(s.end_time for s in steps)
+
+    # ...but work done by the consumer between items is not
+    consumes = [s for s in spans if s.name == "consume"]
+    assert len(consumes) == 3
+    assert all(
+        s.parent is None or s.parent.span_id != agen_span.context.span_id
+        for s in consumes
+    )
+
+
+def test_async_generator_early_close(tw):
+    """Span of an async generator ends when the generator is closed early."""
+    closed = []
+
+    @tw.instrument_func(span_name="agen_closed")
+    async def agen():
+        try:
+            for i in range(100):
+                yield i
+        finally:
+            closed.append(True)
+
+    async def main():
+        gen = agen()
+        async for item in gen:
+            if item == 2:
+                break
+        await gen.aclose()
+
+    asyncio.run(main())
+
+    assert closed == [True]
+    assert "agen_closed" in exported_spans(tw)
+
+
+def test_async_generator_send_throw(tw):
+    """Values and exceptions sent by the consumer reach the generator."""
+
+    @tw.instrument_func(span_name="agen_echo")
+    async def agen():
+        received = None
+        while True:
+            try:
+                received = yield received
+            except KeyError:
+                received = "caught"
+
+    async def main():
+        gen = agen()
+        assert await gen.asend(None) is None
+        assert await gen.asend("hello") == "hello"
+        assert await gen.athrow(KeyError()) == "caught"
+        with pytest.raises(RuntimeError):
+            await gen.athrow(RuntimeError("not handled"))
+
+    asyncio.run(main())
+
+    span = exported_spans(tw)["agen_echo"]
+    assert span.status.status_code == StatusCode.ERROR
+
+
+def test_async_disabled(monkeypatch):
+    """Async functions work as usual with tracing disabled."""
+    monkeypatch.setenv("OTEL_TRACING", "false")
+    tw = TracingWrapper()
+
+    @tw.instrument_func()
+    async def coro(x):
+        await asyncio.sleep(0)
+        return x * 2
+
+    @tw.instrument_func()
+    async def agen(n):
+        for i in range(n):
+            yield i
+
+    async def main():
+        return await coro(2), [i async for i in agen(3)]
+
+    assert inspect.iscoroutinefunction(coro)
+    assert asyncio.run(main()) == (4, [0, 1, 2])
+
+
+def test_enabled_after_decoration(monkeypatch, fake_span_exporter):
+    """Functions decorated while tracing is disabled are traced once it's enabled."""
+    monkeypatch.setenv("OTEL_TRACING", "false")
+    tw = get_trace_wrapper()
+    tw._reset()
+
+    @tw.instrument_func(span_name="late_sync")
+    def late_sync():
+        return 1
+
+    @tw.instrument_func(span_name="late_async")
+    async def late_async():
+        return 2
+
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    tw._reset()
+
+    assert late_sync() == 1
+    assert asyncio.run(late_async()) == 2
+
+    spans = exported_spans(tw)
+    assert "late_sync" in spans
+    assert "late_async" in spans
+
+
+def test_disabled_after_decoration(monkeypatch, tw):
+    """Async functions decorated while tracing is enabled work as usual once it's
+    disabled."""
+
+    @tw.instrument_func()
+    async def coro(x):
+        return x * 2
+
+    @tw.instrument_func()
+    async def agen(n):
+        for i in range(n):
+            yield i
+
+    monkeypatch.setenv("OTEL_TRACING", "false")
+    tw._reset()
+
+    async def main():
+        return await coro(2), [i async for i in agen(3)]
+
+    assert asyncio.run(main()) == (4, [0, 1, 2])
@@ -0,0 +1,166 @@
+import asyncio
+import time
+
+import pytest
+from opentelemetry.trace.status import StatusCode
+
+
+def exported_spans(tw):
+    tw.force_flush()
+    return tw._processor.span_exporter.get_spans()
+
+
+def test_generator_span_and_stats(tw):
+    """Span of a generator stays open until exhausted and records where time went."""
+
+    @tw.instrument_func(span_name="produce_one")
+    def produce_one(i):
+        time.sleep(0.01)
+        return i
+
+    @tw.instrument_func(span_name="consume_one")
+    def consume_one(item):
+        time.sleep(0.02)
+
+    @tw.instrument_func(span_name="produce")
+    def produce(count):
+        for i in range(count):
+            yield produce_one(i)
+
+    for item in produce(3):
+        consume_one(item)
+
+    spans = exported_spans(tw)
+    gen_span = [s for s in spans if s.name == "produce"][0]
+
+    assert gen_span.attributes["generator.items"] == 3
+    assert gen_span.attributes["generator.time_in_generator"] >= 0.03
+    assert gen_span.attributes["generator.time_in_consumer"] >= 0.04
+    assert (
+        gen_span.attributes["generator.time_in_consumer"]
+        > gen_span.attributes["generator.time_in_generator"]
+    )
+    assert gen_span.end_time - gen_span.start_time >= 0.09 * 10**9
+
+    # Generator's own work is within its span, consumer's work is not
+    for span in spans:
+        if span.name == "produce_one":
+            assert span.parent.span_id == gen_span.context.span_id
+        if span.name == "consume_one":
+            assert (
+                span.parent is None or span.parent.span_id != gen_span.context.span_id
+            )
+
+
+def test_generator_close(tw):
+    """Span of a generator ends when the generator is closed early."""
+    closed = []
+
+    @tw.instrument_func(span_name="endless")
+    def endless():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.append(True)
+
+    gen = endless()
+    assert [next(gen) for _ in range(5)] == [0, 1, 2, 3, 4]
+    gen.close()
+
+    assert closed == [True]
+    (span,) = [s for s in exported_spans(tw) if s.name == "endless"]
+    assert span.attributes["generator.items"] == 5
+    assert span.status.status_code != StatusCode.ERROR
+
+
+def test_generator_send_throw_return(tw):
+    """Generator protocol is preserved through the wrapper."""
+
+    @tw.instrument_func(span_name="echo")
+    def echo():
+        received = None
+        while received != "stop":
+            try:
+                received = yield received
+            except KeyError:
+                received = "caught"
+        return "done"
+
+    def delegate():
+        result = yield from echo()
+        yield result
+
+    gen = delegate()
+    assert next(gen) is None
+    assert gen.send("hello") == "hello"
+    assert gen.throw(KeyError()) == "caught"
+    assert gen.send("stop") == "done"
+
+
+def test_generator_exception(tw):
+    """Exceptions raised by a generator are recorded on its span."""
+
+    @tw.instrument_func(span_name="failing_gen")
+    def failing_gen():
+        yield 1
+        raise ValueError("generator failure")
+
+    with pytest.raises(ValueError):
+        list(failing_gen())
+
+    (span,) = [s for s in exported_spans(tw) if s.name == "failing_gen"]
+    assert span.status.status_code == StatusCode.ERROR
+    assert span.attributes["generator.items"] == 1
+
+
+def test_async_generator_stats(tw):
+    """Async generators record the same stats as generators."""
+
+    @tw.instrument_func(span_name="async_produce")
+    async def async_produce():
+        for i in range(4):
+            await asyncio.sleep(0.01)
+            yield i
+
+    async def main():
+        return [i async for i in async_produce()]
+
+    assert asyncio.run(main()) == [0, 1, 2, 3]
+
+    (span,) = [s for s in exported_spans(tw) if s.name == "async_produce"]
+    assert span.attributes["generator.items"] == 4
+    assert span.attributes["generator.time_in_generator"] >= 0.04
+    assert "generator.time_in_consumer" in span.attributes
+
+
+def test_generator_carrier(tw):
+    """Spans of generators are children of the context of a carrier."""
+    trace_id = "cefb2b8db35d5f3c0dfdf79d5aab1451"
+    carrier = {"traceparent": "00-%s-1f2bb7927f140744-01" % trace_id}
+
+    @tw.instrument_func(span_name="carried_gen", carrier=carrier)
+    def carried_gen():
+        yield 1
+
+    assert list(carried_gen()) == [1]
+
+    (span,) = [s for s in exported_spans(tw) if s.name == "carried_gen"]
+    assert span.context.trace_id == int(trace_id, 16)
+    assert span.parent.span_id == 0x1F2BB7927F140744
+
+
+def test_generator_disabled_after_decoration(monkeypatch, tw):
+    """Generators decorated while tracing is enabled work as usual once it's
+    disabled."""
+
+    @tw.instrument_func()
+    def gen(n):
+        yield from range(n)
+
+    monkeypatch.setenv("OTEL_TRACING", "false")
+    tw._reset()
+
+    assert list(gen(3)) == [0, 1, 2]
@@ -0,0 +1,87 @@
+from pubtools._impl import spanattrs, tracing
+from pubtools._impl.tracing import TracingWrapper
+from pubtools.tracing import get_trace_wrapper
+
+
+def noop(*args, **kwargs):
+    return None
+
+
+def count_serialization(monkeypatch):
+    # Counts calls of the functions serializing arguments into attributes.
+    calls = []
+    for name in ("serialize", "serialize_args", "arg_attributes"):
+        original = getattr(spanattrs, name)
+
+        def counted(*args, _original=original, _name=name, **kwargs):
+            calls.append(_name)
+            return _original(*args, **kwargs)
+
+        monkeypatch.setattr(spanattrs, name, counted)
+    return calls
+
+
+def test_disabled_no_serialization(monkeypatch):
+    """Arguments aren't serialized when calling decorated functions while tracing
+    is disabled. (See benchmarks/ for the cost of such calls.)"""
+    monkeypatch.setenv("OTEL_TRACING", "false")
+    tw = TracingWrapper()
+    calls = count_serialization(monkeypatch)
+
+    wrapped = tw.instrument_func()(noop)
+    wrapped_args = tw.instrument_func(args_to_attr=True)(noop)
+    wrapped_names = tw.instrument_func(args_to_attr=["key"])(noop)
+
+    big = list(range(100000))
+    for func in (wrapped, wrapped_args, wrapped_names):
+        assert func(big, key=big) is None
+
+    assert calls == []
+
+
+def test_disabled_after_decorating(monkeypatch, fake_span_exporter):
+    """Functions decorated while tracing was enabled call the original function
+    directly once tracing is disabled."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    tw = get_trace_wrapper()
+    tw._reset()
+    wrapped = tw.instrument_func(args_to_attr=True)(noop)
+
+    monkeypatch.setenv("OTEL_TRACING", "false")
+    tw._reset()
+    calls = count_serialization(monkeypatch)
+
+    assert wrapped(1, key=2) is None
+    assert calls == []
+
+    # Whereas they are serialized once tracing is enabled again.
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    tw._reset()
+    assert wrapped(1, key=2) is None
+    assert calls == ["serialize_args"]
+    # Don't leave the span for other tests to export.
+    tw.force_flush()
+
+
+def test_disabled_trampoline_preserves_function(monkeypatch):
+    """Decorated functions look like and behave like the original."""
+    monkeypatch.setenv("OTEL_TRACING", "false")
+    tw = TracingWrapper()
+
+    @tw.instrument_func()
+    def add(x, y=1):
+        """Add things."""
+        return x + y
+
+    assert add(1, y=2) == 3
+    assert add.__name__ == "add"
+    assert add.__doc__ == "Add things."
+
+
+def test_unavailable_returns_original(monkeypatch):
+    """Without opentelemetry, functions are not wrapped at all."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    monkeypatch.setattr(tracing, "OPENTELEMETRY_AVAILABLE", False)
+    tw = TracingWrapper()
+
+    assert tw.instrument_func()(noop) is noop
@@ -1,4 +1,6 @@
 import logging
+import os
+import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import pytest
@@ -176,3 +178,114 @@ def test_otel_not_available(caplog, monkeypatch):
         "Tracing is enabled but the open telemetry package is unavailable. "
         "Tracing functionality will be disabled." in caplog.text
     )
+
+
+def test_instrument_func_restores_context(monkeypatch, fake_span_exporter):
+    """No trace context remains attached after calling an instrumented function."""
+    from opentelemetry import context
+
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    carrier = {"traceparent": "00-cefb2b8db35d5f3c0dfdf79d5aab1451-1f2bb7927f140744-01"}
+
+    tw = get_trace_wrapper()
+    tw._reset()
+
+    @tw.instrument_func(carrier=carrier)
+    def foo():
+        assert context.get_current()
+
+    assert not context.get_current()
+    foo()
+    assert not context.get_current()
+
+
+def test_instrument_func_env_untouched(monkeypatch, fake_span_exporter):
+    """Calling an instrumented function doesn't modify the environment."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    monkeypatch.delenv("traceparent", raising=False)
+    tw = get_trace_wrapper()
+    tw._reset()
+
+    @tw.instrument_func()
+    def foo():
+        assert "traceparent" not in os.environ
+
+    foo()
+    assert "traceparent" not in os.environ
+
+
+def test_instrument_func_env_extracted_once(monkeypatch, fake_span_exporter):
+    """Trace context is extracted from the environment only once."""
+    root_trace_id = "cefb2b8db35d5f3c0dfdf79d5aab1451"
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    monkeypatch.setenv("traceparent", f"00-{root_trace_id}-1f2bb7927f140744-01")
+    tw = get_trace_wrapper()
+    tw._reset()
+    tw.force_flush()
+
+    extracted = []
+    real_extract = tracing.propagator.extract
+    monkeypatch.setattr(
+        tracing.propagator,
+        "extract",
+        lambda *args, **kwargs: extracted.append(1) or real_extract(*args, **kwargs),
+    )
+
+    @tw.instrument_func(span_name="root")
+    def foo():
+        pass
+
+    for _ in range(3):
+        foo()
+
+    assert len(extracted) == 1
+    tw.force_flush()
+    spans = tw._processor.span_exporter.get_spans()
+    assert [span.context.trace_id for span in spans] == [int(root_trace_id, 16)] * 3
+
+    # Forked children extract it again. Spans started by their threads don't
+    # become children of the span which was running in the parent's main thread.
+    @tw.instrument_func(span_name="parent")
+    def fork():
+        tracing._forget_env_context()
+        thread = threading.Thread(target=foo)
+        thread.start()
+        thread.join()
+
+    fork()
+    assert len(extracted) == 2
+    tw.force_flush()
+    spans = {span.name: span for span in tw._processor.span_exporter.get_spans()}
+    assert spans["root"].parent.span_id == 0x1F2BB7927F140744
+
+
+def test_inject_env(monkeypatch, fake_span_exporter):
+    """inject_env returns environment variables carrying the current context."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    tw = get_trace_wrapper()
+    tw._reset()
+
+    @tw.instrument_func()
+    def foo():
+        span_context = trace.get_current_span().get_span_context()
+        return span_context, tw.inject_env({"OTHER": "value"})
+
+    span_context, env = foo()
+
+    assert env["OTHER"] == "value"
+    assert env["traceparent"].startswith(
+        "00-%032x-%016x-" % (span_context.trace_id, span_context.span_id)
+    )
+    assert "traceparent" not in os.environ
+
+
+def test_inject_env_disabled(monkeypatch):
+    """inject_env returns a copy of the environment if tracing is disabled."""
+    monkeypatch.setenv("OTEL_TRACING", "false")
+    monkeypatch.setenv("SOME_VAR", "some value")
+    tw = TracingWrapper()
+
+    env = tw.inject_env()
+
+    assert env == dict(os.environ)
+    assert env is not os.environ
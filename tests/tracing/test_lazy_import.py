@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import pubtools.tracing
+
+CHECK = """
+import sys
+from pubtools.metrics import get_metrics_wrapper
+from pubtools.tracing import get_trace_wrapper
+get_metrics_wrapper()
+get_trace_wrapper()
+print("opentelemetry.sdk.trace" in sys.modules)
+print(any(name.startswith("opentelemetry.sdk") for name in sys.modules))
+"""
+
+
+def sdk_imported(tracing):
+    env = dict(os.environ, OTEL_TRACING=tracing, OTEL_SERVICE_NAME="test")
+    return subprocess.check_output(
+        [sys.executable, "-c", CHECK], env=env, universal_newlines=True
+    ).split()
+
+
+def test_sdk_not_imported_when_disabled():
+    """The OTEL SDK isn't imported unless tracing is enabled, not even by
+    pubtools.metrics."""
+    assert sdk_imported("false") == ["False", "False"]
+
+
+def test_sdk_imported_when_enabled():
+    """The OTEL SDK is imported once tracing is enabled."""
+    assert sdk_imported("true") == ["True", "True"]
+
+
+def test_executors_imported_on_use():
+    """Executors are only imported once used."""
+    check = (
+        "import sys, pubtools.tracing;"
+        "print('pubtools._impl.executors' in sys.modules);"
+        "from pubtools.tracing import submit;"
+        "print(submit.__module__)"
+    )
+    assert subprocess.check_output(
+        [sys.executable, "-c", check], universal_newlines=True
+    ).split() == ["False", "pubtools._impl.executors"]
+
+
+def test_unknown_attribute():
+    """Only known attributes are provided."""
+    with pytest.raises(AttributeError):
+        pubtools.tracing.no_such_attribute
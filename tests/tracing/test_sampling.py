@@ -0,0 +1,143 @@
+import pytest
+from opentelemetry.sdk.trace.sampling import ALWAYS_OFF, ALWAYS_ON, Decision
+
+from pubtools._impl import sampling
+from pubtools._impl.sampling import PubtoolsSampler, RateLimiter
+from pubtools.tracing import get_trace_wrapper
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def decision(sampler, name):
+    return sampler.should_sample(None, 0x1234, name).decision
+
+
+def test_rate_limiter(monkeypatch):
+    """Rate limiter allows the configured number of spans per second per name."""
+    clock = FakeClock()
+    monkeypatch.setattr(sampling.time, "monotonic", clock)
+
+    limiter = RateLimiter.parse("busy=2, *=5,")
+    assert limiter.limits == {"busy": 2.0}
+    assert limiter.default == 5.0
+
+    assert [limiter.allow("busy") for _ in range(4)] == [True, True, False, False]
+    assert sum(limiter.allow("other") for _ in range(10)) == 5
+
+    # Half a second later, one more token is available for 'busy'
+    clock.now += 0.5
+    assert [limiter.allow("busy") for _ in range(2)] == [True, False]
+
+
+def test_rate_limiter_unlimited():
+    """Names without a limit are always allowed."""
+    limiter = RateLimiter.parse("busy=1")
+    assert all(limiter.allow("other") for _ in range(100))
+
+
+def test_sampler_overrides_and_limits(monkeypatch):
+    """Sampler applies always-sample overrides and rate limits over the base."""
+    monkeypatch.setattr(sampling.time, "monotonic", FakeClock())
+
+    sampler = PubtoolsSampler(
+        ALWAYS_ON, RateLimiter({"busy": 1}), always_sample=["important"]
+    )
+    assert decision(sampler, "busy") == Decision.RECORD_AND_SAMPLE
+    assert decision(sampler, "busy") == Decision.DROP
+    assert decision(sampler, "other") == Decision.RECORD_AND_SAMPLE
+
+    sampler = PubtoolsSampler(ALWAYS_OFF, always_sample=["important"])
+    assert decision(sampler, "important") == Decision.RECORD_AND_SAMPLE
+    assert decision(sampler, "other") == Decision.DROP
+    assert sampler.get_description() == "PubtoolsSampler{AlwaysOffSampler}"
+
+
+def test_sampler_from_env(monkeypatch):
+    """Sampler is configured from environment variables."""
+    monkeypatch.setenv("OTEL_TRACING_SAMPLE_RATIO", "0")
+    monkeypatch.setenv("OTEL_TRACING_RATE_LIMIT", "10")
+    monkeypatch.setenv("OTEL_TRACING_ALWAYS_SAMPLE", "task, push")
+
+    sampler = PubtoolsSampler.from_env()
+    assert sampler.always_sample == frozenset(["task", "push"])
+    assert sampler.rate_limiter.default == 10.0
+    assert decision(sampler, "anything") == Decision.DROP
+    assert decision(sampler, "push") == Decision.RECORD_AND_SAMPLE
+
+    # A sampler from the hook replaces the ratio-based sampler
+    assert PubtoolsSampler.from_env(ALWAYS_ON).base is ALWAYS_ON
+
+
+@pytest.mark.parametrize("ratio", ["10%", "2", "-1", "nan"])
+def test_sampler_from_env_invalid(monkeypatch, caplog, ratio):
+    """Invalid values are ignored with a warning."""
+    monkeypatch.setenv("OTEL_TRACING_SAMPLE_RATIO", ratio)
+    monkeypatch.setenv("OTEL_TRACING_RATE_LIMIT", "busy=often")
+
+    sampler = PubtoolsSampler.from_env()
+
+    assert decision(sampler, "anything") == Decision.RECORD_AND_SAMPLE
+    assert sampler.rate_limiter is None
+    assert "Ignoring invalid OTEL_TRACING_SAMPLE_RATIO=%r, using 1.0" % ratio in (
+        caplog.text
+    )
+    assert "Ignoring invalid OTEL_TRACING_RATE_LIMIT='busy=often'" in caplog.text
+
+
+@pytest.mark.parametrize("rate_limit", ["-5", "busy=nan", "busy=1,*=-1"])
+def test_rate_limit_invalid(monkeypatch, caplog, rate_limit):
+    """Negative and NaN rate limits are ignored with a warning."""
+    monkeypatch.setenv("OTEL_TRACING_RATE_LIMIT", rate_limit)
+
+    sampler = PubtoolsSampler.from_env()
+
+    assert sampler.rate_limiter is None
+    assert decision(sampler, "busy") == Decision.RECORD_AND_SAMPLE
+    assert (
+        "Ignoring invalid OTEL_TRACING_RATE_LIMIT=%r, using no limit" % rate_limit
+        in caplog.text
+    )
+
+
+def test_sampled_out_cheap_path(monkeypatch, fake_span_exporter):
+    """Calls which are not sampled don't build span attributes."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    tw = get_trace_wrapper()
+    tw._reset()
+    # Discard any spans left over from other tests
+    tw.force_flush()
+
+    monkeypatch.setattr(tw._sampler, "base", ALWAYS_OFF)
+    monkeypatch.setattr(tw._sampler, "always_sample", frozenset(["kept"]))
+
+    stringified = []
+
+    class Arg(object):
+        def __str__(self):
+            stringified.append(self)
+            return "arg"
+
+    @tw.instrument_func(span_name="dropped", args_to_attr=True)
+    def dropped(arg):
+        return 1
+
+    @tw.instrument_func(span_name="kept", args_to_attr=True)
+    def kept(arg):
+        return 2
+
+    assert dropped(Arg()) == 1
+    assert stringified == []
+
+    assert kept(Arg()) == 2
+    assert len(stringified) == 1
+
+    tw.force_flush()
+    spans = tw._processor.span_exporter.get_spans()
+    assert [s.name for s in spans] == ["kept"]
+    assert spans[0].attributes["args"] == "arg"
@@ -0,0 +1,85 @@
+import pytest
+from opentelemetry.sdk.trace.sampling import ALWAYS_OFF
+from opentelemetry.trace.status import StatusCode
+
+from pubtools._impl.tracing import NOOP_AGGREGATOR, TracingWrapper
+
+
+def exported_spans(tw):
+    tw.force_flush()
+    return {span.name: span for span in tw._processor.span_exporter.get_spans()}
+
+
+def test_span(tw):
+    """span() creates a span with attributes, current within the block."""
+
+    @tw.instrument_func(span_name="child")
+    def child():
+        pass
+
+    with tw.span("block", target="prod", count=3):
+        child()
+
+    spans = exported_spans(tw)
+    assert spans["block"].attributes["target"] == "prod"
+    assert spans["block"].attributes["count"] == 3
+    assert spans["child"].parent.span_id == spans["block"].context.span_id
+
+
+def test_span_aggregation(tw):
+    """Timings, values and counters are recorded as attributes of a single span."""
+    with tw.span("push") as agg:
+        for i in range(100):
+            with agg.timer("push_item"):
+                pass
+            agg.record("size", i)
+            agg.incr("items")
+        agg.incr("bytes", 1024)
+
+    spans = exported_spans(tw)
+    assert list(spans) == ["push"]
+    attributes = spans["push"].attributes
+    assert attributes["items"] == 100
+    assert attributes["bytes"] == 1024
+    assert attributes["push_item.count"] == 100
+    assert attributes["push_item.max"] >= attributes["push_item.p50"] >= 0
+    assert attributes["size.count"] == 100
+    assert attributes["size.min"] == 0
+    assert attributes["size.max"] == 99
+    assert sum(attributes["size.bucket_counts"]) == 100
+
+
+def test_span_exception(tw):
+    """Exceptions are recorded on the span, along with aggregated data."""
+    with pytest.raises(ValueError):
+        with tw.span("failing") as agg:
+            agg.incr("attempts")
+            raise ValueError("simulated error")
+
+    span = exported_spans(tw)["failing"]
+    assert span.status.status_code == StatusCode.ERROR
+    assert span.attributes["attempts"] == 1
+
+
+def test_span_not_sampled(tw, monkeypatch):
+    """A no-op aggregator is provided for spans which are not sampled."""
+    monkeypatch.setattr(tw._sampler, "base", ALWAYS_OFF)
+
+    with tw.span("dropped") as agg:
+        assert agg is NOOP_AGGREGATOR
+
+    assert "dropped" not in exported_spans(tw)
+
+
+def test_span_disabled(monkeypatch):
+    """A no-op aggregator is provided when tracing is disabled."""
+    monkeypatch.setenv("OTEL_TRACING", "false")
+    tw = TracingWrapper()
+
+    with tw.span("anything", attr=1) as agg:
+        with agg.timer("t"):
+            agg.record("value", 1)
+            agg.incr("counter")
+
+    assert agg is NOOP_AGGREGATOR
+    assert agg.span is None
@@ -0,0 +1,140 @@
+import pytest
+
+from pubtools._impl import spanattrs
+from pubtools._impl.spanattrs import serialize
+from pubtools.tracing import get_trace_wrapper, register_serializer
+
+
+@pytest.fixture
+def serializers(monkeypatch):
+    """Isolates registered serializers."""
+    monkeypatch.setattr(spanattrs, "_SERIALIZERS", {})
+
+
+def test_serialize_like_str():
+    """Values within limits are serialized like str()."""
+    value = [1, "a", (2,), {"k": None}, ()]
+    assert serialize(value) == str(value)
+    assert serialize("plain") == "plain"
+    assert serialize(42) == "42"
+
+
+def test_serialize_long_string():
+    """Long strings are truncated without copying them whole."""
+    assert serialize("x" * 100, max_length=10) == "xxxxxxxxxx...<90 more chars>"
+
+
+def test_serialize_many_items():
+    """Only a limited number of items are serialized per container."""
+    assert serialize(list(range(100)), max_items=3) == "[0, 1, 2, ...<97 more items>]"
+
+
+def test_serialize_deep():
+    """Containers nested too deeply are replaced with a marker."""
+    assert serialize([[[1, 2]], {"a": {1}}], max_depth=2) == (
+        "[[[...<2 items>]], {'a': {...<1 items>}}]"
+    )
+
+
+def test_serialize_max_length():
+    """Output of many small items is truncated to the maximum length."""
+    result = serialize(["abc"] * 10, max_length=12, max_items=100)
+    assert result == "['abc', 'abc', 'a...<truncated>, ...<7 more items>]"
+
+
+def test_register_serializer(serializers):
+    """Registered serializers apply to a type and its subclasses."""
+
+    class Item(object):
+        def __str__(self):
+            raise AssertionError("should not be called")
+
+    class SubItem(Item):
+        pass
+
+    register_serializer(Item, lambda item: "<item>" * 3)
+
+    assert serialize([Item(), SubItem()]) == "[<item><item><item>, <item><item><item>]"
+    # Output of serializers is still bounded
+    assert serialize(Item(), max_length=8) == "<item><i...<truncated>"
+
+
+def test_args_by_name(monkeypatch, fake_span_exporter):
+    """Selected arguments are recorded by name, whether passed by position or keyword."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    tw = get_trace_wrapper()
+    tw._reset()
+    tw.force_flush()
+
+    @tw.instrument_func(span_name="by_name", args_to_attr=["items", "dest", "opt"])
+    def func(items, dest, ignored=None, opt="default", *, kwonly=None):
+        return len(items)
+
+    assert func(list(range(50)), "somewhere", "x") == 50
+
+    tw.force_flush()
+    spans = tw._processor.span_exporter.get_spans()
+    assert len(spans) == 1
+    attributes = spans[0].attributes
+    assert attributes["args.items"] == (
+        "[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19, "
+        "...<30 more items>]"
+    )
+    assert attributes["args.dest"] == "somewhere"
+    # Not passed, so not recorded
+    assert "args.opt" not in attributes
+    assert "args" not in attributes
+
+    assert func([], dest="kw", opt=1) == 0
+    tw.force_flush()
+    attributes = tw._processor.span_exporter.get_spans()[0].attributes
+    assert attributes["args.items"] == "[]"
+    assert attributes["args.dest"] == "kw"
+    assert attributes["args.opt"] == "1"
+
+
+def test_args_to_attr_bounded(monkeypatch, fake_span_exporter):
+    """args_to_attr=True records bounded args and kwargs."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    monkeypatch.setenv("OTEL_TRACING_ATTR_MAX_LENGTH", "20")
+    # Limits are read from the environment by _reset, restore them afterwards.
+    monkeypatch.setattr(spanattrs, "MAX_LENGTH", spanattrs.MAX_LENGTH)
+    tw = get_trace_wrapper()
+    tw._reset()
+    tw.force_flush()
+
+    @tw.instrument_func(span_name="bounded", args_to_attr=True)
+    def func(*args, **kwargs):
+        pass
+
+    func("a" * 1000, "b", "c", key="d" * 1000, other=1)
+
+    tw.force_flush()
+    attributes = tw._processor.span_exporter.get_spans()[0].attributes
+    assert attributes["args"] == "a" * 20 + "...<980 more chars>, ...<2 more>"
+    assert (
+        attributes["kwargs"] == "key=" + "d" * 20 + "...<980 more chars>, ...<1 more>"
+    )
+
+
+def test_limits_invalid(monkeypatch, caplog):
+    """Invalid limits are ignored with a warning."""
+    monkeypatch.setenv("OTEL_TRACING_ATTR_MAX_LENGTH", "1k")
+    monkeypatch.setenv("OTEL_TRACING_ATTR_MAX_DEPTH", "-1")
+    monkeypatch.setenv("OTEL_TRACING_ATTR_MAX_ITEMS", "5")
+    for name in ("MAX_LENGTH", "MAX_DEPTH", "MAX_ITEMS"):
+        monkeypatch.setattr(spanattrs, name, getattr(spanattrs, name))
+
+    spanattrs.configure()
+
+    assert (spanattrs.MAX_LENGTH, spanattrs.MAX_DEPTH, spanattrs.MAX_ITEMS) == (
+        1024,
+        3,
+        5,
+    )
+    assert "Ignoring invalid OTEL_TRACING_ATTR_MAX_LENGTH='1k'" in caplog.text
+
+
+def test_truncated_dict_key():
+    """Nothing more is written once a dict key is truncated."""
+    assert serialize({"a" * 30: "b"}, max_length=10) == "{'aaaaaaaaa...<truncated>: }"
@@ -0,0 +1,310 @@
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from opentelemetry import baggage, context, trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    SimpleSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from pubtools._impl import spanrecord, spool
+from pubtools._impl.spool import Shipper, SpoolExporter
+from pubtools._impl.tracing import TracingWrapper
+from pubtools.pluggy import pm
+
+
+class RecordingExporter(SpanExporter):
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.spans = []
+        self.shipped = threading.Event()
+        self.shut_down = False
+
+    def export(self, spans):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("simulated error")
+        self.spans.extend(spans)
+        self.shipped.set()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self.shut_down = True
+
+
+def make_spans(*names):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer("test-scope", "1.0")
+
+    token = context.attach(baggage.set_baggage("k", "v"))
+    try:
+        with tracer.start_as_current_span("root", attributes={"list": [1, 2]}) as root:
+            root.add_event("happened", {"detail": "yes"})
+            for name in names:
+                with tracer.start_as_current_span(
+                    name, links=[trace.Link(root.get_span_context(), {"l": 1})]
+                ):
+                    pass
+            root.set_status(trace.Status(trace.StatusCode.ERROR, "oops"))
+    finally:
+        context.detach(token)
+    return list(exporter.get_finished_spans())
+
+
+def test_span_record_roundtrip():
+    """Spans survive encoding into records and decoding again."""
+    spans = make_spans("a", "b")
+
+    data = spanrecord.dump_spans(spans)
+    loaded = spanrecord.load_spans(io.BytesIO(data))
+
+    assert [spanrecord.encode_span(s) for s in loaded] == [
+        spanrecord.encode_span(s) for s in spans
+    ]
+    root = loaded[-1]
+    assert root.name == "root"
+    assert root.parent is None
+    assert root.status.status_code == trace.StatusCode.ERROR
+    assert root.events[0].attributes["detail"] == "yes"
+    assert loaded[0].parent.span_id == root.context.span_id
+    assert loaded[0].links[0].context.span_id == root.context.span_id
+    assert loaded[0].instrumentation_scope.name == "test-scope"
+
+
+def test_span_record_truncated():
+    """A partially written record at the end is ignored."""
+    data = spanrecord.dump_spans(make_spans("a"))
+    first_length = int.from_bytes(data[:4], "big") + 4
+
+    assert len(spanrecord.load_spans(io.BytesIO(data[:-3]))) == 1
+    assert len(spanrecord.load_spans(io.BytesIO(data[: first_length + 2]))) == 1
+
+
+def test_spool_ships(tmp_path):
+    """Exported spans are written to the spool and shipped in the background."""
+    downstream = RecordingExporter()
+    exporter = SpoolExporter(str(tmp_path / "spool"), downstream)
+
+    assert exporter.export(make_spans("a")) is SpanExportResult.SUCCESS
+    assert exporter.force_flush()
+
+    assert downstream.shipped.wait(10)
+    assert [s.name for s in downstream.spans] == ["a", "root"]
+
+    exporter.shutdown()
+    assert downstream.shut_down
+
+
+def test_spool_retries(tmp_path):
+    """Shipping is retried after a failure."""
+    downstream = RecordingExporter(failures=2)
+    exporter = SpoolExporter(
+        str(tmp_path), downstream, min_backoff=0.01, max_backoff=0.02
+    )
+
+    exporter.export(make_spans("a"))
+
+    assert downstream.shipped.wait(10)
+    assert [s.name for s in downstream.spans] == ["a", "root"]
+    exporter.shutdown()
+
+
+def test_spool_max_bytes(tmp_path, caplog):
+    """Oldest segments are dropped once the spool is too large."""
+    downstream = RecordingExporter()
+    segment_size = len(spanrecord.dump_spans(make_spans("one")))
+    exporter = SpoolExporter(str(tmp_path), downstream, max_bytes=segment_size * 2)
+    # Keep the shipper from shipping anything
+    exporter._shipper = Shipper(str(tmp_path), downstream)
+    exporter._shipper.is_alive = lambda: True
+
+    for name in ["one", "two", "six"]:
+        exporter.export(make_spans(name))
+
+    remaining = spool.segments(str(tmp_path))
+    assert len(remaining) == 2
+    assert "Span spool is full" in caplog.text
+
+    exporter._shipper.ship_pending()
+    names = [s.name for s in downstream.spans if s.name != "root"]
+    assert names == ["two", "six"]
+
+
+def test_spool_max_bytes_races(tmp_path, monkeypatch):
+    """Segments shipped while the spool's size is enforced are skipped."""
+    exporter = SpoolExporter(str(tmp_path), RecordingExporter(), max_bytes=0)
+    for name in ["0001", "0002"]:
+        (tmp_path / (name + ".spans")).write_bytes(b"data")
+
+    def getsize(path):
+        if path.endswith("0001.spans"):
+            raise FileNotFoundError(path)
+        return 4
+
+    def unlink(path):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os.path, "getsize", getsize)
+    monkeypatch.setattr(os, "unlink", unlink)
+
+    exporter._enforce_limit()
+
+    assert len(spool.segments(str(tmp_path))) == 2
+
+
+def test_spool_shutdown_waits(tmp_path):
+    """Shutdown waits for a segment being shipped before shutting down the
+    exporter."""
+    events = []
+
+    class SlowExporter(RecordingExporter):
+        def export(self, spans):
+            self.shipped.set()
+            time.sleep(0.1)
+            events.append("exported")
+            return SpanExportResult.SUCCESS
+
+        def shutdown(self):
+            events.append("shutdown")
+
+    downstream = SlowExporter()
+    exporter = SpoolExporter(str(tmp_path), downstream)
+    exporter.export(make_spans("a"))
+    assert downstream.shipped.wait(10)
+
+    exporter.shutdown()
+
+    assert events == ["exported", "shutdown"]
+
+
+def test_spool_shutdown_timeout(tmp_path, monkeypatch, caplog):
+    """Shutdown doesn't wait for a hanging export forever."""
+    monkeypatch.setattr(spool, "SHUTDOWN_TIMEOUT", 0.05)
+    release = threading.Event()
+
+    class HangingExporter(RecordingExporter):
+        def export(self, spans):
+            self.shipped.set()
+            release.wait(10)
+            return SpanExportResult.SUCCESS
+
+    downstream = HangingExporter()
+    exporter = SpoolExporter(str(tmp_path), downstream)
+    exporter.export(make_spans("a"))
+    assert downstream.shipped.wait(10)
+
+    try:
+        exporter.shutdown()
+        assert downstream.shut_down
+        assert "Span shipper did not stop within 0.05 seconds" in caplog.text
+    finally:
+        release.set()
+        exporter._shipper.join(10)
+
+
+def test_spool_write_failure(tmp_path, caplog):
+    """Spans which can't be written to the spool are reported as failed."""
+    exporter = SpoolExporter(str(tmp_path / "spool"), RecordingExporter())
+    os.rmdir(str(tmp_path / "spool"))
+
+    assert exporter.export(make_spans("a")) is SpanExportResult.FAILURE
+    assert "Failed to write spans to spool" in caplog.text
+
+
+def test_shipper_unreadable_segment(tmp_path, caplog):
+    """Segments which can't be read are dropped."""
+    (tmp_path / "0001.spans").write_bytes(b"\x00\x00\x00\x02{]")
+    downstream = RecordingExporter()
+
+    assert Shipper(str(tmp_path), downstream).ship_pending()
+
+    assert spool.segments(str(tmp_path)) == []
+    assert "Dropping unreadable span segment" in caplog.text
+
+
+def test_shipper_stopped(tmp_path):
+    """A stopped shipper ships nothing more."""
+    (tmp_path / "0001.spans").write_bytes(spanrecord.dump_spans(make_spans("a")))
+    downstream = RecordingExporter()
+    shipper = Shipper(str(tmp_path), downstream)
+
+    shipper.stop()
+
+    assert shipper.ship_pending()
+    assert downstream.spans == []
+    assert len(spool.segments(str(tmp_path))) == 1
+
+
+def test_shipper_recovers_claimed(tmp_path):
+    """Segments claimed by processes which no longer exist are shipped."""
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    (tmp_path / ("0001.spans.shipping-%s" % proc.pid)).write_bytes(
+        spanrecord.dump_spans(make_spans("orphan"))
+    )
+    # Claimed by this process, which is alive
+    (tmp_path / ("0002.spans.shipping-%s" % os.getpid())).write_bytes(b"")
+
+    shipper = Shipper(str(tmp_path), RecordingExporter())
+    shipper.recover()
+
+    assert spool.segments(str(tmp_path)) == [str(tmp_path / "0001.spans")]
+
+
+def test_shipper_missing_directory(tmp_path):
+    """A shipper copes with a missing spool directory."""
+    shipper = Shipper(str(tmp_path / "missing"), RecordingExporter())
+    shipper.recover()
+    assert shipper.ship_pending()
+
+
+def test_shipper_claimed_by_other(tmp_path, monkeypatch):
+    """Segments claimed by another process in the meantime are skipped."""
+    (tmp_path / "0001.spans").write_bytes(b"")
+    downstream = RecordingExporter()
+
+    def rename(src, dst):
+        raise FileNotFoundError(src)
+
+    monkeypatch.setattr(spool.os, "rename", rename)
+    assert Shipper(str(tmp_path), downstream).ship_pending()
+    assert downstream.spans == []
+
+
+def test_tracing_wrapper_spool(monkeypatch, tmp_path):
+    """TracingWrapper exports to the spool when configured."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    monkeypatch.setenv("OTEL_TRACING_SPOOL_DIR", str(tmp_path))
+    monkeypatch.setenv("OTEL_TRACING_SPOOL_MAX_BYTES", "1000")
+
+    tw = TracingWrapper()
+    try:
+        exporter = tw._processor.span_exporter
+        assert isinstance(exporter, SpoolExporter)
+        assert exporter.directory == str(tmp_path)
+        assert exporter.max_bytes == 1000
+    finally:
+        pm.unregister(tw)
+        tw._provider.shutdown()
+
+
+def test_spool_from_env_invalid(monkeypatch, tmp_path, caplog):
+    """An invalid size limit is ignored with a warning."""
+    monkeypatch.setenv("OTEL_TRACING_SPOOL_DIR", str(tmp_path))
+    monkeypatch.setenv("OTEL_TRACING_SPOOL_MAX_BYTES", "100MiB")
+
+    exporter = SpoolExporter.from_env(RecordingExporter())
+
+    assert exporter.max_bytes == spool.DEFAULT_MAX_BYTES
+    assert "Ignoring invalid OTEL_TRACING_SPOOL_MAX_BYTES='100MiB'" in caplog.text
@@ -0,0 +1,220 @@
+import threading
+
+import pytest
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+
+from pubtools._impl import tailsampling
+from pubtools._impl.tailsampling import TailSamplingProcessor
+from pubtools._impl.tracing import TracingWrapper
+from pubtools.pluggy import pm, task_context
+
+
+class RecordingProcessor(SpanProcessor):
+    def __init__(self):
+        self.spans = []
+
+    def on_end(self, span):
+        self.spans.append(span.name)
+
+
+@pytest.fixture
+def downstream():
+    return RecordingProcessor()
+
+
+@pytest.fixture
+def make_processor(downstream):
+    registered = []
+
+    def make(**kwargs):
+        processor = TailSamplingProcessor(downstream, **kwargs)
+        pm.register(processor)
+        registered.append(processor)
+        tracer_provider = TracerProvider()
+        tracer_provider.add_span_processor(processor)
+        return processor, tracer_provider.get_tracer(__name__)
+
+    yield make
+
+    for processor in registered:
+        pm.unregister(processor)
+
+
+def run_task(tracer, names, fail=False):
+    try:
+        with task_context():
+            for name in names:
+                with tracer.start_as_current_span(name):
+                    pass
+            if fail:
+                raise RuntimeError("simulated error")
+    except RuntimeError:
+        pass
+
+
+def test_drops_successful_tasks(make_processor, downstream):
+    """Spans of successful, fast tasks are dropped when not sampled."""
+    _, tracer = make_processor(sample_ratio=0.0)
+
+    run_task(tracer, ["a", "b"])
+
+    assert downstream.spans == []
+
+
+def test_exports_failed_tasks(make_processor, downstream):
+    """All spans of a failed task are exported."""
+    _, tracer = make_processor(sample_ratio=0.0)
+
+    run_task(tracer, ["ok"])
+    run_task(tracer, ["a", "b"], fail=True)
+
+    assert downstream.spans == ["a", "b"]
+
+
+def test_exports_slow_tasks(make_processor, downstream):
+    """All spans of a slow task are exported."""
+    _, tracer = make_processor(sample_ratio=0.0, slow_seconds=0.0)
+
+    run_task(tracer, ["a", "b"])
+
+    assert downstream.spans == ["a", "b"]
+
+
+def test_exports_sampled_tasks(make_processor, downstream):
+    """Spans of successful tasks are exported if the task is sampled."""
+    _, tracer = make_processor(sample_ratio=1.0)
+
+    run_task(tracer, ["a", "b"])
+
+    assert downstream.spans == ["a", "b"]
+
+
+def test_passes_through_outside_task(make_processor, downstream):
+    """Spans ended outside of any task are exported immediately."""
+    _, tracer = make_processor(sample_ratio=0.0)
+
+    with tracer.start_as_current_span("outside"):
+        pass
+
+    assert downstream.spans == ["outside"]
+
+
+def test_nested_tasks(make_processor, downstream):
+    """A failure in a nested task keeps the spans of the outermost task."""
+    _, tracer = make_processor(sample_ratio=0.0)
+
+    with task_context():
+        with tracer.start_as_current_span("outer"):
+            pass
+        run_task(tracer, ["inner"], fail=True)
+        # Nothing decided yet
+        assert downstream.spans == []
+
+    assert downstream.spans == ["outer", "inner"]
+
+
+def test_concurrent_tasks(make_processor, downstream):
+    """Spans of tasks running concurrently are decided on per task."""
+    _, tracer = make_processor(sample_ratio=0.0)
+    barrier = threading.Barrier(2, timeout=10)
+
+    def run(name, fail):
+        try:
+            with task_context():
+                with tracer.start_as_current_span(name):
+                    barrier.wait()
+                # Both tasks have ended a span before either stops.
+                barrier.wait()
+                if fail:
+                    raise RuntimeError("simulated error")
+        except RuntimeError:
+            pass
+
+    threads = [
+        threading.Thread(target=run, args=args)
+        for args in [("succeeded", False), ("failed", True)]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert downstream.spans == ["failed"]
+
+
+def test_buffer_overflow(make_processor, downstream, caplog):
+    """Oldest spans are dropped when the buffer is full."""
+    _, tracer = make_processor(sample_ratio=0.0, buffer_size=2)
+
+    run_task(tracer, ["a", "b", "c"], fail=True)
+
+    assert downstream.spans == ["b", "c"]
+    assert "Tail sampling buffer overflowed, 1 spans were dropped" in caplog.text
+
+
+def test_from_env(monkeypatch, downstream):
+    """Processor is configured from environment variables."""
+    monkeypatch.setenv("OTEL_TRACING_TAIL_SAMPLE_RATIO", "0.5")
+    monkeypatch.setenv("OTEL_TRACING_TAIL_SLOW_SECONDS", "30")
+    monkeypatch.setenv("OTEL_TRACING_TAIL_BUFFER_SIZE", "100")
+
+    processor = TailSamplingProcessor.from_env(downstream)
+
+    assert processor.downstream is downstream
+    assert processor.sample_ratio == 0.5
+    assert processor.slow_seconds == 30.0
+    assert processor.buffer_size == 100
+
+
+def test_from_env_invalid(monkeypatch, downstream, caplog):
+    """Invalid values are ignored with a warning."""
+    monkeypatch.setenv("OTEL_TRACING_TAIL_SAMPLE_RATIO", "1.5")
+    monkeypatch.setenv("OTEL_TRACING_TAIL_SLOW_SECONDS", "30s")
+    monkeypatch.setenv("OTEL_TRACING_TAIL_BUFFER_SIZE", "1e4")
+
+    processor = TailSamplingProcessor.from_env(downstream)
+
+    assert processor.sample_ratio == 0.1
+    assert processor.slow_seconds is None
+    assert processor.buffer_size == 10000
+    assert "Ignoring invalid OTEL_TRACING_TAIL_BUFFER_SIZE='1e4'" in caplog.text
+
+
+def test_wrapper_uses_tail_sampling(monkeypatch):
+    """TracingWrapper routes spans through the tail sampler when enabled."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    monkeypatch.setenv("OTEL_TRACING_TAIL_SAMPLING", "true")
+    assert tailsampling.enabled()
+
+    tw = TracingWrapper()
+    try:
+        assert tw._tail_processor.downstream is tw._processor
+        assert pm.is_registered(tw._tail_processor)
+    finally:
+        pm.unregister(tw)
+        pm.unregister(tw._tail_processor)
+        tw._provider.shutdown()
+
+
+def test_stop_without_start(downstream):
+    """A task_stop without a matching task_start is ignored."""
+    processor = TailSamplingProcessor(downstream)
+
+    processor.task_stop(failed=True)
+
+    assert downstream.spans == []
+
+
+def test_delegates_to_downstream(downstream, monkeypatch):
+    """Flush and shutdown are delegated to the downstream processor."""
+    calls = []
+    monkeypatch.setattr(
+        downstream, "force_flush", lambda timeout: calls.append(timeout) or True
+    )
+    monkeypatch.setattr(downstream, "shutdown", lambda: calls.append("shutdown"))
+    processor = TailSamplingProcessor(downstream)
+
+    assert processor.force_flush(1000)
+    processor.shutdown()
+
+    assert calls == [1000, "shutdown"]
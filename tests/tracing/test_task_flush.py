@@ -0,0 +1,94 @@
+from pubtools._impl.tracing import TracingWrapper
+from pubtools.pluggy import pm, task_context
+
+
+def test_flush_at_task_stop(tw):
+    """Spans are flushed when a task stops."""
+    assert pm.is_registered(tw)
+
+    with task_context():
+        with tw.span("in-task"):
+            pass
+
+    # Not flushed explicitly, but exported
+    spans = tw._processor.span_exporter.get_spans()
+    assert [span.name for span in spans] == ["in-task"]
+
+
+def test_flush_timeout_at_task_stop(tw, monkeypatch, caplog):
+    """Spans which can't be flushed in time are dropped and reported."""
+    monkeypatch.setenv("OTEL_TRACING_FLUSH_TIMEOUT", "0.01")
+    processor = tw._processor
+    dropped = processor.dropped
+    # Simulate an export which is taking too long
+    lock = processor._export_lock
+
+    with lock:
+        with task_context():
+            with tw.span("in-task"):
+                pass
+
+    assert (
+        "Flushing trace data timed out after 0.01 seconds, "
+        "1 queued spans were dropped" in caplog.text
+    )
+    assert processor.dropped == dropped + 1
+    assert processor.queued == 0
+    # The next task can export again
+    assert processor._export_lock is not lock
+    with task_context():
+        with tw.span("next-task"):
+            pass
+    spans = tw._processor.span_exporter.get_spans()
+    assert [span.name for span in spans] == ["next-task"]
+
+
+def test_flush_timeout_concurrent_tasks(tw, monkeypatch, caplog):
+    """Spans aren't dropped when a flush times out while other tasks run."""
+    monkeypatch.setenv("OTEL_TRACING_FLUSH_TIMEOUT", "0.01")
+    processor = tw._processor
+    dropped = processor.dropped
+    lock = processor._export_lock
+
+    with task_context():
+        with lock:
+            with tw.span("other-task"):
+                pass
+            with task_context():
+                with tw.span("in-task"):
+                    pass
+
+        assert "Flushing trace data timed out after 0.01 seconds" in caplog.text
+        assert "dropped" not in caplog.text
+        assert processor.dropped == dropped
+        assert processor.queued == 2
+        # The stuck worker was replaced all the same
+        assert processor._export_lock is not lock
+
+    spans = tw._processor.span_exporter.get_spans()
+    assert [span.name for span in spans] == ["other-task", "in-task"]
+
+
+def test_flush_timeout_invalid(tw, monkeypatch, caplog):
+    """An invalid flush timeout is ignored with a warning."""
+    monkeypatch.setenv("OTEL_TRACING_FLUSH_TIMEOUT", "30s")
+
+    with task_context():
+        with tw.span("in-task"):
+            pass
+
+    assert "Ignoring invalid OTEL_TRACING_FLUSH_TIMEOUT='30s'" in caplog.text
+    spans = tw._processor.span_exporter.get_spans()
+    assert [span.name for span in spans] == ["in-task"]
+
+
+def test_task_hooks_disabled(monkeypatch):
+    """Task hooks do nothing when tracing is disabled."""
+    monkeypatch.setenv("OTEL_TRACING", "false")
+    tw = TracingWrapper()
+
+    tw.task_start()
+    tw.task_stop(failed=False)
+
+    assert tw.force_flush()
+    assert not pm.is_registered(tw)
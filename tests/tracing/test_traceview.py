@@ -0,0 +1,220 @@
+import io
+import os
+
+import pytest
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+
+from pubtools._impl import traceview
+from pubtools._impl.tracefile import FileSpanExporter, TeeSpanExporter
+from pubtools._impl.tracing import TracingWrapper
+from pubtools.pluggy import pm, task_context
+
+MS = 1000000
+
+
+@pytest.fixture
+def trace_dir(tmp_path):
+    """Writes a task's trace file and returns its directory.
+
+    The trace looks like this (times in ms):
+
+        task           0 - 100
+          resolve      0 - 10
+          push        10 - 90
+            item      10 - 50
+            item      20 - 60    (concurrent with the previous item)
+            publish   65 - 90
+          report      50 - 85    (concurrent with push, not on the critical path)
+    """
+    directory = str(tmp_path / "traces")
+    exporter = FileSpanExporter(directory)
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer(__name__)
+
+    def span(name, start, end, parent=None):
+        ctx = trace.set_span_in_context(parent) if parent else None
+        result = tracer.start_span(name, context=ctx, start_time=start * MS)
+        return result, end * MS
+
+    task, task_end = span("task", 0, 100)
+    push, push_end = span("push", 10, 90, task)
+    for child in [
+        span("resolve", 0, 10, task),
+        span("item", 10, 50, push),
+        span("item", 20, 60, push),
+        span("publish", 65, 90, push),
+        span("report", 50, 85, task),
+        (push, push_end),
+        (task, task_end),
+    ]:
+        child[0].end(end_time=child[1])
+
+    return directory
+
+
+def run(*args):
+    out = io.StringIO()
+    traceview.entry_point(list(args), out=out)
+    return out.getvalue().splitlines()
+
+
+def test_critical_path(trace_dir):
+    """Critical path follows the children which finished last."""
+    lines = run("critical-path", trace_dir)
+
+    assert lines[0].endswith("(100.0 ms)")
+    assert [line.split("self")[1].rstrip() for line in lines[1:]] == [
+        "  task",
+        "    resolve",
+        "    push",
+        "      item",
+        "      publish",
+    ]
+
+
+def test_self_time(trace_dir):
+    """Self time excludes children, counting concurrent children once."""
+    lines = run("self-time", trace_dir)
+
+    rows = {line.split()[-1]: line.split()[:3] for line in lines[1:]}
+    assert rows["item"] == ["2", "80.0", "80.0"]
+    # 80 ms, of which 75 ms are covered by (concurrent) children
+    assert rows["push"] == ["1", "80.0", "5.0"]
+    # 100 ms, of which 90 ms are covered by children
+    assert rows["task"] == ["1", "100.0", "10.0"]
+    # Sorted by self time
+    assert lines[1].split()[-1] == "item"
+
+
+def test_collapsed(trace_dir):
+    """Collapsed stacks are aggregated per stack, in microseconds."""
+    lines = run("collapsed", trace_dir)
+
+    assert lines == [
+        "task 10000",
+        "task;push 5000",
+        "task;push;item 80000",
+        "task;push;publish 25000",
+        "task;report 35000",
+        "task;resolve 10000",
+    ]
+
+
+def test_top(trace_dir):
+    """Top lists the slowest spans."""
+    lines = run("top", "-n", "3", os.path.join(trace_dir, os.listdir(trace_dir)[0]))
+
+    assert [line.split()[-1] for line in lines[1:]] == ["task", "push", "item"]
+    assert lines[1].split()[0] == "100.0"
+
+
+def test_file_per_task(tmp_path):
+    """A new trace file is started for each task."""
+    directory = str(tmp_path / "traces")
+    exporter = FileSpanExporter(directory)
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer(__name__)
+
+    pm.register(exporter)
+    try:
+        for name in ["first", "second"]:
+            with task_context():
+                with tracer.start_as_current_span(name):
+                    pass
+    finally:
+        pm.unregister(exporter)
+
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+    assert len(paths) == 2
+    assert [line.split()[-1] for line in run("top", paths[0])[1:]] == ["first"]
+    assert [line.split()[-1] for line in run("top", paths[1])[1:]] == ["second"]
+    assert exporter.force_flush()
+
+
+def test_file_overlapping_tasks(tmp_path):
+    """Overlapping tasks share a file, rather than splitting each other's."""
+    directory = str(tmp_path / "traces")
+    exporter = FileSpanExporter(directory)
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer(__name__)
+
+    pm.register(exporter)
+    try:
+        with task_context():
+            with tracer.start_as_current_span("outer"):
+                with task_context():
+                    with tracer.start_as_current_span("inner"):
+                        pass
+        with task_context():
+            with tracer.start_as_current_span("next"):
+                pass
+    finally:
+        pm.unregister(exporter)
+
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+    assert len(paths) == 2
+    assert sorted(line.split()[-1] for line in run("top", paths[0])[1:]) == [
+        "inner",
+        "outer",
+    ]
+    assert [line.split()[-1] for line in run("top", paths[1])[1:]] == ["next"]
+
+
+def test_file_write_failure(tmp_path, caplog):
+    """Spans which can't be written are reported as failed."""
+    exporter = FileSpanExporter(str(tmp_path / "traces"))
+    os.rmdir(str(tmp_path / "traces"))
+
+    assert exporter.export([]).name == "FAILURE"
+    assert "Failed to write spans" in caplog.text
+
+
+def test_tee_exporter(tmp_path):
+    """The tee exporter passes spans to all exporters."""
+    first = FileSpanExporter(str(tmp_path / "first"))
+    second = FileSpanExporter(str(tmp_path / "second"))
+    tee = TeeSpanExporter([first, second])
+
+    assert tee.export([]).name == "SUCCESS"
+    assert tee.force_flush()
+    os.remove(first.path)
+    os.rmdir(str(tmp_path / "first"))
+    assert tee.export([]).name == "FAILURE"
+    tee.shutdown()
+
+
+def test_tracing_wrapper_file(monkeypatch, tmp_path, fake_span_exporter):
+    """TracingWrapper writes trace files in addition to the usual exporter."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    monkeypatch.setenv("OTEL_TRACING_FILE_DIR", str(tmp_path))
+
+    tw = TracingWrapper()
+    try:
+        exporter = tw._processor.span_exporter
+        assert isinstance(exporter, TeeSpanExporter)
+        assert exporter.exporters[0].directory == str(tmp_path)
+        assert pm.is_registered(exporter.exporters[0])
+    finally:
+        pm.unregister(tw)
+        pm.unregister(exporter.exporters[0])
+        tw._provider.shutdown()
+
+
+def test_tracing_wrapper_file_only(monkeypatch, tmp_path):
+    """Without an exporter from hooks, only trace files are written."""
+    monkeypatch.setenv("OTEL_TRACING", "true")
+    monkeypatch.setenv("OTEL_TRACING_FILE_DIR", str(tmp_path))
+
+    tw = TracingWrapper()
+    try:
+        exporter = tw._processor.span_exporter
+        assert isinstance(exporter, FileSpanExporter)
+    finally:
+        pm.unregister(tw)
+        pm.unregister(exporter)
+        tw._provider.shutdown()